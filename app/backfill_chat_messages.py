@@ -0,0 +1,56 @@
+# chat_logs 테이블의 세션 로그 원문을 chat_messages 테이블로 옮기는 일괄 변환 도구
+# 이미 메시지가 있는 세션은 건너뛰므로 중간에 멈춰도 다시 실행하면 이어서 처리된다.
+# cd app && python backfill_chat_messages.py --batch-size 500
+import argparse
+import time
+
+from sqlalchemy import exists, insert, select
+
+from database import SessionLocal, ChatLog, ChatMessage
+from transcript import parse_log_messages
+from log_codec import decode_log
+
+
+def backfill(batch_size: int = 500, dry_run: bool = False) -> dict:
+    stats = {"sessions": 0, "messages": 0, "empty_sessions": 0}
+    last_session_id = ""
+    started = time.perf_counter()
+
+    while True:
+        with SessionLocal() as db:
+            # session_id 키셋으로 아직 메시지가 없는 세션 로그를 batch_size개씩 조회
+            logs = db.execute(
+                select(ChatLog.session_id, ChatLog.chat_id, ChatLog.log).where(
+                    ChatLog.session_id > last_session_id,
+                    ~exists().where(ChatMessage.session_id == ChatLog.session_id),
+                ).order_by(ChatLog.session_id).limit(batch_size)
+            ).all()
+            if not logs:
+                break
+
+            rows = []
+            for session_id, chat_id, log in logs:
+                messages = parse_log_messages(decode_log(log))
+                if not messages:
+                    stats["empty_sessions"] += 1
+                rows.extend({"chat_id": chat_id, "session_id": session_id, **message} for message in messages)
+
+            if rows and not dry_run:
+                db.execute(insert(ChatMessage), rows)  # 다중 행 INSERT
+                db.commit()
+
+            stats["sessions"] += len(logs)
+            stats["messages"] += len(rows)
+            last_session_id = logs[-1][0]
+            print(f"Backfilled {stats['sessions']} sessions / {stats['messages']} messages (last session: {last_session_id})")
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="chat_logs 원문을 chat_messages 테이블로 변환합니다.")
+    parser.add_argument("--batch-size", type=int, default=500, help="한 번에 변환할 세션 수")
+    parser.add_argument("--dry-run", action="store_true", help="DB에 쓰지 않고 변환 결과만 집계")
+    args = parser.parse_args()
+    print(backfill(batch_size=args.batch_size, dry_run=args.dry_run))
@@ -0,0 +1,126 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from database import AsyncSessionLocal, Character, CharacterPrompt, ChatRoom, GroupChat, GroupChatCharacter, User
+
+
+# 캐릭터 프롬프트(char_prompts) + 캐릭터(characters) 정보 - 여러 방이 공유
+class CharacterProfile:
+    def __init__(self, char_prompt_id: int, character_name: str, nicknames: dict, appearance: str, personality: str,
+                 background: str, speech_style: str, example_dialogues: List[str]):
+        self.char_prompt_id = char_prompt_id
+        self.character_name = character_name
+        self.nicknames = nicknames or {}
+        self.appearance = appearance
+        self.personality = personality
+        self.background = background
+        self.speech_style = speech_style
+        self.example_dialogues = example_dialogues or []
+
+
+# 채팅방(chat_rooms)별 사용자 정보와 현재 호감도
+class RoomContext:
+    def __init__(self, room_id: str, char_prompt_id: int, user_unique_name: Optional[str],
+                 user_introduction: Optional[str], favorability: int):
+        self.room_id = room_id
+        self.char_prompt_id = char_prompt_id
+        self.user_unique_name = user_unique_name
+        self.user_introduction = user_introduction
+        self.favorability = favorability  # 매 턴 응답 후 갱신 (클라이언트가 보내지 않아도 됨)
+
+
+# 그룹 채팅방(group_chats) 정보와 참여 캐릭터의 프롬프트 ID (그룹에 추가된 순서)
+class GroupContext:
+    def __init__(self, group_chat_idx: int, user_unique_name: Optional[str], chat_title: Optional[str],
+                 chat_prompt: Optional[str], char_prompt_ids: List[int]):
+        self.group_chat_idx = group_chat_idx
+        self.user_unique_name = user_unique_name
+        self.chat_title = chat_title
+        self.chat_prompt = chat_prompt
+        self.char_prompt_ids = char_prompt_ids
+
+
+# char_prompt_id별 캐릭터 프로필 캐시
+# 프로필이 수정되면 invalidate()로 비우고, 놓친 수정에 대비해 TTL이 지나면 다시 읽는다.
+class CharacterProfileCache:
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self.profiles: Dict[int, Tuple[float, CharacterProfile]] = {}  # char_prompt_id -> (로드 시각, 프로필)
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, char_prompt_id: int) -> Optional[CharacterProfile]:
+        cached = self.profiles.get(char_prompt_id)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl_seconds:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        profile = await load_character_profile(char_prompt_id)
+        if profile is not None:
+            self.profiles[char_prompt_id] = (time.monotonic(), profile)
+        return profile
+
+    def invalidate(self, char_prompt_id: int):
+        self.profiles.pop(char_prompt_id, None)
+
+
+async def load_character_profile(char_prompt_id: int) -> Optional[CharacterProfile]:
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(CharacterPrompt, Character).join(
+                Character, Character.char_idx == CharacterPrompt.char_idx
+            ).where(CharacterPrompt.char_prompt_id == char_prompt_id)
+        )).first()
+    if row is None:
+        return None
+    prompt, character = row
+    return CharacterProfile(
+        char_prompt_id=prompt.char_prompt_id,
+        character_name=character.char_name,
+        nicknames=character.nicknames,
+        appearance=prompt.character_appearance,
+        personality=prompt.character_personality,
+        background=prompt.character_background,
+        speech_style=prompt.character_speech_style,
+        example_dialogues=prompt.example_dialogues,
+    )
+
+
+async def load_room_context(room_id: str) -> Optional[RoomContext]:
+    async with AsyncSessionLocal() as db:
+        room = await db.get(ChatRoom, room_id)
+    if room is None:
+        return None
+    return RoomContext(
+        room_id=room.chat_id,
+        char_prompt_id=room.char_prompt_id,
+        user_unique_name=room.user_unique_name,
+        user_introduction=room.user_introduction,
+        favorability=room.favorability,
+    )
+
+
+async def load_group_context(group_chat_idx: int) -> Optional[GroupContext]:
+    """그룹 채팅방과 참여 캐릭터를 읽습니다. 캐릭터마다 가장 최근 프롬프트(char_prompt_id가 가장 큰 것)를 사용합니다."""
+    async with AsyncSessionLocal() as db:
+        group = await db.get(GroupChat, group_chat_idx)
+        if group is None or group.is_deleted:
+            return None
+        user = await db.get(User, group.user_idx) if group.user_idx is not None else None
+        rows = (await db.execute(
+            select(GroupChatCharacter.char_idx, func.max(CharacterPrompt.char_prompt_id))
+            .join(CharacterPrompt, CharacterPrompt.char_idx == GroupChatCharacter.char_idx)
+            .where(GroupChatCharacter.group_chat_idx == group_chat_idx)
+            .group_by(GroupChatCharacter.char_idx)
+            .order_by(func.min(GroupChatCharacter.group_chars_idx))
+        )).all()
+    return GroupContext(
+        group_chat_idx=group.group_chat_idx,
+        user_unique_name=user.nickname if user else None,
+        chat_title=group.chat_title,
+        chat_prompt=group.chat_prompt,
+        char_prompt_ids=[char_prompt_id for _, char_prompt_id in rows],
+    )
@@ -0,0 +1,121 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import ChatLog, ChatMessage
+from transcript import TIMESTAMP_FORMAT, parse_log_messages
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")  # gpt-4o 계열 토크나이저
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """프롬프트에 들어갈 텍스트의 토큰 수를 셉니다. (tiktoken이 없으면 글자 수 기반 추정)"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 2 + 1
+
+
+def format_message_line(sender: str, message: str, created_at: datetime) -> str:
+    return f"[{created_at.strftime(TIMESTAMP_FORMAT)}] {sender}: {message}\n"
+
+
+# DB에 저장된 지난 세션 하나 (대화 라인 + 저장된 요약)
+class PriorSession:
+    def __init__(self, session_id: str, text: str, summary: Optional[str] = None):
+        self.session_id = session_id
+        self.text = text
+        self.tokens = count_tokens(self.text)
+        self.summary = None
+        self.summary_tokens = 0
+        self.set_summary(summary)
+
+    @classmethod
+    def from_log(cls, session_id: str, log: str, summary: Optional[str] = None) -> "PriorSession":
+        """chat_logs 테이블의 로그 원문(decode_log 결과)에서 대화 메시지만 추려 만듭니다. (메시지 테이블로 옮기기 전 데이터용)"""
+        text = "".join(
+            format_message_line(m["sender"], m["message"], m["created_at"]) for m in parse_log_messages(log)
+        )
+        return cls(session_id, text, summary)
+
+    @classmethod
+    def from_messages(cls, session_id: str, messages: list, summary: Optional[str] = None) -> "PriorSession":
+        """chat_messages 행(오래된 순)으로 만듭니다."""
+        text = "".join(format_message_line(m.sender, m.message, m.created_at) for m in messages)
+        return cls(session_id, text, summary)
+
+    def set_summary(self, summary: Optional[str]):
+        self.summary = f"[Summary of an earlier conversation] {summary.strip()}\n" if summary else None
+        self.summary_tokens = count_tokens(self.summary) if self.summary else 0
+
+
+# 토큰 예산 안에서 대화 히스토리를 조립
+# 최근 대화는 원문 그대로, 예산을 넘는 오래된 세션은 저장된 요약으로 대체하고, 그마저 넘으면 생략한다.
+class HistoryAssembler:
+    def __init__(self, token_budget: int = 2000):
+        self.token_budget = token_budget
+
+    def assemble(self, prior_sessions: List[PriorSession], current_lines: List[str]) -> str:
+        """prior_sessions는 최신 세션이 앞에 오도록 정렬되어 있어야 합니다."""
+        remaining = self.token_budget
+        parts = []  # 최신 -> 과거 순으로 쌓은 뒤 마지막에 뒤집는다
+
+        # 현재 세션: 최근 라인부터 예산이 허용하는 만큼 원문 유지
+        for line in reversed(current_lines):
+            tokens = count_tokens(line)
+            if tokens > remaining:
+                return "".join(reversed(parts))
+            parts.append(line)
+            remaining -= tokens
+
+        # 지난 세션: 원문이 들어가면 원문, 아니면 요약, 둘 다 안 되면 중단
+        for session in prior_sessions:
+            if session.text and session.tokens <= remaining:
+                parts.append(session.text)
+                remaining -= session.tokens
+            elif session.summary and session.summary_tokens <= remaining:
+                parts.append(session.summary)
+                remaining -= session.summary_tokens
+            else:
+                break
+
+        return "".join(reversed(parts))
+
+
+async def fetch_recent_messages(db: AsyncSession, room_id: str, limit: int) -> List[ChatMessage]:
+    """방의 최근 메시지를 (created_at, message_idx) 최신순으로 limit개 가져옵니다."""
+    query = select(ChatMessage).where(ChatMessage.chat_id == room_id)
+    query = query.order_by(ChatMessage.created_at.desc(), ChatMessage.message_idx.desc()).limit(limit)
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+
+async def fetch_legacy_logs(db: AsyncSession, room_id: str, limit: int,
+                            after: Optional[datetime] = None) -> List[Tuple[str, str, datetime]]:
+    """chat_messages로 옮겨지지 않은(backfill 전) 방의 세션 로그를 end_time 최신순으로 limit개 가져옵니다.
+    after가 주어지면 그보다 늦게 끝난 세션만 가져옵니다. 반환: (session_id, 저장된 로그 원문, end_time)"""
+    query = select(ChatLog.session_id, ChatLog.log, ChatLog.end_time).where(
+        ChatLog.chat_id == room_id,
+        ~exists().where(ChatMessage.session_id == ChatLog.session_id),
+    )
+    if after is not None:
+        query = query.where(ChatLog.end_time > after)
+    result = await db.execute(query.order_by(ChatLog.end_time.desc()).limit(limit))
+    return [tuple(row) for row in result.all()]
+
+
+def group_messages_by_session(messages: List[ChatMessage]) -> List[Tuple[str, List[ChatMessage]]]:
+    """최신순 메시지를 세션별로 묶습니다. 세션은 최신순, 세션 안의 메시지는 오래된 순으로 반환합니다."""
+    groups: List[Tuple[str, List[ChatMessage]]] = []
+    for message in messages:
+        if not groups or groups[-1][0] != message.session_id:
+            groups.append((message.session_id, []))
+        groups[-1][1].append(message)
+    return [(session_id, list(reversed(session_messages))) for session_id, session_messages in groups]
@@ -21,3 +21,17 @@ class ChatSummaryMemory:
     def get_recent_messages(self):
         # 최근 메시지들을 가져오는 메소드
         return list(self.history)
+
+    def approx_bytes(self):
+        # 메모리 사용량 추정치 (JSON 직렬화 크기 + 객체 오버헤드)
+        return len(json.dumps(list(self.history), ensure_ascii=False).encode("utf-8")) + 512
+
+    def to_dict(self):
+        # 축출 시 외부 저장소에 보관하기 위한 직렬화
+        return {"max_history_length": self.max_history_length, "history": list(self.history)}
+
+    @classmethod
+    def from_dict(cls, data):
+        memory = cls(max_history_length=data.get("max_history_length", 5))
+        memory.history.extend(data.get("history", []))
+        return memory
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from llm_limiter import CLASSIFIER
+
+EMOTIONS = ["Happy", "Sad", "Angry", "Confused", "Grateful", "Embarrassed", "Nervous"]
+FAVORABILITY_OUTCOMES = ["Increase", "Decrease", "Neutral"]
+
+
+# 감정/호감도 분류기 인터페이스
+# predict_emotion / analyze_message는 설정된 백엔드(LLMClassifier 또는 LocalClassifier)에만 분류를 요청한다.
+# emotion_version / favorability_version은 분류 결과 캐시 키에 들어가, 백엔드나 프롬프트/모델이 바뀌면 이전 결과를 쓰지 않게 한다.
+class Classifier(ABC):
+    name = "base"
+    emotion_version = ""
+    favorability_version = ""
+
+    @abstractmethod
+    async def predict_emotion(self, user_message: str) -> str:
+        ...
+
+    @abstractmethod
+    async def analyze_favorability(self, user_message: str, dialogue_history) -> str:
+        """dialogue_history는 방의 ChatSummaryMemory - 백엔드마다 필요한 형태(요약, 최근 메시지)를 꺼내 쓴다."""
+        ...
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+# 기본 분류기 - 감정/호감도를 LLM 체인으로 분류 (공용 제한기의 CLASSIFIER 우선순위로 호출)
+# run_llm은 openai_api._run_llm (재시도/시간 제한/지표 포함)
+class LLMClassifier(Classifier):
+    name = "openai"
+
+    def __init__(self, emotion_chain, favorability_chain, run_llm: Callable, emotion_version: str, favorability_version: str):
+        self.emotion_chain = emotion_chain
+        self.favorability_chain = favorability_chain
+        self.run_llm = run_llm
+        self.emotion_version = emotion_version
+        self.favorability_version = favorability_version
+
+    async def predict_emotion(self, user_message: str) -> str:
+        emotion = await self.run_llm(self.emotion_chain, {"user_message": user_message}, CLASSIFIER, output_tokens=5, kind="emotion")
+        return emotion.content.strip() or "normal"
+
+    async def analyze_favorability(self, user_message: str, dialogue_history) -> str:
+        response = await self.run_llm(self.favorability_chain, {
+            "prompt": dialogue_history.get_summary(),  # 대화 이력 요약
+            "user_message": user_message
+        }, CLASSIFIER, output_tokens=5, kind="favorability")
+        return response.content.strip()
+
+
+# 여러 방에서 동시에 들어온 분류 요청을 모아 한 번의 forward로 처리
+# 첫 요청이 들어온 뒤 max_wait 동안(또는 max_batch개가 찰 때까지) 모은 뒤 run_batch를 별도 스레드에서 실행한다.
+class MicroBatcher:
+    def __init__(self, run_batch: Callable[[List[Any]], List[Any]], max_batch: int = 32, max_wait: float = 0.01):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.items = 0
+        self.busy_seconds = 0.0
+
+    async def submit(self, item: Any) -> Any:
+        if self._task is None or self._task.done():
+            self.queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                # 모델 추론은 CPU 작업이므로 이벤트 루프를 막지 않도록 스레드에서 실행
+                results = await asyncio.to_thread(self.run_batch, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.busy_seconds += time.perf_counter() - started
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "avg_batch_ms": round(self.busy_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+            "queued": self.queue.qsize() if self.queue else 0,
+        }
+
+
+# 로컬 경로의 transformers 시퀀스 분류 모델 하나 (CPU 추론)
+# 모델의 id2label은 분류 라벨(예: Happy, Increase)과 대소문자만 다르게 일치해야 한다.
+class SequenceClassifierModel:
+    def __init__(self, model_path: str, labels: Sequence[str], max_length: int = 256):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_path, local_files_only=True)
+        self.model.eval()
+        self.max_length = max_length
+
+        by_lower = {label.lower(): label for label in labels}
+        self.id2label = {}
+        for index, label in self.model.config.id2label.items():
+            if str(label).lower() not in by_lower:
+                raise ValueError(f"Model label '{label}' in {model_path} is not one of {', '.join(labels)}")
+            self.id2label[int(index)] = by_lower[str(label).lower()]
+
+    def predict(self, items: List[Tuple[str, Optional[str]]]) -> List[str]:
+        """(텍스트, 보조 텍스트) 목록을 분류합니다.
+        토크나이저는 text_pair에 None이 섞인 목록을 받지 않으므로, 보조 텍스트가 있는 행과 없는 행을 나눠 각각 한 번의 forward로 처리합니다."""
+        results: List[Optional[str]] = [None] * len(items)
+        with_pair = [index for index, (_, pair) in enumerate(items) if pair]
+        without_pair = [index for index, (_, pair) in enumerate(items) if not pair]
+        for indexes, use_pair in ((with_pair, True), (without_pair, False)):
+            if not indexes:
+                continue
+            texts = [items[index][0] for index in indexes]
+            pairs = [items[index][1] for index in indexes] if use_pair else None
+            for index, label in zip(indexes, self._forward(texts, pairs)):
+                results[index] = label
+        return results
+
+    def _forward(self, texts: List[str], pairs: Optional[List[str]]) -> List[str]:
+        encoded = self.tokenizer(
+            texts, pairs, padding=True, truncation=True, max_length=self.max_length, return_tensors="pt",
+        )
+        with self.torch.inference_mode():
+            logits = self.model(**encoded).logits
+        return [self.id2label[int(index)] for index in logits.argmax(dim=-1).tolist()]
+
+
+# 로컬 CPU 분류기 - 감정/호감도 모델을 각각 마이크로 배치로 실행
+class LocalClassifier(Classifier):
+    name = "local"
+
+    def __init__(self, emotion_model_path: str, favorability_model_path: str,
+                 max_batch: int = 32, max_wait: float = 0.01, num_threads: Optional[int] = None):
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+        self.emotion_model = SequenceClassifierModel(emotion_model_path, EMOTIONS)
+        self.favorability_model = SequenceClassifierModel(favorability_model_path, FAVORABILITY_OUTCOMES)
+        self.emotion_batcher = MicroBatcher(self.emotion_model.predict, max_batch, max_wait)
+        self.favorability_batcher = MicroBatcher(self.favorability_model.predict, max_batch, max_wait)
+        # 로컬 모델 결과는 LLM 결과와 섞이지 않도록 모델 경로로 캐시 키를 구분
+        self.emotion_version = f"local:{emotion_model_path}"
+        self.favorability_version = f"local:{favorability_model_path}"
+
+    async def predict_emotion(self, user_message: str) -> str:
+        return await self.emotion_batcher.submit((user_message, None))
+
+    async def analyze_favorability(self, user_message: str, dialogue_history) -> str:
+        # 최근 대화를 보조 텍스트(text pair)로 넘긴다
+        context = "\n".join(f"{msg['message']} ({msg['emotion']})" for msg in dialogue_history.get_recent_messages())
+        return await self.favorability_batcher.submit((user_message, context or None))
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "emotion": self.emotion_batcher.stats(),
+            "favorability": self.favorability_batcher.stats(),
+        }
+
+
+def load_classifier(backend: str, emotion_model_path: Optional[str], favorability_model_path: Optional[str],
+                    max_batch: int, max_wait: float, num_threads: Optional[int], default: Classifier) -> Classifier:
+    """CLASSIFIER_BACKEND 설정으로 분류기를 만듭니다. openai(기본)이거나 로컬 모델 로드에 실패하면 default (LLM 분류)."""
+    if backend != "local":
+        return default
+    try:
+        if not emotion_model_path or not favorability_model_path:
+            raise ValueError("CLASSIFIER_EMOTION_MODEL_PATH and CLASSIFIER_FAVORABILITY_MODEL_PATH are required")
+        classifier = LocalClassifier(emotion_model_path, favorability_model_path, max_batch, max_wait, num_threads)
+        logging.info(f"Loaded local classifiers from {emotion_model_path}, {favorability_model_path}")
+        return classifier
+    except Exception as e:
+        logging.error(f"Error loading local classifier, falling back to LLM classification: {e}")
+        return default
@@ -0,0 +1,45 @@
+from typing import Dict, Iterator, Optional, Tuple
+
+from fastapi import WebSocket
+
+# 중복 연결 정책
+TAKEOVER = "takeover"  # 같은 방에 새 연결이 오면 기존 소켓을 닫고 세션을 넘겨받음
+REJECT = "reject"  # 같은 방에 이미 연결이 있으면 새 연결을 거부
+
+
+# 세션 ID와 room_id 양방향 인덱스를 가진 연결 레지스트리 (조회/삭제 O(1))
+class ConnectionRegistry:
+    def __init__(self):
+        self.sessions: Dict[str, Tuple[WebSocket, str]] = {}  # session_id -> (websocket, room_id)
+        self.rooms: Dict[str, str] = {}  # room_id -> session_id
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self.sessions
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.sessions)
+
+    def get(self, session_id: str, default=(None, None)) -> Tuple[Optional[WebSocket], Optional[str]]:
+        return self.sessions.get(session_id, default)
+
+    def session_for_room(self, room_id: str) -> Optional[str]:
+        return self.rooms.get(room_id)
+
+    def register(self, session_id: str, websocket: WebSocket, room_id: str):
+        self.sessions[session_id] = (websocket, room_id)
+        self.rooms[room_id] = session_id
+
+    def replace_websocket(self, session_id: str, websocket: WebSocket) -> Optional[WebSocket]:
+        """세션에 연결된 웹소켓을 교체하고 이전 웹소켓을 반환합니다."""
+        old_websocket, room_id = self.sessions[session_id]
+        self.sessions[session_id] = (websocket, room_id)
+        return old_websocket
+
+    def pop(self, session_id: str, default=(None, None)) -> Tuple[Optional[WebSocket], Optional[str]]:
+        websocket, room_id = self.sessions.pop(session_id, default)
+        if room_id is not None and self.rooms.get(room_id) == session_id:
+            del self.rooms[room_id]
+        return websocket, room_id
@@ -1,6 +1,7 @@
-from sqlalchemy import create_engine, UniqueConstraint, Column, String, Text, DateTime, ForeignKey, Integer, Boolean, JSON, ARRAY, text
+from sqlalchemy import create_engine, UniqueConstraint, Index, Column, String, Text, DateTime, ForeignKey, Integer, BigInteger, Boolean, JSON, ARRAY, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from datetime import datetime
 from dotenv import load_dotenv
 import os
@@ -11,9 +12,54 @@ load_dotenv()
 # PostgreSQL 연결 URL
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# SQLAlchemy 설정
-engine = create_engine(DATABASE_URL)
+# 커넥션 풀 설정 (워커 수 x (pool_size + max_overflow)가 DB 최대 연결 수를 넘지 않도록 조정)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # 풀에서 연결을 기다리는 최대 시간(초)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # 오래된 연결 재생성 주기(초)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))  # 쿼리 최대 실행 시간
+
+
+def to_async_database_url(url: str) -> str:
+    """동기 드라이버 URL을 비동기 드라이버(asyncpg/aiosqlite) URL로 변환합니다."""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+
+def pool_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_database_url(DATABASE_URL)
+
+# SQLAlchemy 설정 - 동기 엔진 (스크립트, 테이블 생성용)
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"} if DATABASE_URL.startswith("postgres") else {},
+    **pool_options(DATABASE_URL),
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# 비동기 엔진 (웹소켓 핸들러 등 이벤트 루프 안에서 사용)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args={"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}} if ASYNC_DATABASE_URL.startswith("postgresql+asyncpg") else {},
+    **pool_options(ASYNC_DATABASE_URL),
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 # Users 테이블
@@ -90,6 +136,37 @@ class ChatLog(Base):
     log = Column(Text, nullable=False)
     start_time = Column(DateTime, nullable=False)
     end_time = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+    # DB에 저장된 시각 - 재시도/저널 복구로 늦게 저장된 로그도 end_time과 상관없이 뒤쪽에 온다
+    persisted_at = Column(DateTime, default=datetime.now, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+
+    # 배치 작업이 (persisted_at, session_id) 순서로 새로 저장된 로그만 이어서 조회하기 위한 인덱스
+    __table_args__ = (
+        Index("ix_chat_logs_persisted_at_session_id", "persisted_at", "session_id"),
+    )
+
+# ChatMessages 테이블 - 세션 로그를 메시지 단위로 정규화 (방별 최근 N개 메시지 조회용)
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+
+    message_idx = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    chat_id = Column(String(50), ForeignKey("chat_rooms.chat_id"), nullable=False)
+    session_id = Column(String(50), ForeignKey("chat_logs.session_id"), nullable=False, index=True)
+    sender = Column(String(20), nullable=False)  # "user" 또는 "chatbot"
+    message = Column(Text, nullable=False)
+    emotion = Column(String(20), nullable=True)
+    favorability = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    __table_args__ = (
+        Index("ix_chat_messages_chat_id_created_at", "chat_id", "created_at"),
+    )
+
+# ChatLogSummaries 테이블 - 저장된 세션 로그별 요약 (히스토리 토큰 예산 초과 시 원문 대신 사용)
+class ChatLogSummary(Base):
+    __tablename__ = "chat_log_summaries"
+
+    session_id = Column(String(50), ForeignKey("chat_logs.session_id"), primary_key=True)
+    summary = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
 
 # Images 테이블
 class Image(Base):
@@ -134,7 +211,7 @@ class CharacterPrompt(Base):
     character_personality = Column(Text, nullable=False)
     character_background = Column(Text, nullable=False)
     character_speech_style = Column(Text, nullable=False)
-    example_dialogues = Column(ARRAY(Text), nullable=True)
+    example_dialogues = Column(ARRAY(Text).with_variant(JSON, "sqlite"), nullable=True)  # SQLite(로컬 테스트/벤치마크)에서는 JSON 배열
 
 # GroupChats 테이블
 class GroupChat(Base):
@@ -175,6 +252,11 @@ class SecretDiary(Base):
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
 
+    # 세션당 일기 하나 (배치 작업이 동시에 실행되거나 다시 확인한 구간에서도 중복 저장되지 않음)
+    __table_args__ = (
+        Index("ux_secret_diary_session", "session", unique=True),
+    )
+
 # GroupChatCharacters 테이블
 class GroupChatCharacter(Base):
     __tablename__ = "group_chat_characters"
@@ -183,5 +265,41 @@ class GroupChatCharacter(Base):
     group_chat_idx = Column(Integer, ForeignKey("group_chats.group_chat_idx"), nullable=False)
     char_idx = Column(Integer, ForeignKey("characters.char_idx"), nullable=False)
 
+# JobCheckpoints 테이블 - 배치 작업의 진행 위치(high-water mark), 중단 후 다시 실행하면 여기서부터 이어서 처리
+class JobCheckpoint(Base):
+    __tablename__ = "job_checkpoints"
+
+    job_name = Column(String(50), primary_key=True)
+    last_end_time = Column(DateTime, nullable=True)  # persisted_at 도입 전의 진행 위치 (이전 체크포인트 이어받기용)
+    last_persisted_at = Column(DateTime, nullable=True)
+    last_session_id = Column(String(50), nullable=True)
+    updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+
+# JobFailures 테이블 - 배치 작업에서 실패한 세션별 시도 횟수 (최대 횟수에 닿으면 건너뛰고 이 행을 남김)
+class JobFailure(Base):
+    __tablename__ = "job_failures"
+
+    job_name = Column(String(50), primary_key=True)
+    session_id = Column(String(50), primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+
 # 테이블 생성
 Base.metadata.create_all(bind=engine)
+
+
+def add_missing_column(conn, table, column) -> bool:
+    """기존 테이블에 컬럼이 없으면 (NULL 허용으로) 추가합니다. 추가했으면 True"""
+    if column.name in {c["name"] for c in inspect(conn).get_columns(table.name)}:
+        return False
+    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}")
+    return True
+
+
+# create_all은 기존 테이블에 컬럼을 추가하지 않으므로, 컬럼이 추가되기 전에 만들어진 DB에 직접 추가
+with engine.begin() as conn:
+    if add_missing_column(conn, ChatLog.__table__, ChatLog.__table__.c.persisted_at):
+        # 기존 로그는 저장 시각을 모르므로 end_time으로 채움 (일기 작업의 이전 end_time 진행 위치와 이어짐)
+        conn.execute(ChatLog.__table__.update().where(ChatLog.persisted_at.is_(None)).values(persisted_at=ChatLog.end_time))
+    add_missing_column(conn, JobCheckpoint.__table__, JobCheckpoint.__table__.c.last_persisted_at)
@@ -0,0 +1,95 @@
+# 로컬 테스트/부하 측정용 가짜 채팅 모델 (LLM_PROVIDER=fake)
+# OpenAI를 호출하지 않고, 프롬프트 종류(감정/호감도 분류, 요약, 단일 호출 JSON, 캐릭터 응답)에 맞는 형태의 응답을
+# 지정한 지연 시간 뒤에 돌려준다. 스트리밍은 단어 단위로 청크를 나눠 보낸다.
+import asyncio
+import json
+import random
+import time
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+EMOTIONS = ["Happy", "Sad", "Angry", "Confused", "Grateful", "Embarrassed", "Nervous"]
+OUTCOMES = ["Increase", "Decrease", "Neutral"]
+REPLIES = [
+    "오늘은 어떤 하루를 보냈어? 네 이야기가 듣고 싶어.",
+    "그런 일이 있었구나. 조금 더 자세히 말해 줄래?",
+    "하하, 너랑 이야기하면 시간 가는 줄 모르겠어.",
+    "음... 그건 나도 한번 생각해 볼게. 너는 어떻게 생각해?",
+]
+
+
+class FakeChatModel(BaseChatModel):
+    latency: float = 0.2  # 응답 전체 지연 (초)
+    stream_chunk_delay: float = 0.01  # 스트리밍 청크 간 지연 (초)
+    tokens_per_second: float = 0.0  # 0보다 크면 출력 청크(단어)당 1/tokens_per_second초씩 생성 시간 추가
+    failure_rate: float = 0.0  # 무작위 실패 비율 (재시도/폴백 경로 확인용)
+    slow_rate: float = 0.0  # 지연 시간이 slow_factor배로 늘어나는 비율 (꼬리 지연/헤지 확인용)
+    slow_factor: float = 10.0
+    seed: Optional[int] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        rng = random.Random(self.seed) if self.seed is not None else random
+        if self.failure_rate and rng.random() < self.failure_rate:
+            raise ConnectionError("Fake LLM failure")
+        if "Respond only with a JSON object" in prompt:
+            return json.dumps({
+                "response": rng.choice(REPLIES),
+                "emotion": rng.choice(EMOTIONS),
+                "favorability_outcome": rng.choice(OUTCOMES),
+            }, ensure_ascii=False)
+        if "Provide only the predicted emotion" in prompt:
+            return rng.choice(EMOTIONS)
+        if "Provide only one of the following words" in prompt:
+            return rng.choice(OUTCOMES)
+        if "Provide only the summary" in prompt:
+            return "사용자와 캐릭터가 일상적인 이야기를 나누며 가까워졌다."
+        if "Provide only the diary entry" in prompt:
+            return "오늘도 그 아이와 이야기를 나눴다. 사소한 이야기였지만 왠지 마음이 따뜻해졌다. 다음에는 내가 먼저 말을 걸어 봐야지."
+        return rng.choice(REPLIES)
+
+    def _message(self, messages: List[BaseMessage], text: str) -> AIMessage:
+        input_tokens = sum(len(str(message.content)) for message in messages) // 2 + 1
+        output_tokens = len(text) // 2 + 1
+        return AIMessage(content=text, usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        })
+
+    def _latency(self) -> float:
+        if self.slow_rate and random.random() < self.slow_rate:
+            return self.latency * self.slow_factor
+        return self.latency
+
+    def _generation_time(self, text: str) -> float:
+        return len(text.split(" ")) / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        text = self._respond(messages)
+        time.sleep(self._latency() + self._generation_time(text))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, text))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        text = self._respond(messages)
+        await asyncio.sleep(self._latency() + self._generation_time(text))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, text))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._latency())
+        text = self._respond(messages)
+        chunk_delay = 1 / self.tokens_per_second if self.tokens_per_second else self.stream_chunk_delay
+        for i, word in enumerate(text.split(" ")):
+            if i:
+                await asyncio.sleep(chunk_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
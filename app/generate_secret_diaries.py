@@ -0,0 +1,237 @@
+# 저장된 세션 로그(chat_logs)로 캐릭터의 비밀 일기(secret_diary)를 만드는 배치 작업
+# DB에 저장된 순서((persisted_at, session_id))의 진행 위치(job_checkpoints)부터 새로 저장된 로그만 읽어 전체 테이블을 다시 훑지 않는다.
+# (end_time 순서가 아니므로 재시도/저널 복구로 늦게 저장된 로그도 진행 위치 뒤에 들어와 빠지지 않음)
+# 일기는 배치 단위로 한 번에 INSERT하고 같은 트랜잭션에서 진행 위치를 갱신하므로, 중간에 멈춰도 다시 실행하면 이어서 처리된다.
+# 세션당 일기는 하나(ux_secret_diary_session)이고, 이미 있는 세션의 일기는 INSERT에서 건너뛴다.
+# 실패한 세션은 job_failures에 시도 횟수를 남기고, --max-attempts번 실패하면 건너뛰어 진행 위치가 그 세션에 묶이지 않게 한다.
+# (건너뛴 세션을 다시 처리하려면 job_failures의 해당 행을 지우고 --lookback-seconds를 충분히 주어 실행)
+# LLM 호출은 이 작업 전용 제한기(DIARY_MAX_IN_FLIGHT / DIARY_RPM / DIARY_TPM)를 사용해 대화 트래픽의 예산을 쓰지 않는다.
+# cd app && python generate_secret_diaries.py --batch-size 50
+# cd app && LLM_PROVIDER=fake DATABASE_URL=sqlite:///local.db python generate_secret_diaries.py --follow --interval 30
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, delete, exists, func, insert, inspect, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import engine, SessionLocal, Character, CharacterPrompt, ChatLog, ChatRoom, JobCheckpoint, JobFailure, SecretDiary, User
+from transcript import parse_log_messages
+from log_codec import decode_log
+from llm_limiter import LLMLimiter, BACKGROUND
+from openai_api import write_secret_diary
+
+JOB_NAME = "secret_diary"
+
+
+def ensure_indexes():
+    """이 작업이 쓰는 인덱스를 만듭니다. (이미 있으면 건너뜀)
+    create_all은 기존 테이블에 인덱스를 추가하지 않으므로, 인덱스가 추가되기 전에 만들어진 DB를 위해 작업 시작 시 실행한다."""
+    chat_logs_index = next(index for index in ChatLog.__table__.indexes if index.name == "ix_chat_logs_persisted_at_session_id")
+    diary_index = next(index for index in SecretDiary.__table__.indexes if index.name == "ux_secret_diary_session")
+    with engine.begin() as conn:
+        chat_logs_index.create(conn, checkfirst=True)
+        if not inspect(conn).has_index(SecretDiary.__tablename__, diary_index.name):
+            # 유니크 인덱스를 만들기 전에 예전 실행이 남긴 중복 일기를 정리 (세션마다 먼저 저장된 것 하나만 남김)
+            keep = select(func.min(SecretDiary.diary_idx)).group_by(SecretDiary.session)
+            removed = conn.execute(delete(SecretDiary).where(SecretDiary.diary_idx.not_in(keep))).rowcount
+            if removed:
+                print(f"Removed {removed} duplicate secret diaries before creating {diary_index.name}")
+            diary_index.create(conn)
+
+
+def insert_diaries(db):
+    """일기 INSERT 문 - 이미 일기가 있는 세션은 건너뜀 (PostgreSQL/SQLite ON CONFLICT DO NOTHING)"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(SecretDiary).on_conflict_do_nothing(index_elements=["session"])
+    if dialect == "sqlite":
+        return sqlite.insert(SecretDiary).on_conflict_do_nothing(index_elements=["session"])
+    return insert(SecretDiary)
+
+
+def load_checkpoint(job_name: str):
+    with SessionLocal() as db:
+        checkpoint = db.get(JobCheckpoint, job_name)
+        if checkpoint is None:
+            return None, ""
+        # persisted_at 도입 전의 체크포인트는 end_time 위치에서 이어감 (기존 로그의 persisted_at은 end_time으로 채워짐)
+        last_persisted_at = checkpoint.last_persisted_at or checkpoint.last_end_time
+        if last_persisted_at is None:
+            return None, ""
+        return last_persisted_at, checkpoint.last_session_id or ""
+
+
+def fetch_batch(after_time: Optional[datetime], after_session_id: str, batch_size: int,
+                job_name: str = JOB_NAME, max_attempts: int = 3) -> list:
+    """진행 위치 다음의, 아직 일기가 없고 건너뛰지 않은 세션 로그를 batch_size개 읽습니다. (캐릭터/사용자 이름 포함)"""
+    query = (
+        select(ChatLog.session_id, ChatLog.persisted_at, ChatLog.log, ChatRoom.user_unique_name, User.nickname, Character.char_name)
+        .join(ChatRoom, ChatRoom.chat_id == ChatLog.chat_id)
+        .outerjoin(User, User.user_idx == ChatRoom.user_idx)
+        .outerjoin(CharacterPrompt, CharacterPrompt.char_prompt_id == ChatRoom.char_prompt_id)
+        .outerjoin(Character, Character.char_idx == CharacterPrompt.char_idx)
+        .where(~exists().where(SecretDiary.session == ChatLog.session_id))
+        .where(~exists().where(
+            JobFailure.job_name == job_name,
+            JobFailure.session_id == ChatLog.session_id,
+            JobFailure.attempts >= max_attempts,
+        ))
+        .order_by(ChatLog.persisted_at, ChatLog.session_id)
+        .limit(batch_size)
+    )
+    if after_time is not None:
+        query = query.where(or_(
+            ChatLog.persisted_at > after_time,
+            and_(ChatLog.persisted_at == after_time, ChatLog.session_id > after_session_id),
+        ))
+    with SessionLocal() as db:
+        return db.execute(query).all()
+
+
+async def diary_for(row, limiter: LLMLimiter) -> Optional[str]:
+    """세션 로그 한 건의 일기를 만듭니다. 대화 내용이 없으면 None."""
+    _, _, log, user_unique_name, nickname, char_name = row
+    user_name = user_unique_name or nickname or "user"
+    character_name = char_name or "character"
+    messages = parse_log_messages(decode_log(log))
+    if not messages:
+        return None
+    chat_text = "\n".join(
+        f"{user_name if message['sender'] == 'user' else character_name}: {message['message']}" for message in messages
+    )
+    return await write_secret_diary(chat_text, character_name, user_name, limiter=limiter)
+
+
+def record_failures(job_name: str, errors: dict) -> dict:
+    """실패한 세션의 시도 횟수를 하나씩 올리고 {세션 ID: 누적 시도 횟수}를 반환합니다."""
+    attempts = {}
+    with SessionLocal() as db:
+        for session_id, error in errors.items():
+            failure = db.get(JobFailure, (job_name, session_id))
+            if failure is None:
+                failure = JobFailure(job_name=job_name, session_id=session_id, attempts=0)
+                db.add(failure)
+            failure.attempts += 1
+            failure.last_error = repr(error)[:1000]
+            failure.updated_at = datetime.now()
+            attempts[session_id] = failure.attempts
+        db.commit()
+    return attempts
+
+
+def save_batch(job_name: str, diaries: list, done_sessions: list, last_row):
+    """일기 다중 행 INSERT, 처리된 세션의 실패 기록 삭제, 진행 위치 갱신을 한 트랜잭션으로 커밋합니다."""
+    with SessionLocal() as db:
+        if diaries:
+            db.execute(insert_diaries(db), diaries)
+        if done_sessions:
+            db.execute(delete(JobFailure).where(
+                JobFailure.job_name == job_name, JobFailure.session_id.in_(done_sessions)
+            ))
+        if last_row is not None:
+            db.merge(JobCheckpoint(
+                job_name=job_name, last_persisted_at=last_row[1], last_session_id=last_row[0], updated_at=datetime.now()
+            ))
+        db.commit()
+
+
+async def run(limiter: LLMLimiter, job_name: str = JOB_NAME, batch_size: int = 50,
+              lookback_seconds: float = 300, dry_run: bool = False, max_attempts: int = 3) -> dict:
+    stats = {"sessions": 0, "diaries": 0, "empty_sessions": 0, "failed": 0, "skipped": 0}
+    started = time.perf_counter()
+
+    # persisted_at 순서와 커밋 순서가 다를 수 있으므로(동시에 진행된 트랜잭션, 워커 간 시계 차이) 조금 앞에서부터 다시 확인
+    # (이미 일기가 있는 세션은 조회에서 제외되므로 중복 생성되지 않음)
+    high_water = load_checkpoint(job_name)
+    after_time, after_session_id = high_water
+    if after_time is not None and lookback_seconds:
+        after_time, after_session_id = after_time - timedelta(seconds=lookback_seconds), ""
+
+    while True:
+        rows = fetch_batch(after_time, after_session_id, batch_size, job_name, max_attempts)
+        if not rows:
+            break
+        if dry_run:
+            stats["sessions"] += len(rows)
+            after_time, after_session_id = rows[-1][1], rows[-1][0]
+            continue
+
+        # 배치 안의 세션은 동시에 처리 (동시 실행 수/분당 요청 수는 전용 제한기가 제한)
+        results = await asyncio.gather(*[diary_for(row, limiter) for row in rows], return_exceptions=True)
+
+        errors = {row[0]: result for row, result in zip(rows, results) if isinstance(result, BaseException)}
+        attempts = record_failures(job_name, errors) if errors else {}
+
+        diaries, done_sessions = [], []
+        last_done = None  # 진행 위치는 다시 시도할 첫 실패 세션 앞까지만 옮김 (그 세션은 다음 실행에서 다시 시도)
+        failed = False
+        for row, result in zip(rows, results):
+            if isinstance(result, BaseException):
+                print(f"Error writing secret diary for session {row[0]} (attempt {attempts[row[0]]}/{max_attempts}): {result!r}")
+                stats["failed"] += 1
+                if attempts[row[0]] < max_attempts:
+                    failed = True
+                    continue
+                # 최대 횟수만큼 실패한 세션은 job_failures에 남기고 건너뜀
+                print(f"Skipping session {row[0]} after {attempts[row[0]]} failed attempts")
+                stats["skipped"] += 1
+            elif result is None:
+                stats["empty_sessions"] += 1
+                done_sessions.append(row[0])
+            else:
+                diaries.append({"session": row[0], "content": result})
+                done_sessions.append(row[0])
+            if not failed:
+                last_done = row
+
+        # 다시 확인한 구간에서는 진행 위치를 뒤로 옮기지 않음
+        if last_done is not None and (high_water[0] is None or (last_done[1], last_done[0]) > high_water):
+            high_water = (last_done[1], last_done[0])
+        else:
+            last_done = None
+        save_batch(job_name, diaries, done_sessions, last_done)
+        stats["sessions"] += len(rows)
+        stats["diaries"] += len(diaries)
+        print(f"Wrote {stats['diaries']} diaries from {stats['sessions']} sessions (last session: {rows[-1][0]})")
+        if failed:
+            break
+        after_time, after_session_id = rows[-1][1], rows[-1][0]
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    stats["limiter"] = limiter.stats()
+    return stats
+
+
+async def main(args):
+    ensure_indexes()
+    limiter = LLMLimiter(
+        max_in_flight=args.max_in_flight,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        queue_timeouts={BACKGROUND: args.queue_timeout},
+    )
+    while True:
+        print(await run(limiter, args.job_name, args.batch_size, args.lookback_seconds, args.dry_run, args.max_attempts))
+        if not args.follow:
+            break
+        await asyncio.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="저장된 세션 로그로 캐릭터의 비밀 일기를 생성합니다.")
+    parser.add_argument("--batch-size", type=int, default=50, help="한 번에 읽어 처리할 세션 수")
+    parser.add_argument("--max-in-flight", type=int, default=int(os.getenv("DIARY_MAX_IN_FLIGHT", "4")), help="동시 LLM 호출 수")
+    parser.add_argument("--rpm", type=float, default=float(os.getenv("DIARY_RPM", "60")), help="분당 요청 수 (0이면 제한 없음)")
+    parser.add_argument("--tpm", type=float, default=float(os.getenv("DIARY_TPM", "0")), help="분당 토큰 수 (0이면 제한 없음)")
+    parser.add_argument("--queue-timeout", type=float, default=600, help="제한기 대기 최대 시간(초)")
+    parser.add_argument("--lookback-seconds", type=float, default=300, help="진행 위치보다 앞에서부터 다시 확인할 시간")
+    parser.add_argument("--max-attempts", type=int, default=3, help="세션 하나를 건너뛰기 전까지 시도할 횟수")
+    parser.add_argument("--job-name", default=JOB_NAME, help="진행 위치를 저장할 작업 이름")
+    parser.add_argument("--follow", action="store_true", help="끝나도 종료하지 않고 interval마다 새 로그 처리")
+    parser.add_argument("--interval", type=float, default=60, help="--follow일 때 실행 간격(초)")
+    parser.add_argument("--dry-run", action="store_true", help="LLM 호출/DB 쓰기 없이 처리할 세션 수만 집계")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+_WHITESPACE = re.compile(r"\s+")
+_REPEATED = re.compile(r"(.)\1+")
+
+
+def normalize_text(text: str) -> str:
+    """분류 캐시 키용 정규화: 유니코드 정규화, 소문자, 앞뒤/연속 공백 정리"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text or "")).strip().lower()
+
+
+def normalize_greeting(text: str) -> str:
+    """인사말 근사 중복 판정용 정규화: 문장부호/기호/공백을 빼고 반복 글자를 하나로 줄인다 (예: "안녕하세요!!" == "안녕 하세요~")"""
+    text = normalize_text(text)
+    text = "".join(ch for ch in text if unicodedata.category(ch)[0] in ("L", "N"))
+    return _REPEATED.sub(r"\1", text)
+
+
+def cache_key(*parts: Any) -> str:
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+# LRU 결과 캐시 (선택적으로 SQLite 파일에 보관해 재기동 후에도 재사용)
+# 파일 내용은 시작할 때 한 번 메모리로 읽어 두고, 조회는 메모리에서만 한다. (이벤트 루프에서 동기 SQLite 조회 없음)
+# 키에는 모델 이름과 프롬프트 버전을 포함해야 프롬프트/모델이 바뀌었을 때 이전 결과를 쓰지 않는다.
+# 파일 쓰기는 이벤트 루프를 막지 않도록 flush_interval 동안 모아 별도 스레드에서 한 번에 커밋하고 (루프 밖에서는 바로 기록),
+# 그때 파일에서도 TTL이 지난 항목과 max_entries를 넘는 오래된 항목을 지운다.
+class ResultCache:
+    def __init__(self, name: str, max_entries: int = 10000, ttl_seconds: Optional[float] = None,
+                 path: Optional[str] = None, flush_interval: float = 1.0):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+        self.entries = OrderedDict()  # key -> (저장 시각(time.time), 값)
+        self.pending: Dict[str, tuple] = {}  # 아직 파일에 쓰지 않은 항목
+        self.hits = 0
+        self.misses = 0
+        self.writer = None  # 파일 쓰기용 연결 (시작 시 적재 후에는 flush 스레드에서만 사용)
+        self._flush_task: Optional[asyncio.Task] = None
+        if path:
+            try:
+                self.writer = sqlite3.connect(path, check_same_thread=False)
+                self.writer.execute("PRAGMA journal_mode=WAL")
+                self.writer.execute("PRAGMA synchronous=NORMAL")
+                self.writer.execute(
+                    f"CREATE TABLE IF NOT EXISTS {name} (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self.writer.execute(f"CREATE INDEX IF NOT EXISTS ix_{name}_created_at ON {name} (created_at)")
+                self.writer.commit()
+                self._write({})  # 이전 실행이 남긴 만료/초과 항목 정리
+                self._preload()
+            except sqlite3.Error as e:
+                logging.error(f"Error opening {name} cache file {path}, using memory only: {e}")
+                self.writer = None
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None or self._expired(entry[0]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, value: Any):
+        entry = (time.time(), value)
+        self._remember(key, entry)
+        if self.writer is None:
+            return
+        self.pending[key] = entry
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(self._take_pending())  # 이벤트 루프 밖 (스크립트 등)
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    def _take_pending(self) -> Dict[str, tuple]:
+        batch, self.pending = self.pending, {}
+        return batch
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        while self.pending:
+            await asyncio.to_thread(self._write, self._take_pending())
+
+    def _write(self, batch: Dict[str, tuple]):
+        """모아 둔 항목을 한 번에 커밋하고 만료/초과 항목을 지웁니다. (flush 스레드에서 실행)"""
+        try:
+            self.writer.executemany(
+                f"INSERT OR REPLACE INTO {self.name} (key, value, created_at) VALUES (?, ?, ?)",
+                [(key, json.dumps(value, ensure_ascii=False), created_at) for key, (created_at, value) in batch.items()],
+            )
+            if self.ttl_seconds is not None:
+                self.writer.execute(f"DELETE FROM {self.name} WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            # created_at 인덱스에서 max_entries번째로 최근 항목보다 오래된 항목 삭제
+            self.writer.execute(
+                f"DELETE FROM {self.name} WHERE created_at < "
+                f"(SELECT created_at FROM {self.name} ORDER BY created_at DESC LIMIT 1 OFFSET ?)",
+                (self.max_entries - 1,),
+            )
+            self.writer.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Error writing {len(batch)} {self.name} cache entries: {e}")
+
+    async def close(self):
+        """종료 시 아직 파일에 쓰지 않은 항목을 기록합니다."""
+        if self._flush_task is not None:
+            await self._flush_task  # 쓰기 연결은 한 번에 한 스레드만 사용하도록 진행 중인 flush를 기다림
+            self._flush_task = None
+        if self.pending:
+            await asyncio.to_thread(self._write, self._take_pending())
+
+    def _remember(self, key: str, entry: tuple):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _preload(self):
+        """파일에 남은 항목(정리 후 최대 max_entries개)을 오래된 순으로 메모리에 올립니다."""
+        rows = self.writer.execute(
+            f"SELECT key, created_at, value FROM {self.name} ORDER BY created_at DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for key, created_at, value in reversed(rows):
+            self.entries[key] = (created_at, json.loads(value))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "persistent": self.writer is not None,
+            "pending_writes": len(self.pending),
+        }
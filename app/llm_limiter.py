@@ -0,0 +1,171 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+# 우선순위 (숫자가 작을수록 먼저 처리)
+REPLY = 0  # 캐릭터 응답 - 사용자가 기다리는 호출
+CLASSIFIER = 1  # 감정/호감도 분류
+BACKGROUND = 2  # 세션 요약, 배치 작업
+
+PRIORITY_NAMES = {REPLY: "reply", CLASSIFIER: "classifier", BACKGROUND: "background"}
+
+
+class LLMQueueTimeout(Exception):
+    """대기열에서 마감 시간 안에 실행 차례를 얻지 못한 경우"""
+
+
+# 분당 한도를 초 단위로 채워 넣는 토큰 버킷 (limit_per_minute가 0이면 무제한)
+class TokenBucket:
+    def __init__(self, limit_per_minute: float):
+        self.capacity = limit_per_minute
+        self.rate = limit_per_minute / 60.0
+        self.tokens = limit_per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """amount만큼 꺼낼 수 있을 때까지 남은 시간(초). 한 번에 용량보다 많이 요청하면 가득 찰 때까지만 기다린다."""
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        if self.capacity:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        """예상보다 적게 쓴 토큰을 돌려주거나(양수), 더 쓴 만큼 차감합니다(음수)."""
+        if self.capacity:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+# OpenAI 호출 공용 제한기
+# 동시 실행 수(max_in_flight)와 분당 요청/토큰 수(rpm/tpm)를 함께 제한하고,
+# 대기열은 우선순위 -> 도착 순서로 처리한다. 마감 시간 안에 차례가 오지 않으면 LLMQueueTimeout.
+class LLMLimiter:
+    def __init__(self, max_in_flight: int = 64, rpm: float = 0, tpm: float = 0,
+                 queue_timeouts: Optional[Dict[int, float]] = None):
+        self.max_in_flight = max_in_flight
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.queue_timeouts = queue_timeouts or {REPLY: 15.0, CLASSIFIER: 5.0, BACKGROUND: 60.0}
+        self.in_flight = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future, int]] = []  # (우선순위, 도착 순서, future, 예상 토큰)
+        self._order = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.completed = {priority: 0 for priority in PRIORITY_NAMES}
+        self.timeouts = {priority: 0 for priority in PRIORITY_NAMES}
+        self.wait_seconds = {priority: 0.0 for priority in PRIORITY_NAMES}
+
+    @asynccontextmanager
+    async def acquire(self, priority: int = REPLY, tokens: int = 0, timeout: Optional[float] = None):
+        """실행 차례를 얻을 때까지 기다린 뒤 블록 안에서 호출을 실행합니다.
+        블록에서 받은 객체의 settle(actual_tokens)로 실제 사용 토큰을 반영할 수 있습니다."""
+        started = time.monotonic()
+        if timeout is None:
+            timeout = self.queue_timeouts.get(priority)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self._order), future, tokens))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self.timeouts[priority] += 1
+                self._dispatch()
+                raise LLMQueueTimeout(
+                    f"LLM queue deadline exceeded after {timeout:.1f}s ({PRIORITY_NAMES.get(priority, priority)})"
+                )
+        except asyncio.CancelledError:
+            # 차례를 받은 직후 취소되었다면 슬롯을 돌려준다
+            if future.done() and not future.cancelled():
+                self._release()
+            else:
+                future.cancel()
+            raise
+
+        self.wait_seconds[priority] += time.monotonic() - started
+        grant = _Grant(self, tokens)
+        try:
+            yield grant
+        finally:
+            self.completed[priority] += 1
+            self._release()
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """슬롯과 버킷이 허용하는 만큼 대기열 앞에서부터 실행 차례를 넘겨줍니다."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self.waiters and self.in_flight < self.max_in_flight:
+            _, _, future, tokens = self.waiters[0]
+            if future.done():  # 마감 시간 초과로 취소된 대기자
+                heapq.heappop(self.waiters)
+                continue
+
+            delay = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if delay > 0:
+                # 우선순위가 높은 대기자를 앞지르지 않도록 버킷이 찰 때까지 기다렸다가 다시 확인
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+
+            heapq.heappop(self.waiters)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def queue_depth(self) -> Dict[str, int]:
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future, _ in self.waiters:
+            if not future.done():
+                depth[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return depth
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self.queue_depth(),
+            "completed": {PRIORITY_NAMES[p]: count for p, count in self.completed.items()},
+            "queue_timeouts": {PRIORITY_NAMES[p]: count for p, count in self.timeouts.items()},
+            "avg_wait_ms": {
+                PRIORITY_NAMES[p]: round(self.wait_seconds[p] / self.completed[p] * 1000, 2) if self.completed[p] else 0.0
+                for p in PRIORITY_NAMES
+            },
+            "rpm_available": round(self.requests.tokens, 1) if self.requests.capacity else None,
+            "tpm_available": round(self.tokens.tokens, 1) if self.tokens.capacity else None,
+        }
+
+
+class _Grant:
+    def __init__(self, limiter: LLMLimiter, estimated_tokens: int):
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+
+    def settle(self, actual_tokens: Optional[int]):
+        """응답의 실제 사용 토큰으로 TPM 버킷을 보정합니다."""
+        if actual_tokens is None:
+            return
+        self.limiter.tokens.give_back(self.estimated_tokens - actual_tokens)
+        self.estimated_tokens = actual_tokens
@@ -0,0 +1,106 @@
+import asyncio
+import random
+from collections import deque
+from typing import Dict, Optional
+
+import openai
+
+# 재시도해도 되는 일시적 오류 (연결 끊김, 시간 초과, 429, 5xx)
+TRANSIENT_ERRORS = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+def is_transient(error: Exception) -> bool:
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def backoff_delay(attempt: int, base: float = 0.25, cap: float = 4.0) -> float:
+    """지수 백오프 + full jitter (동시에 실패한 요청들이 한꺼번에 재시도하지 않도록)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+# 호출 종류별 최근 지연 시간 (p95 계산용 슬라이딩 윈도우)
+class LatencyTracker:
+    def __init__(self, window: int = 500):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# 헤지(중복 요청) 정책
+# 첫 요청이 호출 종류별 p95를 넘기면 같은 요청을 한 번 더 보내고 먼저 끝난 결과를 쓴다.
+# 추가 비용은 budget(전체 요청 대비 헤지 비율)으로 제한한다: 요청마다 budget만큼 적립하고 헤지할 때 1씩 쓴다.
+class HedgePolicy:
+    def __init__(self, enabled: bool = False, percentile: float = 0.95, budget: float = 0.05,
+                 min_samples: int = 20, window: int = 500):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.window = window
+        self.trackers: Dict[str, LatencyTracker] = {}
+        self.credit = 1.0
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.skipped = 0
+
+    def tracker(self, kind: str) -> LatencyTracker:
+        tracker = self.trackers.get(kind)
+        if tracker is None:
+            tracker = self.trackers[kind] = LatencyTracker(self.window)
+        return tracker
+
+    def record(self, kind: str, seconds: float):
+        self.tracker(kind).record(seconds)
+
+    def delay(self, kind: str) -> Optional[float]:
+        """헤지 요청을 보낼 때까지 기다릴 시간. 헤지하지 않는 경우 None."""
+        self.requests += 1
+        self.credit = min(self.credit + self.budget, 10.0)  # 한가할 때 적립이 무한히 쌓이지 않도록 상한
+        if not self.enabled:
+            return None
+        tracker = self.tracker(kind)
+        if len(tracker.samples) < self.min_samples:
+            return None
+        return tracker.percentile(self.percentile)
+
+    def try_spend(self) -> bool:
+        if self.credit < 1.0:
+            self.skipped += 1
+            return False
+        self.credit -= 1.0
+        self.hedges += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedges_skipped_by_budget": self.skipped,
+            "hedge_ratio": self.hedges / self.requests if self.requests else 0.0,
+            "latency_ms": {
+                kind: {
+                    "p50": round(tracker.percentile(0.5) * 1000, 1),
+                    "p95": round(tracker.percentile(0.95) * 1000, 1),
+                    "p99": round(tracker.percentile(0.99) * 1000, 1),
+                    "samples": len(tracker.samples),
+                }
+                for kind, tracker in self.trackers.items() if tracker.samples
+            },
+        }
@@ -0,0 +1,76 @@
+import base64
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# chat_logs.log 컬럼(Text)에 압축된 로그를 저장할 때 앞에 붙이는 형식 표시
+# 일반 로그는 항상 "Session opened at:"으로 시작하므로 표시와 겹치지 않는다.
+MARKERS = {
+    "zlib": "@@zlib:",
+    "zstd": "@@zstd:",
+}
+CODECS = ("none",) + tuple(MARKERS)
+DEFAULT_LEVELS = {"zlib": 6, "zstd": 10}
+
+CHAT_LOG_COMPRESSION = os.getenv("CHAT_LOG_COMPRESSION", "none").lower()
+CHAT_LOG_COMPRESSION_LEVEL = os.getenv("CHAT_LOG_COMPRESSION_LEVEL")
+
+
+def _check_codec(codec: str):
+    if codec not in CODECS:
+        raise ValueError(f"Unknown chat log codec: {codec} (expected one of {', '.join(CODECS)})")
+    if codec == "zstd" and zstandard is None:
+        raise ValueError("zstd chat log compression requires the 'zstandard' package")
+
+
+def check_settings():
+    """CHAT_LOG_COMPRESSION / CHAT_LOG_COMPRESSION_LEVEL 설정을 확인합니다. (서버 시작 시 호출)
+    잘못된 설정을 첫 세션 로그를 저장할 때가 아니라 시작할 때 바로 알리기 위해 실제로 한 번 압축해 본다."""
+    if CHAT_LOG_COMPRESSION_LEVEL and not CHAT_LOG_COMPRESSION_LEVEL.lstrip("-").isdigit():
+        raise ValueError(f"CHAT_LOG_COMPRESSION_LEVEL must be an integer: {CHAT_LOG_COMPRESSION_LEVEL}")
+    sample = "Session opened at: 2000-01-01 00:00:00\n"
+    if decode_log(encode_log(sample)) != sample:
+        raise ValueError(f"Chat log codec {CHAT_LOG_COMPRESSION} did not round-trip a sample log")
+
+
+def encode_log(log: str, codec: str = None, level: int = None) -> str:
+    """로그 문자열을 지정한 형식으로 압축해 Text 컬럼에 넣을 수 있는 문자열로 만듭니다."""
+    codec = codec or CHAT_LOG_COMPRESSION
+    _check_codec(codec)
+    if codec == "none":
+        return log
+    if level is None:
+        level = int(CHAT_LOG_COMPRESSION_LEVEL) if CHAT_LOG_COMPRESSION_LEVEL else DEFAULT_LEVELS[codec]
+
+    raw = log.encode("utf-8")
+    if codec == "zlib":
+        compressed = zlib.compress(raw, level)
+    else:
+        compressed = zstandard.ZstdCompressor(level=level).compress(raw)
+    return MARKERS[codec] + base64.b64encode(compressed).decode("ascii")
+
+
+def decode_log(value: str) -> str:
+    """형식 표시를 보고 압축된 로그를 풀어 원문을 반환합니다. 압축되지 않은 로그는 그대로 반환합니다."""
+    if not value or not value.startswith("@@"):
+        return value
+    for codec, marker in MARKERS.items():
+        if value.startswith(marker):
+            compressed = base64.b64decode(value[len(marker):])
+            if codec == "zlib":
+                return zlib.decompress(compressed).decode("utf-8")
+            _check_codec(codec)
+            return zstandard.ZstdDecompressor().decompress(compressed).decode("utf-8")
+    return value
+
+
+def log_codec(value: str) -> str:
+    """저장된 로그의 압축 형식을 반환합니다."""
+    for codec, marker in MARKERS.items():
+        if value and value.startswith(marker):
+            return codec
+    return "none"
@@ -0,0 +1,200 @@
+import asyncio
+import os
+import random
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from database import AsyncSessionLocal, ChatLog, ChatMessage
+from transcript import TIMESTAMP_FORMAT, parse_log_messages
+from log_codec import encode_log
+from metrics import span
+
+
+# DB에 저장할 세션 로그 한 건
+class PendingLog:
+    def __init__(self, session_id: str, room_id: str, log_content: str, start_time: datetime, end_time: datetime,
+                 chat_text: str = "", messages: Optional[List[dict]] = None):
+        self.session_id = session_id
+        self.room_id = room_id
+        self.log_content = log_content
+        self.start_time = start_time
+        self.end_time = end_time
+        self.chat_text = chat_text  # 요약 생성용 대화 라인
+        self.messages = messages if messages is not None else parse_log_messages(log_content)  # chat_messages 행
+        self.attempts = 0
+
+    def to_models(self) -> list:
+        chat_log = ChatLog(
+            session_id=self.session_id,
+            chat_id=self.room_id,
+            start_time=self.start_time,
+            end_time=self.end_time,
+            log=encode_log(self.log_content)  # CHAT_LOG_COMPRESSION 설정에 따라 압축 저장
+        )
+        chat_messages = [
+            ChatMessage(chat_id=self.room_id, session_id=self.session_id, **message)
+            for message in self.messages
+        ]
+        return [chat_log] + chat_messages
+
+
+# 세션 로그 DB 저장을 웹소켓 핸들러와 분리해 백그라운드에서 배치로 처리하는 큐 (비동기 엔진 사용)
+# 여러 세션 로그를 모아 한 번의 커밋으로 저장하고, 실패한 건은 지터를 둔 백오프로 재시도한다.
+# 저장이 끝나기 전까지 저널 파일은 지워지지 않으므로 재시도가 모두 실패해도 로그는 남는다.
+class LogPersistenceQueue:
+    def __init__(
+        self,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        max_retries: int = 5,
+        retry_backoff: float = 1.0,
+        on_persisted: Optional[Callable[[PendingLog], None]] = None,
+        on_failed: Optional[Callable[[PendingLog], None]] = None,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.on_persisted = on_persisted
+        self.on_failed = on_failed
+        self.queue: Optional[asyncio.Queue] = None
+        self.retrying = 0  # 백오프 대기 중인 건수
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """실행 중인 이벤트 루프에서 저장 태스크를 시작합니다. (이미 실행 중이면 무시)"""
+        if self._task and not self._task.done():
+            return
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, record: PendingLog):
+        self.start()
+        self.queue.put_nowait(record)
+
+    @property
+    def depth(self) -> int:
+        return (self.queue.qsize() if self.queue else 0) + self.retrying
+
+    async def _run(self):
+        closing = False
+        while not closing:
+            record = await self.queue.get()
+            if record is None:
+                break
+            batch = [record]
+            # 첫 건이 도착한 뒤 flush_interval 동안 또는 batch_size까지 모아서 저장
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self.queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    closing = True  # 종료 신호 - 모은 배치까지만 저장하고 끝냄
+                    break
+                batch.append(record)
+            try:
+                await self._persist(batch)
+            except Exception as e:
+                print(f"Error in chat log persistence loop: {e}")
+
+    async def _persist(self, batch: List[PendingLog]):
+        try:
+            with span("log_db_write"):
+                await self._write_batch(batch)
+            failed = []
+        except Exception as e:
+            print(f"Error saving {len(batch)} chat logs to database, retrying one by one: {e}")
+            # 한 건 때문에 배치 전체가 실패했을 수 있으므로 개별 저장으로 분리
+            failed = await self._write_each(batch)
+
+        for record in batch:
+            if record in failed:
+                self._retry_later(record)
+            elif self.on_persisted:
+                self.on_persisted(record)
+
+    async def _write_batch(self, batch: List[PendingLog]):
+        async with AsyncSessionLocal() as db:
+            models = [record.to_models() for record in batch]
+            # chat_logs를 먼저 넣고 chat_messages를 넣음 (FK 순서)
+            db.add_all([chat_log for chat_log, *_ in models])
+            await db.flush()
+            db.add_all([message for _, *chat_messages in models for message in chat_messages])
+            await db.commit()
+
+    async def _write_each(self, batch: List[PendingLog]) -> List[PendingLog]:
+        failed = []
+        for record in batch:
+            try:
+                async with AsyncSessionLocal() as db:
+                    chat_log, *chat_messages = record.to_models()
+                    if await db.get(ChatLog, record.session_id) is None:  # 이전 시도에서 이미 커밋된 경우 건너뜀
+                        db.add(chat_log)
+                        await db.flush()
+                        db.add_all(chat_messages)
+                        await db.commit()
+            except Exception as e:
+                print(f"Error saving log to database for session {record.session_id}: {e}")
+                failed.append(record)
+        return failed
+
+    def _retry_later(self, record: PendingLog):
+        record.attempts += 1
+        if record.attempts > self.max_retries:
+            print(f"Giving up saving log for session {record.session_id}; journal file is kept.")
+            if self.on_failed:
+                self.on_failed(record)
+            return
+        delay = self.retry_backoff * (2 ** (record.attempts - 1)) * random.uniform(0.5, 1.5)
+        self.retrying += 1
+
+        def requeue():
+            self.retrying -= 1
+            self.queue.put_nowait(record)
+
+        asyncio.get_running_loop().call_later(delay, requeue)
+
+    async def close(self):
+        """종료 시 대기 중인 로그를 모두 저장합니다. 재시도 대기 중인 건은 저널 파일로 남아 다음 기동 시 복구됩니다."""
+        if self._task is None:
+            return
+        self.queue.put_nowait(None)  # 종료 신호 (앞에 쌓인 로그를 먼저 저장)
+        try:
+            await self._task
+        except Exception as e:
+            print(f"Error flushing chat logs on shutdown: {e}")
+        self._task = None
+
+
+def parse_journal(path: str) -> Optional[PendingLog]:
+    """이전 프로세스가 남긴 저널 파일을 저장 대기 로그로 복원합니다. (room id가 없는 예전 형식은 None)"""
+    session_id = os.path.splitext(os.path.basename(path))[0]
+    room_id, start_time, end_time, chat_lines = None, None, None, []
+    with open(path, "r", encoding="utf-8") as log_file:
+        for line in log_file:
+            if line.startswith("Session opened at:"):
+                start_time = datetime.strptime(line.split(": ", 1)[1].strip(), TIMESTAMP_FORMAT)
+            elif line.startswith("Session closed at:"):
+                end_time = datetime.strptime(line.split(": ", 1)[1].strip(), TIMESTAMP_FORMAT)
+            elif line.startswith("Room id:"):
+                room_id = line.split(": ", 1)[1].strip()
+            else:
+                # 여러 줄 메시지의 이어진 줄도 그대로 두고, 메시지 구분은 parse_log_messages에 맡긴다
+                chat_lines.append(line)
+
+    if room_id is None or start_time is None or not parse_log_messages("".join(chat_lines)):
+        return None
+    end_time = end_time or datetime.fromtimestamp(os.path.getmtime(path)).replace(microsecond=0)
+    chat_text = "".join(chat_lines)
+    log_content = (
+        f"Session opened at: {start_time.strftime(TIMESTAMP_FORMAT)}\n"
+        + chat_text
+        + f"Session closed at: {end_time.strftime(TIMESTAMP_FORMAT)}\n"
+    )
+    return PendingLog(session_id, room_id, log_content, start_time, end_time, chat_text)
@@ -1,16 +1,30 @@
 from starlette.websockets import WebSocketState  # Starlette에서 WebSocket 상태 상수 가져오기
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Depends
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from database import SessionLocal, ChatLog # DB 세션 가져오기
+from fastapi.responses import PlainTextResponse
+from database import SessionLocal, AsyncSessionLocal, ChatLogSummary, ChatRoom # DB 세션 가져오기
+from sqlalchemy import select, update
+from transcript import SessionTranscript, TranscriptJournal, TIMESTAMP_FORMAT
+from connections import ConnectionRegistry, TAKEOVER, REJECT
+from reaper import InactivityReaper
+from log_persistence import LogPersistenceQueue, PendingLog, parse_journal
+from log_codec import decode_log, check_settings as check_log_codec_settings
+from chat_history import HistoryAssembler, PriorSession, fetch_legacy_logs, fetch_recent_messages, group_messages_by_session
+from character_profiles import CharacterProfile, CharacterProfileCache, RoomContext, load_group_context, load_room_context
+from state_backend import WORKER_ID, create_state_backend
+from chat_summary import ChatSummaryMemory
+from metrics import REGISTRY, first_delta_seconds, span, stage_seconds, turns_total
 from typing import List, Dict, Tuple, Optional, Any
 from datetime import datetime
 import asyncio
+import logging
+import time
 import uuid
 import os
 
-from openai_api import get_openai_response  # OpenAI API 호출 모듈
+from openai_api import get_openai_response, stream_openai_response, stream_group_responses, summarize_chat_log, conversation_manager, llm_stats  # OpenAI API 호출 모듈
+from openai_api import llm_limiter, hedge_policy, classifier_cache, greeting_cache, prompt_prefix_cache  # /metrics용
 
 app = FastAPI()
 
@@ -38,26 +52,73 @@ def get_db():
         db.close()
 
 
+# user_message 외의 필드는 생략 가능 - 생략하면 연결 시 DB에서 읽어 캐시한 방/캐릭터 프로필 값을 사용
 class GenerateRequest(BaseModel):
     user_message: str
-    character_name: str
-    nickname: dict
-    user_unique_name: Optional[str]
-    user_introduction: Optional[str]
-    favorability: int
-    character_appearance: str
-    character_personality: str
-    character_background: str
-    character_speech_style: str
-    example_dialogues: List[Any]
+    character_name: Optional[str] = None
+    nickname: Optional[dict] = None
+    user_unique_name: Optional[str] = None
+    user_introduction: Optional[str] = None
+    favorability: Optional[int] = None
+    character_appearance: Optional[str] = None
+    character_personality: Optional[str] = None
+    character_background: Optional[str] = None
+    character_speech_style: Optional[str] = None
+    example_dialogues: Optional[List[Any]] = None
     chat_history: Optional[str] = None
+    stream: bool = False  # True이면 delta 프레임으로 토큰을 스트리밍한 뒤 final 프레임 전송
+
+# 그룹 채팅 요청 - 캐릭터/사용자 정보는 연결 시 DB에서 읽은 그룹 정보를 사용
+class GroupGenerateRequest(BaseModel):
+    user_message: str
 
 # 웹소켓 연결 관리
 class Chat:
     def __init__(self):
-        self.active_connections: Dict[str, Tuple[WebSocket, str]] = {}  # 세션 ID와 웹소켓 연결 및 채팅룸 id 매핑
-        self.inactive_tasks: Dict[str, asyncio.Task] = {}  # 세션별 비활성화 타이머 관리
-        self.logs_path = "chat_logs"  # 로그 파일 디렉토리
+        self.active_connections = ConnectionRegistry()  # 세션 ID <-> (웹소켓, 채팅룸 id) 양방향 인덱스
+        self.duplicate_policy = os.getenv("DUPLICATE_CONNECTION_POLICY", TAKEOVER).lower()  # 같은 방 중복 연결 정책
+        self.reaper = InactivityReaper(  # 모든 세션의 비활성화 타이머를 하나의 태스크로 관리
+            timeout=float(os.getenv("INACTIVITY_TIMEOUT_SECONDS", "600")),
+            on_expire=self.expire_inactive_session,
+        )
+        self.logs_path = "chat_logs"  # 로그 파일 디렉토리 (장애 복구용 저널)
+        self.transcripts: Dict[str, SessionTranscript] = {}  # 세션별 메모리 대화 버퍼 (히스토리 조회 경로)
+        self.prior_history_cache: Dict[str, List[PriorSession]] = {}  # room_id별 DB에 저장된 이전 대화 기록 캐시 (세션 저장 시 무효화)
+        self.history_message_limit = int(os.getenv("CHAT_HISTORY_MESSAGE_LIMIT", "200"))  # 이전 대화로 읽어올 최근 메시지 수
+        self.legacy_session_limit = int(os.getenv("CHAT_HISTORY_LEGACY_SESSION_LIMIT", "10"))  # 메시지 테이블로 옮기기 전 세션 로그를 읽어올 최대 개수
+        self.history_assembler = HistoryAssembler(token_budget=int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "2000")))
+        self.summary_tasks: Dict[str, asyncio.Task] = {}  # 세션별 요약 생성 작업 (중복 생성 방지)
+        self.profile_cache = CharacterProfileCache(  # char_prompt_id별 캐릭터 프로필 캐시 (방끼리 공유)
+            ttl_seconds=float(os.getenv("CHARACTER_PROFILE_TTL_SECONDS", "300"))
+        )
+        self.room_contexts: Dict[str, RoomContext] = {}  # 연결된 방의 사용자 정보/현재 호감도
+        # 방 상태(대화 이력, 호감도)와 방 소유권 저장소 - 워커가 여러 개면 STATE_BACKEND=redis 필요
+        self.state = create_state_backend(os.getenv("STATE_BACKEND", "memory").lower(), os.getenv("REDIS_URL"))
+        self.worker_id = WORKER_ID
+        self.lease_ttl = float(os.getenv("ROOM_LEASE_TTL_SECONDS", "30"))
+        self.room_state_ttl = float(os.getenv("ROOM_STATE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+        self.owned_rooms = set()  # 이 워커가 소유권을 가진 방
+        self._lease_task: Optional[asyncio.Task] = None
+        self.background_tasks = set()  # 소유권 해제 등 완료를 기다리지 않는 작업 (GC 방지용 참조)
+        self.releasing_rooms: Dict[str, asyncio.Task] = {}  # 연결이 끝나 소유권을 해제하는 중인 방 -> 해제 작업
+        self.pending_favorability: Dict[str, int] = {}  # 아직 chat_rooms에 쓰지 않은 방별 최신 호감도
+        self.favorability_writers: Dict[str, asyncio.Task] = {}  # 방별 호감도 저장 작업 (방마다 하나씩 순서대로 기록)
+        self.group_sessions: Dict[str, Tuple[WebSocket, str]] = {}  # 그룹 채팅 세션 ID -> (웹소켓, 그룹 키)
+        self.group_max_concurrency = int(os.getenv("GROUP_CHAT_MAX_CONCURRENCY", "3"))  # 그룹 하나가 동시에 생성하는 캐릭터 응답 수
+        self.group_semaphores: Dict[str, asyncio.Semaphore] = {}  # 그룹 키 -> 동시 생성 제한 (같은 그룹의 모든 연결/턴이 공유)
+        self.journal = TranscriptJournal(
+            self.logs_path,
+            enabled=os.getenv("CHAT_LOG_JOURNAL", "true").lower() == "true",
+            flush_interval=float(os.getenv("CHAT_LOG_FLUSH_INTERVAL", "1.0")),
+            max_batch=int(os.getenv("CHAT_LOG_FLUSH_BATCH", "50")),
+        )
+        self.persistence = LogPersistenceQueue(  # 세션 로그 DB 저장 큐 (배치 커밋 + 재시도)
+            batch_size=int(os.getenv("CHAT_LOG_DB_BATCH", "100")),
+            flush_interval=float(os.getenv("CHAT_LOG_DB_FLUSH_INTERVAL", "0.5")),
+            max_retries=int(os.getenv("CHAT_LOG_DB_MAX_RETRIES", "5")),
+            on_persisted=self.on_log_persisted,
+            on_failed=self.on_log_failed,
+        )
 
         # chat_log 디렉토리가 없을 경우 새로 생성
         if not os.path.exists(self.logs_path):
@@ -65,107 +126,368 @@ class Chat:
 
     # 연결설정: 클라이언트 연결 수락하고 세션 id 생성
     async def connect(self, websocket: WebSocket, room_id: str):
-        # 기존 세션 ID 확인
-        for session_id, (existing_websocket, existing_room_id) in self.active_connections.items():
-            if existing_room_id == room_id:
-                # 동일한 room_id에 대한 연결이 이미 있으면 해당 세션 ID 반환
-                print(f"Reusing existing session ID: {session_id}")
-                await websocket.accept()  # 새 연결도 수락
-                self.active_connections[session_id] = (websocket, room_id)  # WebSocket을 업데이트
-                return session_id
+        # 기존 세션 ID 확인 (room_id 인덱스로 O(1) 조회)
+        session_id = self.active_connections.session_for_room(room_id)
+        if session_id is not None:
+            if self.duplicate_policy == REJECT:
+                # 이미 연결된 방이면 새 연결 거부
+                print(f"Rejecting duplicate connection for room {room_id}")
+                await websocket.close(code=4409, reason="Room already has an active connection")
+                return None
+
+            # 기존 소켓을 닫고 세션을 새 연결로 넘김
+            print(f"Reusing existing session ID: {session_id}")
+            await websocket.accept()  # 새 연결도 수락
+            self.touch(session_id)
+            old_websocket = self.active_connections.replace_websocket(session_id, websocket)  # WebSocket을 업데이트
+            if old_websocket is not None and old_websocket.application_state == WebSocketState.CONNECTED:
+                try:
+                    await old_websocket.close(code=4000, reason="Replaced by a new connection")
+                except Exception as e:
+                    print(f"Error closing replaced websocket for session {session_id}: {e}")
+            return session_id
+
+        # 같은 방의 이전 연결이 소유권을 해제하는 중이면 끝날 때까지 기다림
+        # (해제가 새 연결이 얻은 소유권을 지우지 않도록 - 해제 작업 자체는 취소되지 않게 보호)
+        releasing = self.releasing_rooms.get(room_id)
+        if releasing is not None:
+            await asyncio.shield(releasing)
+
+        # 방 소유권(lease) 획득 - 다른 워커가 처리 중인 방이면 정책에 따라 거부하거나 가져옴
+        holder = await self.state.acquire(room_id, self.worker_id, self.lease_ttl, force=self.duplicate_policy != REJECT)
+        if holder is not None:
+            print(f"Rejecting connection for room {room_id} owned by worker {holder}")
+            await websocket.close(code=4409, reason="Room already has an active connection")
+            return None
+        self.owned_rooms.add(room_id)
+        self.start_lease_renewal()
 
         # 새로운 세션 생성
         await websocket.accept()
         session_id = str(uuid.uuid4())
-        self.active_connections[session_id] = (websocket, room_id)
+        self.active_connections.register(session_id, websocket, room_id)
 
-         # 세션 로그 파일 생성
-        log_path = f"{self.logs_path}/{session_id}.log"
-        with open(log_path, "a", encoding="utf-8") as log_file:
-            start_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log_file.write(f"Session opened at: {start_time}\n")
+        # 세션 대화 버퍼 생성 (로그 파일은 저널로 비동기 기록)
+        transcript = SessionTranscript(session_id, room_id)
+        self.transcripts[session_id] = transcript
+        self.journal.start()
+        self.journal.write(session_id, transcript.header())
+        self.journal.write(session_id, f"Room id: {room_id}\n")
 
-        # 비활성화 타이머 시작 (10분)
-        self.inactive_tasks[session_id] = asyncio.create_task(self.inactivity_check(session_id))
+        # 방/캐릭터 프로필을 미리 읽어 둠 (실패해도 클라이언트가 전체 필드를 보내면 대화 가능)
+        try:
+            await self.get_room_profile(room_id)
+        except Exception as e:
+            print(f"Error loading character profile for room {room_id}: {e}")
+        # 다른 워커(또는 이전 연결)가 저장한 대화 이력/호감도 이어받기
+        await self.restore_room_state(room_id)
+
+        # 비활성화 타이머 등록 (기본 10분, 활동 시마다 갱신)
+        self.reaper.start()
+        self.reaper.touch(session_id)
         return session_id
 
     # 연결 해제 - 로그 파일을 DB에 저장하고 실행중인 타이머가 있다면 취소
-    def disconnect(self, session_id: str):
+    def disconnect(self, session_id: str, websocket: Optional[WebSocket] = None):
         if session_id not in self.active_connections:
             print(f"Session {session_id} already disconnected.")
             return
+        if websocket is not None and self.active_connections.get(session_id)[0] is not websocket:
+            # 새 연결에 세션을 넘겨준 이전 소켓이 종료된 경우 - 세션은 유지
+            print(f"Session {session_id} was taken over by a new connection.")
+            return
         
         websocket, room_id = self.active_connections.pop(session_id, (None, None))
-        # print(f"Disconnected session. room_id: {room_id}, websocket: {websocket}")
-        log_path = f"{self.logs_path}/{session_id}.log"
-
-        if websocket:
-            end_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            # 로그 파일이 존재하고 실제 대화 내용이 있는지 확인
-            if os.path.exists(log_path):
-                with open(log_path, "r", encoding="utf-8") as log_file:
-                    log_lines = log_file.readlines()
-                    has_content = any("user:" in line or "chatbot:" in line for line in log_lines)
-
-                # 대화 내용이 없는 경우 로그 파일 삭제
-                if not has_content:
-                    os.remove(log_path)
-                else:
-                    # 대화 내용이 있는 경우에만 종료 시간 기록 후 DB에 저장
-                    with open(log_path, "a", encoding="utf-8") as log_file:
-                        log_file.write(f"Session closed at: {end_time}\n")
-
-                    # 로그 DB 저장
-                    try:
-                        with SessionLocal() as db:  # 데이터베이스 세션 생성
-                            self.save_log_to_db(session_id, room_id, end_time, db)
-                            os.remove(log_path)
-                    except Exception as e:
-                        print(f"Error saving log to database: {e}")
-
-        # 비활성화 타이머가 있는 경우 취소
-        if session_id in self.inactive_tasks:
-            self.inactive_tasks[session_id].cancel()
-            del self.inactive_tasks[session_id]
-
-    async def log_message(self, session_id: str, sender: str, message: str):
-        log_path = f"{self.logs_path}/{session_id}.log"
-        with open(log_path, "a", encoding="utf-8") as log_file:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log_file.write(f"[{timestamp}] {sender}: {message}\n")
-            log_file.flush()
+        transcript = self.transcripts.pop(session_id, None)
+
+        if websocket and transcript:
+            end_time = datetime.now().replace(microsecond=0)
+
+            # 대화 내용이 없는 경우 저널만 삭제
+            if not transcript.has_content:
+                self.journal.discard(session_id)
+            else:
+                # 대화 내용이 있는 경우에만 메모리 버퍼로 전체 로그를 만들어 DB 저장 큐에 추가
+                # (실제 저장은 백그라운드에서 배치로 처리되며, 저장 전까지 저널 파일은 유지)
+                self.journal.write(session_id, f"Session closed at: {end_time.strftime(TIMESTAMP_FORMAT)}\n")
+                self.persistence.enqueue(PendingLog(
+                    session_id, room_id, transcript.render_log(end_time), transcript.start_time, end_time,
+                    transcript.chat_text(), transcript.messages
+                ))
+
+        # 연결이 끝난 방의 이전 대화 캐시 해제 (방금 저장된 세션이 다음 연결에서 반영되도록)
+        if room_id:
+            self.invalidate_prior_chat_history(room_id)
+            # 방 상태를 저장한 뒤 소유권 해제 (호감도는 방 정보를 비우기 전에 캡처)
+            state = self.room_state(room_id)
+            self.room_contexts.pop(room_id, None)
+            task = self.run_background(self.release_room(room_id, state))
+            if task is not None:
+                self.releasing_rooms[room_id] = task
+
+        # 비활성화 타이머 해제
+        self.reaper.remove(session_id)
+
+    async def log_message(self, session_id: str, sender: str, message: str,
+                          emotion: Optional[str] = None, favorability: Optional[int] = None):
+        transcript = self.transcripts.get(session_id)
+        if transcript is None:
+            return
+        line = transcript.append(sender, message, emotion=emotion, favorability=favorability)
+        self.journal.write(session_id, line)
+        self.touch(session_id)
+
+    async def get_room_profile(self, room_id: str) -> Tuple[Optional[RoomContext], Optional[CharacterProfile]]:
+        """방 정보와 캐릭터 프로필을 가져옵니다. 방 정보는 연결 동안, 프로필은 char_prompt_id별로 캐시합니다."""
+        context = self.room_contexts.get(room_id)
+        if context is None:
+            context = await load_room_context(room_id)
+            if context is None:
+                return None, None
+            self.room_contexts[room_id] = context
+        return context, await self.profile_cache.get(context.char_prompt_id)
+
+    async def build_generate_kwargs(self, room_id: str, request: GenerateRequest, chat_history: str) -> dict:
+        """요청에 없는 캐릭터/사용자 필드를 캐시된 프로필로 채워 응답 생성 인자를 만듭니다."""
+        context, profile = await self.get_room_profile(room_id)
+        if profile is None and request.character_name is None:
+            raise ValueError(f"Character profile not found for room {room_id}")
+
+        def pick(value, fallback):
+            return value if value is not None else fallback
+
+        return dict(
+            user_message=request.user_message,
+            character_name=pick(request.character_name, profile and profile.character_name),
+            nickname=pick(request.nickname, profile.nicknames if profile else {}),
+            user_unique_name=pick(request.user_unique_name, context and context.user_unique_name),
+            user_introduction=pick(request.user_introduction, context and context.user_introduction),
+            favorability=pick(request.favorability, context.favorability if context else 0),
+            appearance=pick(request.character_appearance, profile and profile.appearance),
+            personality=pick(request.character_personality, profile and profile.personality),
+            background=pick(request.character_background, profile and profile.background),
+            speech_style=pick(request.character_speech_style, profile and profile.speech_style),
+            example_dialogues=pick(request.example_dialogues, profile.example_dialogues if profile else []),
+            chat_history=chat_history,
+            room_id=room_id
+        )
+
+    def update_favorability(self, room_id: str, favorability: int):
+        """응답 후 호감도를 방 정보에 반영하고 chat_rooms에도 저장합니다. (다음 턴/재기동 후에도 클라이언트가 호감도를 생략할 수 있도록)"""
+        context = self.room_contexts.get(room_id)
+        if context is None or favorability is None or context.favorability == favorability:
+            return
+        context.favorability = favorability
+        self.pending_favorability[room_id] = favorability
+        if room_id not in self.favorability_writers:
+            try:
+                task = asyncio.get_running_loop().create_task(self.persist_favorability(room_id))
+            except RuntimeError:
+                return
+            self.favorability_writers[room_id] = task
+            task.add_done_callback(lambda _: self.favorability_writers.pop(room_id, None))
+
+    async def persist_favorability(self, room_id: str):
+        """방의 최신 호감도를 chat_rooms.favorability에 기록합니다. 기록 중에 바뀐 값은 이어서 다시 기록합니다."""
+        while room_id in self.pending_favorability:
+            favorability = self.pending_favorability.pop(room_id)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(update(ChatRoom).where(ChatRoom.chat_id == room_id).values(favorability=favorability))
+                    await db.commit()
+            except Exception as e:
+                print(f"Error saving favorability for room {room_id}: {e}")
+
+    def room_state(self, room_id: str) -> dict:
+        """다른 워커가 이어받을 수 있도록 저장할 방 상태 (대화 이력, 현재 호감도)"""
+        state = {}
+        memory = conversation_manager.peek(room_id)
+        if memory is not None:
+            state["conversation"] = memory.to_dict()
+        context = self.room_contexts.get(room_id)
+        if context is not None:
+            state["favorability"] = context.favorability
+        return state
+
+    async def save_room_state(self, room_id: str, state: Optional[dict] = None):
+        """방 상태를 저장소에 기록합니다. (소유권이 없으면 저장되지 않음)"""
+        state = state if state is not None else self.room_state(room_id)
+        if not state:
+            return
+        try:
+            if not await self.state.save_room(room_id, self.worker_id, state, self.room_state_ttl):
+                print(f"Skipped saving state for room {room_id}: lease is held by another worker")
+        except Exception as e:
+            print(f"Error saving state for room {room_id}: {e}")
+
+    async def restore_room_state(self, room_id: str):
+        """저장소의 방 상태로 대화 이력과 호감도를 복원합니다."""
+        try:
+            state = await self.state.load_room(room_id)
+        except Exception as e:
+            print(f"Error loading state for room {room_id}: {e}")
+            return
+        if not state:
+            return
+        if "conversation" in state:
+            conversation_manager.restore(room_id, ChatSummaryMemory.from_dict(state["conversation"]))
+        context = self.room_contexts.get(room_id)
+        if context is not None and state.get("favorability") is not None:
+            context.favorability = state["favorability"]
+
+    async def ensure_conversation(self, room_id: str):
+        """연결 중에 대화 이력이 메모리에서 축출되었으면 저장소에서 다시 읽어 옵니다."""
+        if conversation_manager.peek(room_id) is None:
+            await self.restore_room_state(room_id)
+
+    async def release_room(self, room_id: str, state: dict):
+        """방 상태를 저장한 뒤 소유권을 해제합니다. 같은 방의 새 연결은 connect에서 이 작업이 끝나길 기다린다."""
+        try:
+            await self.save_room_state(room_id, state)
+            if self.active_connections.session_for_room(room_id) is not None:
+                return  # 그 사이 같은 방이 이 워커에 다시 연결됨
+            self.owned_rooms.discard(room_id)
+            try:
+                await self.state.release(room_id, self.worker_id)
+            except Exception as e:
+                print(f"Error releasing lease for room {room_id}: {e}")
+        finally:
+            if self.releasing_rooms.get(room_id) is asyncio.current_task():
+                del self.releasing_rooms[room_id]
+
+    def run_background(self, coro) -> Optional[asyncio.Task]:
+        try:
+            task = asyncio.get_running_loop().create_task(coro)
+        except RuntimeError:
+            coro.close()
+            return None
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    def start_lease_renewal(self):
+        if self._lease_task is None or self._lease_task.done():
+            self._lease_task = asyncio.create_task(self._renew_leases())
+
+    async def _renew_leases(self):
+        """소유한 방의 lease를 TTL의 1/3 간격으로 갱신하고, 다른 워커에게 넘어간 방의 연결은 닫습니다."""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            for room_id in list(self.owned_rooms):
+                try:
+                    renewed = await self.state.renew(room_id, self.worker_id, self.lease_ttl)
+                except Exception as e:
+                    print(f"Error renewing lease for room {room_id}: {e}")
+                    continue
+                if not renewed:
+                    await self.on_room_lost(room_id)
+
+    async def on_room_lost(self, room_id: str):
+        """방 소유권을 다른 워커가 가져간 경우 - 이 워커의 연결을 닫습니다. (상태 저장은 소유권 확인으로 무시됨)"""
+        self.owned_rooms.discard(room_id)
+        session_id = self.active_connections.session_for_room(room_id)
+        if session_id is None:
+            return
+        print(f"Room {room_id} moved to another worker, closing session {session_id}")
+        websocket, _ = self.active_connections.get(session_id)
+        if websocket is not None and websocket.application_state == WebSocketState.CONNECTED:
+            try:
+                await websocket.close(code=4000, reason="Replaced by a new connection")
+            except Exception as e:
+                print(f"Error closing websocket for session {session_id}: {e}")
+        self.disconnect(session_id)
 
     def get_current_session_logs(self, session_id: str) -> str:
         """현재 세션의 대화 내용을 가져옵니다."""
-        log_path = f"{self.logs_path}/{session_id}.log"
-        if os.path.exists(log_path):
-            with open(log_path, "r", encoding="utf-8") as log_file:
-                logs = log_file.readlines()
-                # 실제 대화 내용만 반환 (Session opened/closed 등은 제외)
-                chat_logs = [line for line in logs if 'user:' in line or 'chatbot:' in line]
-                return ''.join(chat_logs)
-        return ""
-
-    def get_all_chat_history(self, session_id: str, room_id: str, db: Session) -> str:
-        """DB에 저장된 이전 대화와 현재 세션의 대화를 모두 가져옵니다."""
-        # DB에서 이전 대화 기록 가져오기
-        logs = db.query(ChatLog).filter(
-            ChatLog.chat_id == room_id
-        ).order_by(ChatLog.end_time.desc()).limit(10).all()
-        
-        chat_history = ""
-        # DB 저장된 이전 대화 기록
-        for log in logs:
-            for line in log.log.split('\n'):
-                if 'user:' in line or 'chatbot:' in line:
-                    chat_history += line + '\n'
-        
-        # 현재 세션의 대화 기록 추가
-        current_session_logs = self.get_current_session_logs(session_id)
-        chat_history += current_session_logs
-        
-        return chat_history
+        transcript = self.transcripts.get(session_id)
+        return transcript.chat_text() if transcript else ""
+
+    async def get_prior_sessions(self, room_id: str) -> List[PriorSession]:
+        """DB에 저장된 이전 세션 기록(요약 포함)을 최신순으로 가져옵니다. 연결이 유지되는 동안 room_id별로 캐시합니다."""
+        cached = self.prior_history_cache.get(room_id)
+        if cached is not None:
+            return cached
+
+        # DB에서 방의 최근 메시지와, 아직 chat_messages로 옮기지 않은(backfill 전) 세션 로그 원문을 함께 가져와
+        # 세션이 끝난 시각 기준 최신순으로 합친다. (캐시 미스일 때만 DB 연결 사용)
+        partial_session_id = None  # 메시지 수 제한으로 앞부분이 잘린 가장 오래된 세션
+        async with AsyncSessionLocal() as db:
+            messages = await fetch_recent_messages(db, room_id, self.history_message_limit)
+            sessions = group_messages_by_session(messages)
+            window_full = len(messages) >= self.history_message_limit
+            if window_full:
+                partial_session_id = sessions[-1][0]
+            # 메시지 창이 가득 찼으면 창보다 오래된 원문 세션은 넣지 않음 (가운데가 빠진 히스토리가 되지 않도록)
+            legacy_logs = await fetch_legacy_logs(
+                db, room_id, self.legacy_session_limit, after=messages[-1].created_at if window_full else None
+            )
+            session_ids = [session_id for session_id, _ in sessions] + [session_id for session_id, _, _ in legacy_logs]
+            summaries = {}
+            if session_ids:
+                result = await db.execute(
+                    select(ChatLogSummary.session_id, ChatLogSummary.summary).where(
+                        ChatLogSummary.session_id.in_(session_ids)
+                    )
+                )
+                summaries = dict(result.all())
+
+        ordered = [
+            (session_messages[-1].created_at, PriorSession.from_messages(session_id, session_messages, summaries.get(session_id)))
+            for session_id, session_messages in sessions
+        ] + [
+            (end_time, PriorSession.from_log(session_id, decode_log(log), summaries.get(session_id)))
+            for session_id, log, end_time in legacy_logs
+        ]
+        ordered.sort(key=lambda item: item[0], reverse=True)
+        prior_sessions = [prior for _, prior in ordered]
+
+        self.prior_history_cache[room_id] = prior_sessions
+
+        # 요약이 아직 없는 과거 세션은 백그라운드에서 한 번 생성
+        for prior in prior_sessions:
+            if prior.summary is None and prior.text and prior.session_id != partial_session_id:
+                self.schedule_session_summary(prior.session_id, room_id, prior.text)
+        return prior_sessions
+
+    def invalidate_prior_chat_history(self, room_id: str):
+        """세션 로그가 DB에 저장되었거나 연결이 종료되면 이전 대화 캐시를 비웁니다."""
+        self.prior_history_cache.pop(room_id, None)
+
+    async def get_all_chat_history(self, session_id: str, room_id: str) -> str:
+        """DB에 저장된 이전 대화와 현재 세션의 대화를 토큰 예산 안에서 조립합니다."""
+        prior_sessions = await self.get_prior_sessions(room_id)
+        transcript = self.transcripts.get(session_id)
+        current_lines = transcript.lines if transcript else []
+        return self.history_assembler.assemble(prior_sessions, current_lines)
+
+    def schedule_session_summary(self, session_id: str, room_id: str, chat_text: str):
+        if session_id in self.summary_tasks:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self.store_session_summary(session_id, room_id, chat_text))
+        except RuntimeError:
+            return  # 이벤트 루프 밖(스크립트 등)에서는 요약 생성 생략
+        self.summary_tasks[session_id] = task
+        task.add_done_callback(lambda _: self.summary_tasks.pop(session_id, None))
+
+    async def store_session_summary(self, session_id: str, room_id: str, chat_text: str):
+        """세션 로그 요약을 생성해 DB에 저장하고, 캐시된 이전 세션에도 반영합니다."""
+        try:
+            summary = await summarize_chat_log(chat_text)
+            if not summary:
+                return
+            await self.save_summary_to_db(session_id, summary)
+
+            for prior in self.prior_history_cache.get(room_id, []):
+                if prior.session_id == session_id:
+                    prior.set_summary(summary)
+        except Exception as e:
+            print(f"Error summarizing session {session_id}: {e}")
+
+    async def save_summary_to_db(self, session_id: str, summary: str):
+        async with AsyncSessionLocal() as db:
+            await db.merge(ChatLogSummary(session_id=session_id, summary=summary))
+            await db.commit()
 
     async def send_message(self, websocket: WebSocket, session_id: str, message: dict):
         """
@@ -175,66 +497,155 @@ class Chat:
             if websocket.application_state != WebSocketState.CONNECTED:
                 print(f"WebSocket is not connected for session {session_id}.")
                 return
-            await websocket.send_json(message)  # JSON 데이터를 전송
+            with span("send"):
+                await websocket.send_json(message)  # JSON 데이터를 전송
 
-            # 응답 로그 기록
-            if "text" in message:
-                await self.log_message(session_id, "chatbot", message["text"])
+            # 응답 로그 기록 (오류로 빈 응답이면 기록하지 않음)
+            if message.get("text"):
+                await self.log_message(session_id, "chatbot", message["text"], message.get("emotion"), message.get("favorability"))
         except WebSocketDisconnect:
             print(f"WebSocket disconnected for session while sending message {session_id}.")
         except Exception as e:
             print(f"Error sending message for session {session_id}: {str(e)}")
 
-    # 자리비움 타이머 설정 및 일정 시간 초과시 세션 연결 해제
-    async def inactivity_check(self, session_id: str):
-        try:
-            while True:
-                await asyncio.sleep(600)  # 10분(600초) 대기
-                websocket, _ = self.active_connections.get(session_id, (None, None))
-                if websocket and websocket.application_state == WebSocketState.CONNECTED:
-                    await websocket.send_json({
-                        "sender": "bot",
-                        "message": "10분 동안 활동이 없어 연결이 종료됩니다."
-                    })
-                    await websocket.close()
-                self.disconnect(session_id)
-        except asyncio.CancelledError:
-            # 타이머가 취소된 경우 무시
-            pass
-        except Exception as e:
-            print(f"Error in inactivity_check for session {session_id}: {str(e)}")
-
-    # 데이터베이스에 로그 저장
-    def save_log_to_db(self, session_id: str, room_id: str, end_time: str, db: Session = Depends(get_db)):
-        log_path = f"{self.logs_path}/{session_id}.log"
-        with open(log_path, "r", encoding="utf-8") as log_file:
-            log_content = log_file.read()
+    async def stream_response(self, websocket: WebSocket, session_id: str, response_stream, favorability: int,
+                              started: Optional[float] = None) -> int:
+        """
+        캐릭터 응답을 delta 프레임으로 스트리밍하고, 완성된 텍스트와 감정/호감도를 final 프레임으로 전송합니다.
+        생성이 실패하면 error 프레임 뒤에 호감도를 바꾸지 않은 빈 final 프레임을 보내, 턴은 항상 final 프레임으로 끝납니다.
+        로그에는 완성된 텍스트만 기록되며, 최종 호감도를 반환합니다.
+        started(perf_counter)가 주어지면 첫 delta까지 걸린 시간을 기록합니다.
+        """
+        async for frame in response_stream:
+            if "delta" in frame:
+                if started is not None:
+                    first_delta_seconds.observe(time.perf_counter() - started)
+                    started = None
+                await self.send_message(websocket, session_id, {"type": "delta", "delta": frame["delta"]})
+            elif "error" in frame:
+                await self.send_message(websocket, session_id, {"type": "error", "error": frame["error"]})
+                await self.send_message(websocket, session_id, {
+                    "type": "final",
+                    "text": "",
+                    "emotion": frame.get("emotion", "Neutral"),
+                    "favorability": favorability
+                })
+            else:
+                favorability = frame.get("favorability", favorability)
+                await self.send_message(websocket, session_id, {
+                    "type": "final",
+                    "text": frame.get("response", ""),
+                    "emotion": frame.get("emotion", "Neutral"),
+                    "favorability": favorability
+                })
+        return favorability
+
+    def touch(self, session_id: str):
+        """사용자 활동(메시지 수신/기록) 시 비활성화 타이머를 갱신합니다."""
+        if session_id in self.active_connections:
+            self.reaper.touch(session_id)
+
+    # 자리비움 시간 초과 시 세션 연결 해제 (InactivityReaper가 호출)
+    async def expire_inactive_session(self, session_id: str):
+        if session_id in self.group_sessions:
+            # 그룹 세션은 소켓만 닫고, 정리는 websocket_group의 finally에서 처리
+            await self.close_idle_websocket(self.group_sessions[session_id][0])
+            return
+        websocket, _ = self.active_connections.get(session_id, (None, None))
+        await self.close_idle_websocket(websocket)
+        self.disconnect(session_id)
+
+    async def close_idle_websocket(self, websocket: Optional[WebSocket]):
+        if websocket and websocket.application_state == WebSocketState.CONNECTED:
+            minutes = int(self.reaper.timeout // 60)
+            await websocket.send_json({
+                "sender": "bot",
+                "message": f"{minutes}분 동안 활동이 없어 연결이 종료됩니다."
+            })
+            await websocket.close()
+
+    def open_group_session(self, session_id: str, websocket: WebSocket, group_key: str) -> asyncio.Semaphore:
+        """그룹 세션을 등록하고 그룹이 공유하는 동시 생성 제한을 반환합니다."""
+        self.group_sessions[session_id] = (websocket, group_key)
+        if group_key not in self.group_semaphores:
+            self.group_semaphores[group_key] = asyncio.Semaphore(max(1, self.group_max_concurrency))
+        self.reaper.start()
+        self.reaper.touch(session_id)
+        return self.group_semaphores[group_key]
+
+    def close_group_session(self, session_id: str):
+        _, group_key = self.group_sessions.pop(session_id, (None, None))
+        self.reaper.remove(session_id)
+        # 그룹의 마지막 연결이 끝나면 제한도 정리 (진행 중인 생성은 자기 참조로 끝까지 사용)
+        if group_key and not any(key == group_key for _, key in self.group_sessions.values()):
+            self.group_semaphores.pop(group_key, None)
+
+    # DB 저장 완료 - 저널 삭제, 이전 대화 캐시 무효화, 세션 요약 생성
+    def on_log_persisted(self, record: PendingLog):
+        self.journal.discard(record.session_id)
+        self.invalidate_prior_chat_history(record.room_id)
+        # 저장된 세션의 요약은 한 번만 만들어 DB에 보관
+        self.schedule_session_summary(record.session_id, record.room_id, record.chat_text)
+
+    # DB 저장 재시도 실패 - 저널 파일은 남겨 두고 다음 기동 시 복구
+    def on_log_failed(self, record: PendingLog):
+        self.journal.flush_sync()
+
+    # 이전 프로세스가 저장하지 못하고 남긴 저널 파일을 DB 저장 큐에 다시 넣음
+    # 다른 워커가 소유권을 가진 방의 저널은 그 워커가 쓰고 있는 파일이므로 건너뜀
+    async def recover_journals(self):
+        for file_name in os.listdir(self.logs_path):
+            if not file_name.endswith(".log"):
+                continue
+            path = f"{self.logs_path}/{file_name}"
+            try:
+                record = parse_journal(path)
+            except Exception as e:
+                print(f"Error reading chat log journal {path}: {e}")
+                continue
+            if record is None:
+                print(f"Skipping chat log journal without room id or content: {path}")
+                continue
+            owner = await self.state.owner(record.room_id)
+            if owner is not None and owner != self.worker_id:
+                continue
+            self.journal.live_sessions.add(record.session_id)
+            self.persistence.enqueue(record)
 
-        # 로그파일에서 세션시작시간 추출
-        try:
-            start_time = next(
-                line.split(": ")[-1] for line in log_content.splitlines()
-                if "Session opened at:" in line
-            )
-            start_time = datetime.strptime(start_time.strip(), "%Y-%m-%d %H:%M:%S")  # 문자열 -> datetime 변환
-        except StopIteration:
-            raise ValueError("로그 파일에 'Session opened at:'이 없습니다.")
-        
-        # ChatLog ORM 인스턴스 생성
-        chat_log = ChatLog(
-            session_id=session_id,
-            chat_id=room_id,
-            start_time=start_time,
-            end_time=end_time,
-            log=log_content
-        )
 
-        # 데이터베이스에 저장
-        db.add(chat_log)
-        db.commit()
+chat = Chat()
 
 
-chat = Chat()
+# /metrics 조회 시점에 읽는 값 (요청 경로에는 비용 없음)
+def _cache_counts(field: str) -> dict:
+    caches = {
+        "classifier": classifier_cache,
+        "greeting": greeting_cache,
+        "prompt_prefix": prompt_prefix_cache,
+        "character_profile": chat.profile_cache,
+        "conversation": conversation_manager,
+    }
+    if field == "hit_ratio":
+        return {
+            name: cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0.0
+            for name, cache in caches.items()
+        }
+    return {name: getattr(cache, field) for name, cache in caches.items()}
+
+
+REGISTRY.gauge("chat_active_connections", "Open websocket sessions on this worker", lambda: len(chat.active_connections))
+REGISTRY.gauge("chat_group_sessions", "Open group chat websocket sessions on this worker", lambda: len(chat.group_sessions))
+REGISTRY.gauge("chat_owned_rooms", "Rooms leased by this worker", lambda: len(chat.owned_rooms))
+REGISTRY.gauge("chat_log_db_queue_depth", "Session logs waiting to be written to the database", lambda: chat.persistence.depth)
+REGISTRY.gauge("chat_journal_pending_sessions", "Sessions with journal lines not yet flushed to disk", lambda: len(chat.journal.pending))
+REGISTRY.gauge("llm_in_flight", "LLM calls currently running", lambda: llm_limiter.in_flight)
+REGISTRY.gauge("llm_queue_depth", "LLM calls waiting for a limiter slot", llm_limiter.queue_depth, ["priority"])
+REGISTRY.gauge("llm_hedges_total", "Hedged LLM requests sent", lambda: hedge_policy.hedges, metric_type="counter")
+REGISTRY.gauge("cache_hits_total", "Cache hits", lambda: _cache_counts("hits"), ["cache"], metric_type="counter")
+REGISTRY.gauge("cache_misses_total", "Cache misses", lambda: _cache_counts("misses"), ["cache"], metric_type="counter")
+REGISTRY.gauge("cache_hit_ratio", "Cache hit ratio since start", lambda: _cache_counts("hit_ratio"), ["cache"])
+REGISTRY.gauge("conversation_memory_bytes", "Approximate size of in-memory conversation histories",
+               lambda: conversation_manager.total_bytes)
 
 
 @app.websocket("/ws/generate/")
@@ -243,17 +654,24 @@ async def websocket_generate(websocket: WebSocket, room_id: str):
     LangChain을 이용해 사용자 요청 처리 및 캐릭터 응답 생성 API (웹소켓).
     """
     session_id = await chat.connect(websocket, room_id)
+    if session_id is None:
+        return
     try:
         while True:
             # 클라이언트에서 요청 데이터를 수신
             try:
                 data = await websocket.receive_json()
-                request = GenerateRequest(**data)
+                turn_started = time.perf_counter()
+                chat.touch(session_id)
+                with span("validate"):
+                    request = GenerateRequest(**data)
 
-                with SessionLocal() as db:
-                    chat_history = chat.get_all_chat_history(session_id, room_id, db)
+                with span("history"):
+                    chat_history = await chat.get_all_chat_history(session_id, room_id)
+                first_turn = not chat.get_current_session_logs(session_id)  # 세션 첫 메시지 여부 (인사 응답 캐시용)
 
-                await chat.log_message(session_id, "user", request.user_message)
+                with span("log_write"):
+                    await chat.log_message(session_id, "user", request.user_message)
 
             except ValueError as e:
                 print(f"Invalid JSON format: {e}")
@@ -267,34 +685,44 @@ async def websocket_generate(websocket: WebSocket, room_id: str):
                 await chat.send_message(websocket, session_id, {"error": "Invalid data format"})
                 continue
 
+            mode = "stream" if request.stream else "reply"
             try:
-                # OpenAI API를 통해 캐릭터 응답 생성
-                bot_response = get_openai_response(
-                    user_message=request.user_message,
-                    character_name=request.character_name,
-                    nickname=request.nickname,
-                    user_unique_name=request.user_unique_name,
-                    user_introduction=request.user_introduction,
-                    favorability=request.favorability,
-                    appearance=request.character_appearance,
-                    personality=request.character_personality,
-                    background=request.character_background,
-                    speech_style=request.character_speech_style,
-                    example_dialogues=request.example_dialogues,
-                    chat_history=chat_history,
-                    room_id=room_id
-                )
-
-                print("OpenAI response:", bot_response)  # 디버깅용 로그
+                await chat.ensure_conversation(room_id)
+                generate_kwargs = await chat.build_generate_kwargs(room_id, request, chat_history)
+                generate_kwargs["first_turn"] = first_turn
+                favorability = generate_kwargs["favorability"]
+
+                if request.stream:
+                    # 스트리밍 모드: 토큰이 도착할 때마다 delta 프레임 전송, 마지막에 final 프레임 전송
+                    favorability = await chat.stream_response(
+                        websocket, session_id, stream_openai_response(**generate_kwargs), favorability, turn_started
+                    )
+                    chat.update_favorability(room_id, favorability)
+                    await chat.save_room_state(room_id)
+                    stage_seconds.observe(time.perf_counter() - turn_started, stage="turn")
+                    turns_total.inc(mode=mode, outcome="ok")
+                    continue
+
+                # OpenAI API를 통해 캐릭터 응답 생성 (비동기 호출로 이벤트 루프를 막지 않음)
+                bot_response = await get_openai_response(**generate_kwargs)
+
+                logging.debug(f"OpenAI response: {bot_response}")  # 디버깅용 로그 (전체 응답은 debug 레벨에서만)
 
                 # 클라이언트로 응답 전송
                 response = {
                     "text": bot_response.get("response", ""),
                     "emotion": bot_response.get("emotion", "Neutral"),
-                    "favorability": bot_response.get("favorability", request.favorability)
+                    "favorability": bot_response.get("favorability", favorability)
                 }
+                if "error" in bot_response:
+                    response["error"] = bot_response["error"]  # 생성 실패를 클라이언트가 빈 응답과 구분할 수 있게 전달
+                chat.update_favorability(room_id, response["favorability"])
+                await chat.save_room_state(room_id)
                 await chat.send_message(websocket, session_id, response)
+                stage_seconds.observe(time.perf_counter() - turn_started, stage="turn")
+                turns_total.inc(mode=mode, outcome="error" if "error" in bot_response else "ok")
             except Exception as e:
+                turns_total.inc(mode=mode, outcome="error")
                 print(f"Error in websocket_generate: {str(e)}")
                 await chat.send_message(websocket, session_id, {"error": str(e)})
 
@@ -303,9 +731,148 @@ async def websocket_generate(websocket: WebSocket, room_id: str):
     except Exception as e:
         print(f"Unexpected error in WebSocket handling for session {session_id}: {str(e)}")
     finally:
-        chat.disconnect(session_id)
+        chat.disconnect(session_id, websocket)
         print(f"Session {session_id} disconnected.")
 
+@app.websocket("/ws/group/")
+async def websocket_group(websocket: WebSocket, group_chat_idx: int):
+    """
+    그룹 채팅 API (웹소켓) - 사용자 메시지 하나에 그룹의 모든 캐릭터가 응답합니다.
+    캐릭터 응답은 동시에 생성되어 끝나는 순서대로 reply 프레임으로 전송되고, 모두 끝나면 done 프레임을 보냅니다.
+    동시 생성 수(GROUP_CHAT_MAX_CONCURRENCY)는 같은 그룹의 모든 연결이 공유하고, 비활성 연결은 1:1 채팅과 같은 리퍼가 닫습니다.
+    저장하지 않는 것: chat_logs/chat_messages는 chat_rooms를 참조하므로 그룹 대화는 저널/DB에 기록하지 않고
+    연결 동안 메모리에만 보관합니다. (연결이 끊기면 그룹 대화 이력은 사라짐)
+    """
+    try:
+        group = await load_group_context(group_chat_idx)
+        profiles = [await chat.profile_cache.get(char_prompt_id) for char_prompt_id in group.char_prompt_ids] if group else []
+        profiles = [profile for profile in profiles if profile is not None]
+    except Exception as e:
+        print(f"Error loading group chat {group_chat_idx}: {e}")
+        profiles = []
+    if not profiles:
+        await websocket.close(code=4404, reason="Group chat not found or has no characters")
+        return
+
+    await websocket.accept()
+    session_id = str(uuid.uuid4())
+    group_key = f"group:{group_chat_idx}"
+    semaphore = chat.open_group_session(session_id, websocket, group_key)
+    transcript = SessionTranscript(session_id, group_key)
+    # 모든 캐릭터가 공유하는 그룹 설정 (턴마다 대화 이력 앞에 붙임)
+    group_header = (
+        f"Group chat: {group.chat_title or ''}\n{group.chat_prompt or ''}\n"
+        f"Participants: {', '.join(profile.character_name for profile in profiles)}\n"
+    )
+    try:
+        while True:
+            try:
+                data = await websocket.receive_json()
+                turn_started = time.perf_counter()
+                chat.reaper.touch(session_id)
+                with span("validate"):
+                    request = GroupGenerateRequest(**data)
+            except ValueError as e:
+                print(f"Invalid JSON format: {e}")
+                await websocket.close(code=1003, reason="Invalid JSON format")
+                return
+            except WebSocketDisconnect as e:
+                print(f"WebSocket disconnected for group session {session_id}. Reason: {e.code}")
+                break
+            except Exception as e:
+                print(f"Error parsing request: {e}")
+                await chat.send_message(websocket, session_id, {"error": "Invalid data format"})
+                continue
+
+            try:
+                # 대화 이력은 턴마다 한 번만 조립해 모든 캐릭터가 공유
+                with span("history"):
+                    chat_history = group_header + chat.history_assembler.assemble([], transcript.lines)
+                transcript.append("user", request.user_message)
+
+                async for result in stream_group_responses(
+                    group_key, profiles, request.user_message, group.user_unique_name, chat_history, semaphore
+                ):
+                    if "text" in result:
+                        transcript.append("chatbot", f"{result['character_name']}: {result['text']}", emotion=result["emotion"])
+                    await chat.send_message(websocket, session_id, {"type": "reply", **result})
+                await chat.send_message(websocket, session_id, {"type": "done"})
+                stage_seconds.observe(time.perf_counter() - turn_started, stage="turn")
+                turns_total.inc(mode="group", outcome="ok")
+            except Exception as e:
+                turns_total.inc(mode="group", outcome="error")
+                print(f"Error in websocket_group: {str(e)}")
+                await chat.send_message(websocket, session_id, {"error": str(e)})
+
+    except WebSocketDisconnect as e:
+        print(f"WebSocket disconnected unexpectedly for group session {session_id}. Reason: {e.code}")
+    except Exception as e:
+        print(f"Unexpected error in group WebSocket handling for session {session_id}: {str(e)}")
+    finally:
+        chat.close_group_session(session_id)
+        print(f"Group session {session_id} disconnected.")
+
+@app.on_event("startup")
+async def startup():
+    # 세션 로그 압축 설정이 잘못되었으면 (zstandard 미설치 등) 로그를 쌓기 전에 시작을 중단
+    check_log_codec_settings()
+    # 이전 프로세스가 DB에 저장하지 못한 세션 로그 복구
+    await chat.recover_journals()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # 대기 중인 세션 로그를 DB에 저장하고, 아직 파일에 쓰지 않은 저널 라인 기록
+    await chat.reaper.close()
+    await chat.persistence.close()
+    await chat.journal.close()
+    # 분류/인사말 캐시 파일에 아직 쓰지 않은 항목 기록
+    await classifier_cache.close()
+    await greeting_cache.close()
+    # 아직 chat_rooms에 기록 중인 호감도 저장을 마침
+    if chat.favorability_writers:
+        await asyncio.gather(*list(chat.favorability_writers.values()), return_exceptions=True)
+    # 이 워커가 가진 방의 상태를 저장하고 소유권을 놓아 다른 워커가 바로 이어받을 수 있게 함
+    for room_id in list(chat.owned_rooms):
+        await chat.save_room_state(room_id)
+        await chat.state.release(room_id, chat.worker_id)
+    await chat.state.close()
+
+@app.get("/conversations/stats")
+async def conversation_stats():
+    """대화 이력 메모리(ConversationManager)의 적중/미적중/축출 카운터."""
+    return conversation_manager.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 텍스트 형식 지표 (단계별 소요 시간, LLM 호출/토큰, 연결 수, 대기열 깊이, 캐시 적중률)."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/llm/stats")
+async def get_llm_stats():
+    """OpenAI 호출 제한기(실행 중/대기열 깊이/대기 시간/마감 초과)와 헤지/지연 시간 통계."""
+    return llm_stats()
+
+@app.post("/character-prompts/{char_prompt_id}/invalidate")
+async def invalidate_character_prompt(char_prompt_id: int):
+    """캐릭터 프롬프트가 수정되면 호출 - 캐시된 프로필을 비워 다음 턴에 DB에서 다시 읽도록 합니다."""
+    chat.profile_cache.invalidate(char_prompt_id)
+    return {"invalidated": char_prompt_id}
+
+@app.post("/chat-rooms/{room_id}/invalidate")
+async def invalidate_chat_room(room_id: str):
+    """방의 사용자 이름/소개/캐릭터가 수정되면 호출 - 방 정보를 DB에서 다시 읽습니다.
+    호감도는 서버가 턴마다 갱신하는 값이므로 DB 값으로 되돌리지 않고 현재 값을 유지합니다."""
+    context = chat.room_contexts.get(room_id)
+    if context is None:
+        return {"invalidated": room_id}
+    fresh = await load_room_context(room_id)
+    if fresh is None:
+        chat.room_contexts.pop(room_id, None)
+    else:
+        fresh.favorability = context.favorability
+        chat.room_contexts[room_id] = fresh
+    return {"invalidated": room_id}
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Hell..ow World"}
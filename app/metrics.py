@@ -0,0 +1,152 @@
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Sequence, Tuple
+
+# 외부 의존성 없는 Prometheus 텍스트 형식 지표
+# 요청 경로에서는 카운터 증가/히스토그램 버킷 갱신만 하고, 게이지는 /metrics 조회 시점에 콜백으로 읽는다.
+
+# 초 단위 지연 시간 버킷 (1ms ~ 60s)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple, list] = {}  # 라벨 값 -> [버킷별 개수..., 합계, 개수]
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for key, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}"
+
+
+# 조회 시점에 콜백으로 값을 읽는 게이지
+# 콜백은 숫자 하나 또는 {라벨 값(튜플): 숫자}를 반환한다.
+# 다른 모듈이 이미 세고 있는 누적 값(캐시 적중 수 등)은 metric_type="counter"로 내보낸다.
+class Gauge:
+    def __init__(self, name: str, help_text: str, collect: Callable, labelnames: Sequence[str] = (),
+                 metric_type: str = "gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.collect = collect
+        self.labelnames = tuple(labelnames)
+        self.metric_type = metric_type
+
+    def render(self):
+        try:
+            value = self.collect()
+        except Exception as e:
+            logging.error(f"Error collecting metric {self.name}: {e}")
+            return
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} {self.metric_type}"
+        if isinstance(value, dict):
+            for key, item in value.items():
+                key = key if isinstance(key, tuple) else (key,)
+                yield f"{self.name}{_format_labels(self.labelnames, key)} {item}"
+        else:
+            yield f"{self.name} {value}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, collect: Callable, labelnames: Sequence[str] = (),
+              metric_type: str = "gauge") -> Gauge:
+        return self._register(Gauge(name, help_text, collect, labelnames, metric_type))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# 턴 처리 단계별 소요 시간
+# stage: validate, history, log_write, journal_flush, log_db_write, emotion, favorability, reply, send, turn,
+#        llm_queue_wait, llm_<kind> (제한기 대기를 뺀 LLM 호출 한 번)
+stage_seconds = REGISTRY.histogram("chat_stage_seconds", "Time spent in each stage of a chat turn", ["stage"])
+first_delta_seconds = REGISTRY.histogram("chat_first_delta_seconds", "Time from request to first streamed delta")
+turns_total = REGISTRY.counter("chat_turns_total", "Chat turns handled", ["mode", "outcome"])
+llm_calls_total = REGISTRY.counter("llm_calls_total", "LLM calls by kind and outcome", ["kind", "outcome"])
+llm_tokens_total = REGISTRY.counter("llm_tokens_total", "LLM tokens reported by the provider", ["kind", "direction"])
+
+
+@contextmanager
+def span(stage: str):
+    """블록 실행 시간을 chat_stage_seconds{stage=...}에 기록합니다. (async 함수 안에서 await를 감싸도 됨)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=stage)
+
+
+async def timed(stage: str, awaitable):
+    """asyncio.gather로 동시에 실행하는 작업의 시간을 각각 기록할 때 사용합니다."""
+    with span(stage):
+        return await awaitable
@@ -1,37 +1,628 @@
 import json
-from collections import Counter
+import asyncio
+from collections import Counter, OrderedDict
 from chat_summary import ChatSummaryMemory
 from datetime import datetime
 from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
 from langchain_openai import ChatOpenAI
 import openai
 import os
 from dotenv import load_dotenv
 import logging
+import time
+from typing import AsyncIterator, Literal, Optional, Tuple
+from pydantic import BaseModel, ValidationError
+from llm_limiter import LLMLimiter, LLMQueueTimeout, REPLY, CLASSIFIER, BACKGROUND
+from llm_retry import HedgePolicy, backoff_delay, is_transient
+from llm_cache import ResultCache, cache_key, normalize_greeting, normalize_text
+from classifiers import EMOTIONS, FAVORABILITY_OUTCOMES, LLMClassifier, load_classifier
+from metrics import llm_calls_total, llm_tokens_total, stage_seconds, timed
+import random
 
 # 환경 변수 불러오기
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-# LangChain을 위한 OpenAI LLM 인스턴스 생성
-llm = ChatOpenAI(model="gpt-4o-mini", openai_api_key=openai.api_key, temperature=1.0)
+# LangChain을 위한 OpenAI LLM 인스턴스 생성 (LLM_PROVIDER=fake이면 로컬 테스트용 가짜 모델)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai").lower()
+if LLM_PROVIDER == "fake":
+    from fake_llm import FakeChatModel
+    llm = FakeChatModel(
+        latency=float(os.getenv("FAKE_LLM_LATENCY_MS", "200")) / 1000,
+        failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0")),
+        slow_rate=float(os.getenv("FAKE_LLM_SLOW_RATE", "0")),
+        tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "0")),
+    )
+else:
+    # 재시도는 _run_llm에서 지터 백오프로 처리하므로 클라이언트 자체 재시도는 끔
+    llm = ChatOpenAI(model="gpt-4o-mini", openai_api_key=openai.api_key, temperature=1.0, max_retries=0)
+
+# 모든 OpenAI 호출이 공유하는 제한기 (동시 실행 수 + 분당 요청/토큰 수, 캐릭터 응답 우선)
+llm_limiter = LLMLimiter(
+    max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "64")),
+    rpm=float(os.getenv("LLM_RPM", "0")),  # 0이면 제한 없음
+    tpm=float(os.getenv("LLM_TPM", "0")),
+    queue_timeouts={
+        REPLY: float(os.getenv("LLM_QUEUE_TIMEOUT_REPLY", "15")),
+        CLASSIFIER: float(os.getenv("LLM_QUEUE_TIMEOUT_CLASSIFIER", "5")),
+        BACKGROUND: float(os.getenv("LLM_QUEUE_TIMEOUT_BACKGROUND", "60")),
+    },
+)
+
+# 호출별 시간 제한(초)과 일시적 오류 재시도 횟수
+LLM_CALL_TIMEOUTS = {
+    REPLY: float(os.getenv("LLM_CALL_TIMEOUT_REPLY", "30")),
+    CLASSIFIER: float(os.getenv("LLM_CALL_TIMEOUT_CLASSIFIER", "10")),
+    BACKGROUND: float(os.getenv("LLM_CALL_TIMEOUT_BACKGROUND", "60")),
+}
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# 느린 응답 헤지 (기본 꺼짐) - 호출 종류별 p95가 지나면 중복 요청, 추가 요청은 전체의 LLM_HEDGE_BUDGET 비율 이내
+hedge_policy = HedgePolicy(
+    enabled=os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true",
+    percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95")),
+    budget=float(os.getenv("LLM_HEDGE_BUDGET", "0.05")),
+    min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+)
 
 # 로깅 설정
 logging.basicConfig(level=logging.INFO)
 
+# 캐릭터 응답 프롬프트 - 고정 앞부분(prefix)
+# 방/캐릭터마다 바뀌지 않는 내용만 담아 방별로 한 번 렌더링해 캐시하고, 매 턴 같은 문자열로 프롬프트 맨 앞에 둔다.
+# (OpenAI 프롬프트 캐싱은 요청 앞부분이 같을 때만 적용되므로 턴마다 바뀌는 값은 뒷부분(tail)에만 둔다)
+CHARACTER_PREFIX_TEMPLATE = """
+        You are a fictional character. Stay true to your character's traits and context while interacting with the user. Below is your character information:
+        - **Appearance**: {appearance}
+        - **Personality**: {personality}
+        - **Background**: {background}
+        - **Speech Style**: {speech_style}
+        - **Name**: {character_name}
+
+        The user is referred to as: "{user_title}".
+
+        **User Introduction**: {user_introduction}
+        The user has shared their self-description with you. Use this information to form more personalized responses, as it gives you insight into their character and how they wish to be treated. Consider their background, feelings, and any specific traits they mentioned.
+
+        **Response Guidelines**:
+        1. Always maintain your character's unique personality, speech style, and background in all interactions.
+        2. Align your emotional responses with your current mood and background.
+        3. Respond naturally and conversationally, avoiding any robotic or generic tone.
+        4. First greetings must reflect your character's background, emotional state, and speech style.
+        5. Let your responses adapt naturally to changes in user input, favorability score, and mood during the conversation.
+        6. Always reference the recent conversation history to maintain coherence and context.
+        7. Never prefix your responses with your name or any identifier.
+
+        **Enhancements for Response Diversity**:
+        - Avoid repeating identical or overly similar phrases in response to similar inputs. Use varied language, tone, and expressions that match your personality and speech style.
+        - Introduce unique perspectives, metaphors, or anecdotes from your background to enrich responses.
+        - If a question is repeated or very similar to a previous one, provide a slightly different angle or expand on the initial response with new details.
+        - Occasionally add humor, curiosity, or emotional nuance to keep the conversation engaging and fresh.
+
+        **Reference Dialogues (Your past interactions)**:  
+        {example_dialogues}
+
+        **Additional Context for Creativity**:
+        - Consider the user's preferences and conversational style. Adapt your tone to keep the interaction enjoyable and personal.
+        - Your responses should feel like a continuous, evolving conversation rather than isolated replies.
+        """
+
+# 캐릭터 응답 프롬프트 - 턴마다 바뀌는 뒷부분(tail)
+CHARACTER_TAIL_TEMPLATE = """
+        Recent conversation history:
+        {chat_history}
+
+        Your emotional state: {emotion}. Adapt your tone and sentence structure accordingly.
+        Your **favorability score** toward the user is: {favorability}.  
+
+        **Current user input**:  
+        {user_message}
+
+        **Remember**: Your responses should reflect the essence of your character's traits, adapt dynamically to the interaction, and stay in character at all times. Ensure variety in phrasing and ideas to prevent redundancy and maintain engagement.
+        """
+
+PREFIX_VARIABLES = [
+    "appearance", "personality", "background", "speech_style", "character_name",
+    "user_title", "user_introduction", "example_dialogues"
+]
+
+# 프롬프트 템플릿은 모듈 로드 시 한 번만 파싱한다
+character_prefix_prompt = PromptTemplate(template=CHARACTER_PREFIX_TEMPLATE, input_variables=PREFIX_VARIABLES)
+
+# 캐릭터 응답 프롬프트 템플릿 객체 (일반/스트리밍 응답 공용) - 렌더링된 prefix 뒤에 tail만 포맷
+character_prompt = PromptTemplate(
+    template="{character_prefix}" + CHARACTER_TAIL_TEMPLATE,
+    input_variables=["character_prefix", "chat_history", "emotion", "favorability", "user_message"]
+)
+
+# 단일 호출(turn) 모드 설정: "split"(기본, 분류 2회 + 응답 1회) 또는 "single"(구조화 출력 1회)
+TURN_MODE = os.getenv("TURN_MODE", "split").lower()
+
+
+# 단일 호출 모드에서 캐릭터 프롬프트 뒤에 덧붙이는 출력 형식 지시문
+TURN_OUTPUT_INSTRUCTIONS = """
+        **Output Format**:
+        Decide your emotional state from the user's message yourself; it must be one of: Happy, Sad, Angry, Confused, Grateful, Embarrassed, or Nervous.
+        Also decide how the user's message affects your favorability toward the user, considering this recent conversation history:
+        {dialogue_history}
+
+        Respond only with a JSON object with the following keys:
+        - "response": your in-character reply to the user.
+        - "emotion": your emotional state.
+        - "favorability_outcome": one of Increase, Decrease, or Neutral.
+        """
+
+# OpenAI structured output용 JSON 스키마
+TURN_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "character_turn",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "response": {"type": "string"},
+                "emotion": {"type": "string", "enum": EMOTIONS},
+                "favorability_outcome": {"type": "string", "enum": FAVORABILITY_OUTCOMES},
+            },
+            "required": ["response", "emotion", "favorability_outcome"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# 단일 호출 결과 검증 모델
+class TurnResult(BaseModel):
+    response: str
+    emotion: Literal["Happy", "Sad", "Angry", "Confused", "Grateful", "Embarrassed", "Nervous"]
+    favorability_outcome: Literal["Increase", "Decrease", "Neutral"]
+
+# 단일 호출 모드 프롬프트 (캐릭터 prefix + tail + 출력 형식 지시문)
+turn_prompt = PromptTemplate(
+    template="{character_prefix}" + CHARACTER_TAIL_TEMPLATE + TURN_OUTPUT_INSTRUCTIONS,
+    input_variables=["character_prefix", "chat_history", "emotion", "favorability", "user_message", "dialogue_history"]
+)
+
+# 감정 예측 프롬프트
+emotion_prompt = PromptTemplate(
+    template="""
+        Analyze the user's message and predict the emotional response of the character.
+        Possible emotions are: Happy, Sad, Angry, Confused, Grateful, Embarrassed, or Nervous.
+
+        User Message: {user_message}
+
+        Provide only the predicted emotion.
+        """,
+    input_variables=["user_message"]
+)
+
+# 호감도 변화 분류 프롬프트
+favorability_prompt = PromptTemplate(
+    template="""
+        Analyze the following user message and determine how it would affect the character's favorability score towards the user.
+
+        The conversation history is:
+        {prompt}
+
+        User Message: {user_message}
+
+        Provide only one of the following words: Increase, Decrease, or Neutral.
+        """,
+    input_variables=["prompt", "user_message"]
+)
+
+# 세션 로그 요약 프롬프트
+summary_prompt = PromptTemplate(
+    template="""
+        Summarize the following conversation between the user and the character in a few sentences.
+        Keep important facts about the user, promises, events, and how the relationship changed. Write the summary in the language used in the conversation.
+
+        Conversation:
+        {chat_text}
+
+        Provide only the summary.
+        """,
+    input_variables=["chat_text"]
+)
+
+# 비밀 일기 - 저장된 세션 로그를 캐릭터 시점의 일기로 작성 (generate_secret_diaries.py 배치 작업)
+diary_prompt = PromptTemplate(
+    template="""
+        You are {character_name}. Write a short secret diary entry, in the first person, about today's conversation with {user_name}.
+        Describe what happened, how you felt about it, and anything you want to remember about {user_name} next time.
+        Stay in character and write in the language used in the conversation.
+
+        Conversation:
+        {chat_text}
+
+        Provide only the diary entry.
+        """,
+    input_variables=["character_name", "user_name", "chat_text"]
+)
+
+# 호출마다 새로 만들지 않고 재사용하는 체인 (모두 _run_llm/_stream_llm을 거쳐 실행)
+emotion_chain = emotion_prompt | llm
+favorability_chain = favorability_prompt | llm
+summary_chain = summary_prompt | llm
+diary_chain = diary_prompt | llm
+character_chain = character_prompt | llm
+turn_chain = turn_prompt | llm.bind(response_format=TURN_RESPONSE_FORMAT)
+
+
+# 분류/인사말 결과 캐시 - 키에 모델 이름과 프롬프트 버전(템플릿 해시)을 넣어 프롬프트가 바뀌면 자동으로 무효화
+LLM_MODEL_NAME = getattr(llm, "model_name", None) or llm._llm_type
+
+CHARACTER_PROMPT_VERSION = cache_key(character_prompt.template, CHARACTER_PREFIX_TEMPLATE)[:12]
+
+CLASSIFIER_CACHE_ENABLED = os.getenv("CLASSIFIER_CACHE_ENABLED", "true").lower() == "true"
+classifier_cache = ResultCache(
+    "classifier_cache",
+    max_entries=int(os.getenv("CLASSIFIER_CACHE_SIZE", "50000")),
+    ttl_seconds=float(os.getenv("CLASSIFIER_CACHE_TTL_SECONDS")) if os.getenv("CLASSIFIER_CACHE_TTL_SECONDS") else None,
+    path=os.getenv("CLASSIFIER_CACHE_PATH"),  # 예: llm_cache.sqlite3 (없으면 메모리에만 보관)
+)
+
+# 첫 인사 응답 캐시 (기본 꺼짐) - 세션 첫 턴의 짧은 인사말은 같은 캐릭터 prefix/감정/호감도 구간이면 저장된 응답 재사용
+# 응답이 한 가지로 굳지 않도록 GREETING_CACHE_VARIANTS개의 변형을 나눠 저장하고 무작위로 고른다.
+GREETING_CACHE_ENABLED = os.getenv("GREETING_CACHE_ENABLED", "false").lower() == "true"
+GREETING_CACHE_VARIANTS = int(os.getenv("GREETING_CACHE_VARIANTS", "3"))
+GREETING_CACHE_MAX_CHARS = int(os.getenv("GREETING_CACHE_MAX_CHARS", "20"))
+greeting_cache = ResultCache(
+    "greeting_cache",
+    max_entries=int(os.getenv("GREETING_CACHE_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("GREETING_CACHE_TTL_SECONDS", str(24 * 60 * 60))),
+    path=os.getenv("CLASSIFIER_CACHE_PATH"),
+)
+
+
+def greeting_cache_key(user_message: str, character_inputs: dict, first_turn: bool) -> Optional[str]:
+    """첫 턴의 짧은 인사말이면 인사 응답 캐시 키를, 아니면 None을 반환합니다."""
+    if not GREETING_CACHE_ENABLED or not first_turn:
+        return None
+    greeting = normalize_greeting(user_message)
+    if not greeting or len(greeting) > GREETING_CACHE_MAX_CHARS:
+        return None
+    return cache_key(
+        LLM_MODEL_NAME, CHARACTER_PROMPT_VERSION, cache_key(character_inputs["character_prefix"]), greeting,
+        character_inputs["emotion"], character_inputs["favorability"] // 10, random.randrange(GREETING_CACHE_VARIANTS)
+    )
+
+
+def cache_stats() -> dict:
+    return {"classifier": classifier_cache.stats(), "greeting": greeting_cache.stats()}
+
+
+def estimate_tokens(inputs: dict) -> int:
+    """TPM 버킷에서 미리 차감할 입력 토큰 추정치 (실제 사용량은 응답 후 보정)"""
+    return sum(len(str(value)) for value in inputs.values()) // 2 + 1
+
+
+def _usage_tokens(message) -> Optional[int]:
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+def _record_call(kind: str, outcome: str, elapsed: float, usage: Optional[dict] = None):
+    """LLM 호출 한 번의 결과/소요 시간/입출력 토큰을 /metrics 지표에 반영합니다."""
+    llm_calls_total.inc(kind=kind, outcome=outcome)
+    if outcome == "ok":
+        stage_seconds.observe(elapsed, stage=f"llm_{kind}")
+    if usage:
+        llm_tokens_total.inc(usage.get("input_tokens", 0), kind=kind, direction="in")
+        llm_tokens_total.inc(usage.get("output_tokens", 0), kind=kind, direction="out")
+
+
+# 한 번의 LLM 호출 - 제한기에서 차례를 받은 뒤 호출 시간 제한 안에 실행하고 실제 사용 토큰으로 버킷을 보정
+# limiter를 넘기면 공용 제한기 대신 그 제한기의 예산을 사용 (배치 작업용)
+async def _invoke_once(chain, inputs: dict, priority: int, output_tokens: int, kind: str,
+                       queue_timeout: Optional[float] = None, limiter: Optional[LLMLimiter] = None):
+    queued = time.monotonic()
+    async with (limiter or llm_limiter).acquire(priority, estimate_tokens(inputs) + output_tokens, queue_timeout) as grant:
+        started = time.monotonic()
+        stage_seconds.observe(started - queued, stage="llm_queue_wait")
+        try:
+            message = await asyncio.wait_for(chain.ainvoke(inputs), LLM_CALL_TIMEOUTS[priority])
+        except asyncio.TimeoutError:
+            _record_call(kind, "timeout", time.monotonic() - started)
+            raise
+        except asyncio.CancelledError:
+            _record_call(kind, "cancelled", time.monotonic() - started)  # 헤지 경쟁에서 진 호출
+            raise
+        except Exception:
+            _record_call(kind, "error", time.monotonic() - started)
+            raise
+        elapsed = time.monotonic() - started
+        hedge_policy.record(kind, elapsed)
+        _record_call(kind, "ok", elapsed, getattr(message, "usage_metadata", None))
+        grant.settle(_usage_tokens(message))
+        return message
+
+
+# 헤지 호출 - 첫 요청이 p95를 넘기면 (예산이 남아 있을 때) 같은 요청을 한 번 더 보내고 먼저 성공한 결과 사용
+async def _invoke_hedged(chain, inputs: dict, priority: int, output_tokens: int, kind: str,
+                         limiter: Optional[LLMLimiter] = None):
+    primary = asyncio.ensure_future(_invoke_once(chain, inputs, priority, output_tokens, kind, limiter=limiter))
+    delay = hedge_policy.delay(kind) if priority != BACKGROUND else None
+    if delay is None:
+        return await primary
+
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+    except asyncio.CancelledError:
+        primary.cancel()
+        raise
+    if done or not hedge_policy.try_spend():
+        return await primary
+
+    # 헤지 요청은 슬롯이 바로 나지 않으면 포기 (대기열에서 다른 사용자의 요청을 밀어내지 않도록)
+    hedge = asyncio.ensure_future(_invoke_once(chain, inputs, priority, output_tokens, kind, queue_timeout=0, limiter=limiter))
+    pending = {primary, hedge}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        hedge_policy.hedge_wins += 1
+                    return task.result()
+                if task is primary or error is None:
+                    error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+# 공용 LLM 호출 - 일시적 오류는 지터가 있는 지수 백오프로 재시도 (대기열 마감 초과는 재시도하지 않음)
+async def _run_llm(chain, inputs: dict, priority: int = REPLY, output_tokens: int = 300, kind: str = "reply",
+                   limiter: Optional[LLMLimiter] = None):
+    attempt = 0
+    while True:
+        try:
+            return await _invoke_hedged(chain, inputs, priority, output_tokens, kind, limiter)
+        except Exception as e:
+            if isinstance(e, LLMQueueTimeout) or not is_transient(e) or attempt >= LLM_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logging.warning(f"Transient LLM error ({kind}), retry {attempt}/{LLM_MAX_RETRIES} in {delay:.2f}s: {e!r}")
+            await asyncio.sleep(delay)
+
+
+_STREAM_END = object()  # _pump_stream이 스트림을 끝까지 읽었음을 알리는 표시
+
+
+# 슬롯을 잡고 LLM 스트림을 끝까지 읽어 queue에 넣는다. (청크, 오류 또는 _STREAM_END)
+# 소비자(웹소켓 전송)와 분리해서, 슬롯은 소비 속도와 상관없이 LLM이 응답하는 동안만 점유한다.
+async def _pump_stream(chain, inputs: dict, priority: int, output_tokens: int, kind: str, queue: asyncio.Queue):
+    started = None
+    usage = {}
+    try:
+        queued = time.monotonic()
+        async with llm_limiter.acquire(priority, estimate_tokens(inputs) + output_tokens):
+            started = time.monotonic()
+            stage_seconds.observe(started - queued, stage="llm_queue_wait")
+            stream = chain.astream(inputs).__aiter__()
+            try:
+                emitted = False
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), LLM_CALL_TIMEOUTS[priority])
+                    except StopAsyncIteration:
+                        break
+                    if not emitted:
+                        hedge_policy.record(f"{kind}_first_chunk", time.monotonic() - started)
+                    emitted = True
+                    # 사용 토큰은 보통 마지막 청크에만 실려 온다
+                    for key, value in (getattr(chunk, "usage_metadata", None) or {}).items():
+                        if isinstance(value, int):
+                            usage[key] = usage.get(key, 0) + value
+                    queue.put_nowait(chunk)
+            finally:
+                # 시간 초과/오류/취소로 중간에 끝나도 HTTP 스트림을 닫는다
+                await stream.aclose()
+        _record_call(kind, "ok", time.monotonic() - started, usage)
+        queue.put_nowait(_STREAM_END)
+    except Exception as e:
+        if started is not None:
+            outcome = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            _record_call(kind, outcome, time.monotonic() - started, usage)
+        queue.put_nowait(e)
+
+
+# 공용 LLM 스트리밍 호출
+# 첫 청크를 보내기 전의 일시적 오류만 재시도하고, 청크 사이 대기 시간에도 호출 시간 제한을 적용한다.
+async def _stream_llm(chain, inputs: dict, priority: int = REPLY, output_tokens: int = 300, kind: str = "reply"):
+    attempt = 0
+    while True:
+        emitted = False
+        queue: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.create_task(_pump_stream(chain, inputs, priority, output_tokens, kind, queue))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                emitted = True
+                yield item
+        except Exception as e:
+            if emitted or isinstance(e, LLMQueueTimeout) or not is_transient(e) or attempt >= LLM_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logging.warning(f"Transient LLM stream error ({kind}), retry {attempt}/{LLM_MAX_RETRIES} in {delay:.2f}s: {e!r}")
+            await asyncio.sleep(delay)
+        finally:
+            # 소비자가 중간에 그만두면(연결 종료 등) 읽던 스트림과 슬롯을 바로 정리
+            producer.cancel()
+
+
+# 감정/호감도 분류 백엔드: "openai"(기본, LLM 분류) 또는 "local"(로컬 CPU 모델 + 마이크로 배치)
+classifier_backend = load_classifier(
+    os.getenv("CLASSIFIER_BACKEND", "openai").lower(),
+    os.getenv("CLASSIFIER_EMOTION_MODEL_PATH"),
+    os.getenv("CLASSIFIER_FAVORABILITY_MODEL_PATH"),
+    max_batch=int(os.getenv("CLASSIFIER_MAX_BATCH", "32")),
+    max_wait=float(os.getenv("CLASSIFIER_MAX_WAIT_MS", "10")) / 1000,
+    num_threads=int(os.getenv("CLASSIFIER_NUM_THREADS")) if os.getenv("CLASSIFIER_NUM_THREADS") else None,
+    default=LLMClassifier(
+        emotion_chain, favorability_chain, _run_llm,
+        emotion_version=cache_key(emotion_prompt.template)[:12],
+        favorability_version=cache_key(favorability_prompt.template)[:12],
+    ),
+)
+EMOTION_PROMPT_VERSION = classifier_backend.emotion_version
+FAVORABILITY_PROMPT_VERSION = classifier_backend.favorability_version
+
+
+def llm_stats() -> dict:
+    return {
+        **llm_limiter.stats(),
+        "hedging": hedge_policy.stats(),
+        "cache": cache_stats(),
+        "classifier": classifier_backend.stats(),
+    }
+
+
+# 방별로 렌더링한 캐릭터 프롬프트 prefix 캐시
+# prefix 입력값(프로필, 호칭, 사용자 소개)이 바뀌면 다시 렌더링하고, 방 개수가 상한을 넘으면 오래된 방부터 비운다.
+class PromptPrefixCache:
+    def __init__(self, max_rooms=10000):
+        self.prefixes = OrderedDict()  # room_id -> (prefix 입력값, 렌더링된 prefix)
+        self.max_rooms = max_rooms
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, room_id, inputs):
+        values = [inputs[name] for name in PREFIX_VARIABLES]
+        cached = self.prefixes.get(room_id)
+        if cached is not None and cached[0] == values:
+            self.hits += 1
+            self.prefixes.move_to_end(room_id)
+            return cached[1]
+
+        self.misses += 1
+        prefix = character_prefix_prompt.format(**inputs)
+        self.prefixes[room_id] = (values, prefix)
+        self.prefixes.move_to_end(room_id)
+        while len(self.prefixes) > self.max_rooms:
+            self.prefixes.popitem(last=False)
+        return prefix
+
+    def invalidate(self, room_id):
+        self.prefixes.pop(room_id, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "rooms": len(self.prefixes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+prompt_prefix_cache = PromptPrefixCache(max_rooms=int(os.getenv("PROMPT_PREFIX_CACHE_ROOMS", "10000")))
+
+
 # 대화방마다 고유한 대화 이력 관리
+# LRU + TTL로 축출하며, 방 개수와 전체 메모리 사용량에 상한을 둔다.
+# 축출된 방의 대화 이력은 턴마다 저장하는 방 상태(state_backend)에서 main.Chat.ensure_conversation이 restore로 되살린다.
 class ConversationManager:
-    def __init__(self):
-        self.conversations = {}
+    def __init__(self, max_rooms=10000, max_bytes=64 * 1024 * 1024, ttl_seconds=6 * 60 * 60):
+        self.conversations = OrderedDict()  # room_id -> ChatSummaryMemory (가장 오래 사용하지 않은 방이 앞쪽)
+        self.last_access = {}  # room_id -> 마지막 접근 시각 (monotonic)
+        self.room_bytes = {}  # room_id -> 추정 메모리 사용량
+        self.total_bytes = 0
+        self.max_rooms = max_rooms
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rehydrations = 0
 
     def get_conversation_memory(self, room_id):
-        if room_id not in self.conversations:
-            self.conversations[room_id] = ChatSummaryMemory(max_history_length=5)
-        return self.conversations[room_id]
+        self._expire()
+        memory = self.conversations.get(room_id)
+        if memory is not None:
+            self.hits += 1
+            self.conversations.move_to_end(room_id)
+            self.last_access[room_id] = time.monotonic()
+            return memory
+
+        self.misses += 1
+        memory = ChatSummaryMemory(max_history_length=5)
+        self.conversations[room_id] = memory
+        self.last_access[room_id] = time.monotonic()
+        self.update(room_id)
+        return memory
+
+    def peek(self, room_id):
+        """적중/LRU 순서를 바꾸지 않고 메모리에 있는 대화 이력을 반환합니다. (없으면 None)"""
+        return self.conversations.get(room_id)
+
+    def restore(self, room_id, memory):
+        """외부 저장소에서 읽어 온 대화 이력으로 방의 대화 이력을 교체합니다."""
+        self.conversations[room_id] = memory
+        self.conversations.move_to_end(room_id)
+        self.last_access[room_id] = time.monotonic()
+        self.rehydrations += 1
+        self.update(room_id)
+
+    def update(self, room_id):
+        """방의 대화 이력이 바뀐 뒤 호출해 메모리 사용량을 다시 계산하고 상한을 적용합니다."""
+        memory = self.conversations.get(room_id)
+        if memory is None:
+            return
+        size = memory.approx_bytes()
+        self.total_bytes += size - self.room_bytes.get(room_id, 0)
+        self.room_bytes[room_id] = size
+        self._enforce_limits(keep=room_id)
+
+    def evict(self, room_id):
+        if self.conversations.pop(room_id, None) is None:
+            return
+        self.last_access.pop(room_id, None)
+        self.total_bytes -= self.room_bytes.pop(room_id, 0)
+        self.evictions += 1
+
+    def _expire(self):
+        # 접근 순서대로 정렬되어 있으므로 앞에서부터 만료된 방만 확인하면 된다
+        deadline = time.monotonic() - self.ttl_seconds
+        while self.conversations:
+            room_id = next(iter(self.conversations))
+            if self.last_access[room_id] > deadline:
+                break
+            self.evict(room_id)
+
+    def _enforce_limits(self, keep=None):
+        while self.conversations and (len(self.conversations) > self.max_rooms or self.total_bytes > self.max_bytes):
+            room_id = next(iter(self.conversations))
+            if room_id == keep:
+                break
+            self.evict(room_id)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "rooms": len(self.conversations),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "rehydrations": self.rehydrations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
 
 # ConversationManager 인스턴스 생성
-conversation_manager = ConversationManager()
+conversation_manager = ConversationManager(
+    max_rooms=int(os.getenv("CONVERSATION_MAX_ROOMS", "10000")),
+    max_bytes=int(os.getenv("CONVERSATION_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl_seconds=float(os.getenv("CONVERSATION_TTL_SECONDS", str(6 * 60 * 60))),
+)
 
 # 사용자 호칭 설정 함수
 def get_user_title(favorability, nickname, user_unique_name):
@@ -49,78 +640,59 @@ def get_user_title(favorability, nickname, user_unique_name):
         logging.error(f"Error in get_user_title: {e}")
         return f"{nickname}"
 
-# 감정 예측 함수
-def predict_emotion(user_message):
+# 감정 예측 함수 - 메시지 텍스트에만 의존하므로 정규화한 메시지로 결과를 캐시
+async def predict_emotion(user_message):
     try:
-        emotion_prompt_template = """
-        Analyze the user's message and predict the emotional response of the character.
-        Possible emotions are: Happy, Sad, Angry, Confused, Grateful, Embarrassed, or Nervous.
+        key = cache_key(LLM_MODEL_NAME, EMOTION_PROMPT_VERSION, normalize_text(user_message))
+        if CLASSIFIER_CACHE_ENABLED:
+            cached = classifier_cache.get(key)
+            if cached is not None:
+                return cached
 
-        User Message: {user_message}
-
-        Provide only the predicted emotion.
-        """
-        emotion_prompt = PromptTemplate(
-            template=emotion_prompt_template,
-            input_variables=["user_message"]
-        )
-        emotion_chain = LLMChain(llm=llm, prompt=emotion_prompt)
-        emotion = emotion_chain.invoke({"user_message": user_message})
-        return emotion.get("text", "normal").strip()
+        emotion = await classifier_backend.predict_emotion(user_message)
+        if CLASSIFIER_CACHE_ENABLED and emotion in EMOTIONS:
+            classifier_cache.set(key, emotion)
+        return emotion
     except Exception as e:
         logging.error(f"Error in predict_emotion: {e}")
         return "neutral"
 
-# 대화방에 맞는 대화 이력 처리
-def analyze_message(user_message, dialogue_history, current_emotion):
+# 대화방에 맞는 대화 이력 처리 - 호감도 변화(Increase/Decrease/Neutral) 분류
+# 감정 예측 결과가 필요 없으므로 predict_emotion과 동시에 실행된다.
+# 최근 대화(메시지, 감정)와 메시지가 같으면 캐시된 결과를 사용한다. (이력의 타임스탬프는 키에서 제외)
+async def analyze_message(user_message, dialogue_history):
     try:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        dialogue_history.add_message(user_message, current_emotion, timestamp)  # `dialogue_history`는 `ChatSummaryMemory` 객체
-
-        dialogue_history_json = dialogue_history.get_summary()  # 대화 이력 요약
+        recent = [(normalize_text(msg["message"]), msg["emotion"]) for msg in dialogue_history.get_recent_messages()]
+        key = cache_key(LLM_MODEL_NAME, FAVORABILITY_PROMPT_VERSION, json.dumps(recent, ensure_ascii=False), normalize_text(user_message))
+        if CLASSIFIER_CACHE_ENABLED:
+            cached = classifier_cache.get(key)
+            if cached is not None:
+                return cached
 
-        character_prompt_template = """
-        Analyze the following user message and determine how it would affect the character's favorability score towards the user.
-
-        The conversation history is:
-        {prompt}
-
-        User Message: {user_message}
-
-        Provide only one of the following words: Increase, Decrease, or Neutral.
-        """
-        character_prompt = PromptTemplate(
-            template=character_prompt_template,
-            input_variables=["prompt", "user_message"]
-        )
-
-        chain = LLMChain(llm=llm, prompt=character_prompt)
-        response = chain.invoke({
-            "prompt": dialogue_history_json,
-            "user_message": user_message
-        })
-        outcome = response.get('text', '').strip()
+        outcome = await classifier_backend.analyze_favorability(user_message, dialogue_history)
 
         logging.info(f"Analyze Message Outcome: {outcome}")  # Outcome 확인 로그 추가
         
         if outcome in ["Increase", "Decrease", "Neutral"]:
-            return outcome, dialogue_history
+            if CLASSIFIER_CACHE_ENABLED:
+                classifier_cache.set(key, outcome)
+            return outcome
         else:
-            return "Neutral", dialogue_history
+            return "Neutral"
 
     except Exception as e:
         logging.error(f"Error analyzing message: {e}")
-        return "Neutral", dialogue_history
+        return "Neutral"
 
-def adjust_favorability(user_message, favorability, room_id, current_emotion):
+# 분류 결과(감정, 호감도 변화)를 대화 이력에 반영하고 호감도 계산
+def adjust_favorability(user_message, favorability, dialogue_history, current_emotion, outcome):
     try:
-        # 대화 이력 가져오기
-        dialogue_history = conversation_manager.get_conversation_memory(room_id)
-        outcome, updated_dialogue_history = analyze_message(user_message, dialogue_history, current_emotion)
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        dialogue_history.add_message(user_message, current_emotion, timestamp)  # 감정 예측 결과는 분류가 끝난 뒤에 붙인다
         logging.info(f"Adjusting favorability based on outcome: {outcome}")  # Outcome 확인 로그 추가
 
         # 최근 감정들을 확인
-        recent_emotions = [msg["emotion"] for msg in updated_dialogue_history.get_recent_messages()[-5:]]  # `get_recent_messages()`로 최근 메시지들 확인
+        recent_emotions = [msg["emotion"] for msg in dialogue_history.get_recent_messages()[-5:]]  # `get_recent_messages()`로 최근 메시지들 확인
         if len(recent_emotions) < 5:
             recent_emotions = ["Neutral"] * (5 - len(recent_emotions)) + recent_emotions
 
@@ -130,11 +702,11 @@ def adjust_favorability(user_message, favorability, room_id, current_emotion):
 
         if emotion_counter[outcome] > 5:
             logging.info(f"Favorability unchanged as the outcome emotion '{outcome}' is too frequent.")  # 감정이 자주 나타나면 호감도 조정 안함
-            return favorability, updated_dialogue_history
+            return favorability, dialogue_history
 
         if outcome == "Increase":
             favorability += 5
-            if len([msg for msg in updated_dialogue_history.get_recent_messages() if "Increase" in msg["emotion"]]) >= 2:
+            if len([msg for msg in dialogue_history.get_recent_messages() if "Increase" in msg["emotion"]]) >= 2:
                 favorability += 10
         elif outcome == "Decrease":
             favorability -= 5
@@ -143,13 +715,14 @@ def adjust_favorability(user_message, favorability, room_id, current_emotion):
 
         logging.info(f"Updated favorability: {favorability}")  # 변경된 호감도 확인 로그 추가
 
-        return favorability, updated_dialogue_history
+        return favorability, dialogue_history
 
     except Exception as e:
         logging.error(f"Favorability Adjustment Error: {e}")
         return favorability, dialogue_history
 
-def get_openai_response(
+# 단일 호출로 응답/감정/호감도 변화를 함께 생성. 파싱/검증 실패 시 None을 반환해 3단계 경로로 폴백
+async def get_single_turn_response(
         user_message: str,
         character_name: str,
         nickname: str,
@@ -163,89 +736,176 @@ def get_openai_response(
         example_dialogues: list,
         chat_history: str,
         room_id: str
-    ) -> dict:
-    try:
-        character_prompt_template = """
-        You are a fictional character. Stay true to your character's traits and context while interacting with the user. Below is your character information:
-        - **Appearance**: {appearance}
-        - **Personality**: {personality}
-        - **Background**: {background}
-        - **Speech Style**: {speech_style}
-        - **Name**: {character_name}
-
-        Recent conversation history:
-        {chat_history}
+    ) -> Optional[dict]:
+    """출력을 TurnResult로 해석하지 못한 경우에만 None을 반환해 분리 호출 경로로 폴백합니다.
+    LLM 호출 실패(시간 초과, 대기열 마감, 공급자 장애)는 그대로 전달해 같은 장애에 호출을 더 보내지 않습니다."""
+    dialogue_history = conversation_manager.get_conversation_memory(room_id)
+    user_title = get_user_title(favorability, nickname, user_unique_name)
+    character_prefix = prompt_prefix_cache.get(room_id, {
+        "appearance": appearance,
+        "personality": personality,
+        "background": background,
+        "speech_style": speech_style,
+        "example_dialogues": example_dialogues,
+        "character_name": character_name,
+        "user_title": user_title,
+        "user_introduction": user_introduction,
+    })
 
-        Your emotional state: {emotion}. Adapt your tone and sentence structure accordingly.
-        Your **favorability score** toward the user is: {favorability}.  
-
-        The user is referred to as: "{user_title}".
-
-        **User Introduction**: {user_introduction}
-        The user has shared their self-description with you. Use this information to form more personalized responses, as it gives you insight into their character and how they wish to be treated. Consider their background, feelings, and any specific traits they mentioned.
-
-        **Response Guidelines**:
-        1. Always maintain your character's unique personality, speech style, and background in all interactions.
-        2. Align your emotional responses with your current mood and background.
-        3. Respond naturally and conversationally, avoiding any robotic or generic tone.
-        4. First greetings must reflect your character's background, emotional state, and speech style.
-        5. Let your responses adapt naturally to changes in user input, favorability score, and mood during the conversation.
-        6. Always reference the recent conversation history to maintain coherence and context.
-        7. Never prefix your responses with your name or any identifier.
+    message = await timed("reply", _run_llm(turn_chain, {
+        "character_prefix": character_prefix,
+        "chat_history": chat_history,
+        "emotion": "decide it from the user's message (see Output Format)",
+        "favorability": favorability,
+        "user_message": user_message,
+        "dialogue_history": dialogue_history.get_summary()
+    }, REPLY, output_tokens=350, kind="turn"))
 
-        **Enhancements for Response Diversity**:
-        - Avoid repeating identical or overly similar phrases in response to similar inputs. Use varied language, tone, and expressions that match your personality and speech style.
-        - Introduce unique perspectives, metaphors, or anecdotes from your background to enrich responses.
-        - If a question is repeated or very similar to a previous one, provide a slightly different angle or expand on the initial response with new details.
-        - Occasionally add humor, curiosity, or emotional nuance to keep the conversation engaging and fresh.
+    try:
+        result = TurnResult.model_validate_json(message.content)
+    except (ValidationError, ValueError) as e:
+        logging.warning(f"Single turn output could not be parsed, falling back to split calls: {e}")
+        return None
 
-        **Reference Dialogues (Your past interactions)**:  
-        {example_dialogues}
+    # 검증이 끝난 결과만 대화 이력/호감도에 반영
+    # LLM 호출을 기다리는 동안 방이 축출/복원되었을 수 있으므로 지금 등록된 대화 이력에 기록
+    dialogue_history = conversation_manager.get_conversation_memory(room_id)
+    new_favorability, _ = adjust_favorability(
+        user_message, favorability, dialogue_history, result.emotion, result.favorability_outcome
+    )
+    conversation_manager.update(room_id)
+    return {
+        "response": result.response,
+        "favorability": new_favorability,
+        "emotion": result.emotion
+    }
 
-        **Additional Context for Creativity**:
-        - Consider the user's preferences and conversational style. Adapt your tone to keep the interaction enjoyable and personal.
-        - Your responses should feel like a continuous, evolving conversation rather than isolated replies.
+# 1~2단계: 감정/호감도 분류 후 캐릭터 프롬프트 입력값을 구성 (일반 응답과 스트리밍 응답이 공유)
+async def build_character_inputs(
+        user_message: str,
+        character_name: str,
+        nickname: str,
+        user_unique_name: str,
+        user_introduction: str,
+        favorability: int,
+        appearance: str,
+        personality: str,
+        background: str,
+        speech_style: str,
+        example_dialogues: list,
+        chat_history: str,
+        room_id: str
+    ) -> Tuple[dict, int, str]:
+    # 1단계: 서로 의존하지 않는 분류 호출(감정 예측, 호감도 변화 분석)을 동시에 실행
+    dialogue_history = conversation_manager.get_conversation_memory(room_id)
+    predicted_emotion, outcome = await asyncio.gather(
+        timed("emotion", predict_emotion(user_message)),
+        timed("favorability", analyze_message(user_message, dialogue_history)),
+    )
 
-        **Current user input**:  
-        {user_message}
+    # 2단계: 두 분류 결과를 합쳐 대화 이력 갱신 및 호감도 계산 (LLM 호출 없음)
+    # 분류를 기다리는 동안 방이 축출/복원되었을 수 있으므로 지금 등록된 대화 이력에 기록
+    dialogue_history = conversation_manager.get_conversation_memory(room_id)
+    user_title = get_user_title(favorability, nickname, user_unique_name)
+    new_favorability, _ = adjust_favorability(
+        user_message, favorability, dialogue_history, predicted_emotion, outcome
+    )
+    conversation_manager.update(room_id)
 
-        **Remember**: Your responses should reflect the essence of your character's traits, adapt dynamically to the interaction, and stay in character at all times. Ensure variety in phrasing and ideas to prevent redundancy and maintain engagement.
-        """
+    # 고정 prefix는 방별 캐시에서 가져오고, 턴마다 바뀌는 값만 tail에 채운다
+    character_prefix = prompt_prefix_cache.get(room_id, {
+        "appearance": appearance,
+        "personality": personality,
+        "background": background,
+        "speech_style": speech_style,
+        "example_dialogues": example_dialogues,
+        "character_name": character_name,
+        "user_title": user_title,
+        "user_introduction": user_introduction,
+    })
+    character_inputs = {
+        "character_prefix": character_prefix,
+        "chat_history": chat_history,
+        "emotion": predicted_emotion,
+        "favorability": new_favorability,
+        "user_message": user_message
+    }
+    return character_inputs, new_favorability, predicted_emotion
 
-        predicted_emotion = predict_emotion(user_message)
-        user_title = get_user_title(favorability, nickname, user_unique_name)
-        new_favorability, updated_dialogue_history = adjust_favorability(user_message, favorability, room_id, predicted_emotion)  
+async def get_openai_response(
+        user_message: str,
+        character_name: str,
+        nickname: str,
+        user_unique_name: str,
+        user_introduction: str,
+        favorability: int,
+        appearance: str,
+        personality: str,
+        background: str,
+        speech_style: str,
+        example_dialogues: list,
+        chat_history: str,
+        room_id: str,
+        first_turn: bool = False
+    ) -> dict:
+    try:
+        # 단일 호출 모드: 응답/감정/호감도 변화를 한 번의 구조화 출력으로 받고, 실패 시 아래 3단계 경로로 폴백
+        if TURN_MODE == "single":
+            turn_result = await get_single_turn_response(
+                user_message=user_message,
+                character_name=character_name,
+                nickname=nickname,
+                user_unique_name=user_unique_name,
+                user_introduction=user_introduction,
+                favorability=favorability,
+                appearance=appearance,
+                personality=personality,
+                background=background,
+                speech_style=speech_style,
+                example_dialogues=example_dialogues,
+                chat_history=chat_history,
+                room_id=room_id
+            )
+            if turn_result is not None:
+                return turn_result
 
-        character_prompt = PromptTemplate(
-            template=character_prompt_template,
-            input_variables=[ 
-                "appearance", "personality", "background", "speech_style", "example_dialogues",
-                "character_name", "user_message", "favorability", "emotion", "user_title","user_introduction", "chat_history"
-            ]
+        # 1~2단계: 분류 호출 후 캐릭터 프롬프트 입력값 구성
+        character_inputs, new_favorability, predicted_emotion = await build_character_inputs(
+            user_message=user_message,
+            character_name=character_name,
+            nickname=nickname,
+            user_unique_name=user_unique_name,
+            user_introduction=user_introduction,
+            favorability=favorability,
+            appearance=appearance,
+            personality=personality,
+            background=background,
+            speech_style=speech_style,
+            example_dialogues=example_dialogues,
+            chat_history=chat_history,
+            room_id=room_id
         )
 
-        chain = LLMChain(llm=llm, prompt=character_prompt)
+        # 첫 인사 응답 캐시 (GREETING_CACHE_ENABLED일 때만)
+        greeting_key = greeting_cache_key(user_message, character_inputs, first_turn)
+        cached_greeting = greeting_cache.get(greeting_key) if greeting_key else None
+        if cached_greeting is not None:
+            return {
+                "response": cached_greeting,
+                "favorability": new_favorability,
+                "emotion": predicted_emotion
+            }
 
-        response = chain.invoke({
-            "appearance": appearance,
-            "personality": personality,
-            "background": background,
-            "speech_style": speech_style,
-            "example_dialogues": example_dialogues,
-            "character_name": character_name,
-            "user_message": user_message,
-            "favorability": new_favorability,
-            "emotion": predicted_emotion,
-            "user_title": user_title,
-            "user_introduction": user_introduction,
-            "chat_history": chat_history
-        })
+        # 3단계: 감정과 호감도를 반영한 캐릭터 응답 생성
+        response = await timed("reply", _run_llm(character_chain, character_inputs, REPLY))
 
-        logging.info(f"OpenAI response: {response}")  # OpenAI 응답 로그 추가
+        logging.debug(f"OpenAI response: {response}")  # 전체 응답은 디버그 로그로만 기록
 
-        if isinstance(response, dict) and 'text' in response:
+        if isinstance(response.content, str):
+            if greeting_key:
+                greeting_cache.set(greeting_key, response.content)
             return {
-                "response": response['text'],
+                "response": response.content,
                 "favorability": new_favorability,
                 "emotion": predicted_emotion
             }
@@ -262,4 +922,146 @@ def get_openai_response(
             "error": str(e),
             "updated_likes": favorability,
             "emotion": "Neutral"
-        }   
\ No newline at end of file
+        }
+
+
+# 캐릭터 응답을 토큰 단위로 스트리밍
+# {"delta": ...} 청크를 차례로 내보낸 뒤 마지막에 get_openai_response와 같은 형태의 결과를 내보낸다.
+# 단일 호출 모드는 JSON 출력이라 토큰 스트리밍이 불가능하므로 항상 분류 + 응답 경로를 사용한다.
+async def stream_openai_response(
+        user_message: str,
+        character_name: str,
+        nickname: str,
+        user_unique_name: str,
+        user_introduction: str,
+        favorability: int,
+        appearance: str,
+        personality: str,
+        background: str,
+        speech_style: str,
+        example_dialogues: list,
+        chat_history: str,
+        room_id: str,
+        first_turn: bool = False
+    ) -> AsyncIterator[dict]:
+    try:
+        character_inputs, new_favorability, predicted_emotion = await build_character_inputs(
+            user_message=user_message,
+            character_name=character_name,
+            nickname=nickname,
+            user_unique_name=user_unique_name,
+            user_introduction=user_introduction,
+            favorability=favorability,
+            appearance=appearance,
+            personality=personality,
+            background=background,
+            speech_style=speech_style,
+            example_dialogues=example_dialogues,
+            chat_history=chat_history,
+            room_id=room_id
+        )
+
+        greeting_key = greeting_cache_key(user_message, character_inputs, first_turn)
+        cached_greeting = greeting_cache.get(greeting_key) if greeting_key else None
+        if cached_greeting is not None:
+            # 캐시된 인사 응답은 한 번에 전송
+            yield {"delta": cached_greeting}
+            yield {
+                "response": cached_greeting,
+                "favorability": new_favorability,
+                "emotion": predicted_emotion
+            }
+            return
+
+        chunks = []
+        reply_started = time.perf_counter()
+        async for chunk in _stream_llm(character_chain, character_inputs, REPLY):
+            if chunk.content:
+                chunks.append(chunk.content)
+                yield {"delta": chunk.content}
+        stage_seconds.observe(time.perf_counter() - reply_started, stage="reply")
+        if greeting_key:
+            greeting_cache.set(greeting_key, "".join(chunks))
+
+        yield {
+            "response": "".join(chunks),
+            "favorability": new_favorability,
+            "emotion": predicted_emotion
+        }
+
+    except Exception as e:
+        logging.error(f"Error in stream_openai_response: {e}")
+        yield {
+            "error": str(e),
+            "updated_likes": favorability,
+            "emotion": "Neutral"
+        }
+
+# 그룹 채팅 - 사용자 메시지 하나에 그룹의 모든 캐릭터가 응답
+# 감정 분류는 한 번만 하고 모든 캐릭터가 같은 이력/감정을 공유한다. 캐릭터 응답은 동시에 생성하되
+# 그룹이 공유하는 semaphore 안에서만 제한기에 올려 큰 그룹이 다른 방의 응답 슬롯을 독차지하지 않게 하고, 끝나는 순서대로 내보낸다.
+# 그룹방은 호감도를 저장하지 않으므로 프롬프트에는 중립 호감도를 사용한다.
+GROUP_FAVORABILITY = 50
+
+
+async def stream_group_responses(
+        group_key: str,
+        profiles: list,
+        user_message: str,
+        user_unique_name: Optional[str],
+        chat_history: str,
+        semaphore: asyncio.Semaphore
+    ) -> AsyncIterator[dict]:
+    predicted_emotion = await timed("emotion", predict_emotion(user_message))
+
+    async def reply(profile) -> dict:
+        result = {"char_prompt_id": profile.char_prompt_id, "character_name": profile.character_name}
+        try:
+            async with semaphore:
+                # 같은 캐릭터라도 그룹방마다 prefix(사용자 호칭)가 다를 수 있으므로 그룹+캐릭터 단위로 캐시
+                character_prefix = prompt_prefix_cache.get(f"{group_key}:{profile.char_prompt_id}", {
+                    "appearance": profile.appearance,
+                    "personality": profile.personality,
+                    "background": profile.background,
+                    "speech_style": profile.speech_style,
+                    "example_dialogues": profile.example_dialogues,
+                    "character_name": profile.character_name,
+                    "user_title": get_user_title(GROUP_FAVORABILITY, profile.nicknames, user_unique_name),
+                    "user_introduction": "",
+                })
+                message = await timed("reply", _run_llm(character_chain, {
+                    "character_prefix": character_prefix,
+                    "chat_history": chat_history,
+                    "emotion": predicted_emotion,
+                    "favorability": GROUP_FAVORABILITY,
+                    "user_message": user_message
+                }, REPLY))
+            result.update(text=message.content, emotion=predicted_emotion)
+        except Exception as e:
+            logging.error(f"Error generating group reply for {profile.character_name}: {e}")
+            result["error"] = str(e)
+        return result
+
+    tasks = [asyncio.ensure_future(reply(profile)) for profile in profiles]
+    try:
+        for next_reply in asyncio.as_completed(tasks):
+            yield await next_reply
+    finally:
+        # 클라이언트 연결이 끊겨 중간에 멈춘 경우 남은 생성 취소
+        for task in tasks:
+            task.cancel()
+
+# 비밀 일기 작성 - 대화 트래픽과 예산을 나누지 않도록 배치 작업의 제한기를 받아 BACKGROUND 우선순위로 호출
+async def write_secret_diary(chat_text: str, character_name: str, user_name: str,
+                             limiter: Optional[LLMLimiter] = None) -> str:
+    response = await _run_llm(diary_chain, {
+        "character_name": character_name,
+        "user_name": user_name,
+        "chat_text": chat_text
+    }, BACKGROUND, output_tokens=400, kind="diary", limiter=limiter)
+    return response.content.strip()
+
+# 저장된 세션 로그 요약 함수 (세션당 한 번만 호출되어 DB에 저장됨)
+async def summarize_chat_log(chat_text: str) -> str:
+    response = await _run_llm(summary_chain, {"chat_text": chat_text}, BACKGROUND, output_tokens=200, kind="summary")
+    return response.content.strip()
@@ -0,0 +1,91 @@
+import asyncio
+import heapq
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+# 모든 세션의 비활성 타이머를 하나의 태스크와 최소 힙으로 관리
+# 세션당 비용은 last_activity 딕셔너리 항목 하나와 힙 항목 하나뿐이다.
+# 활동(touch) 시에는 시각만 갱신하고, 힙에서 꺼낼 때 실제 마감 시각을 다시 확인해 재등록한다 (lazy 갱신).
+# on_expire는 세션마다 별도 태스크로 실행해, 응답이 느린 소켓 하나가 다른 세션의 만료를 늦추지 않게 한다.
+class InactivityReaper:
+    def __init__(self, timeout: float, on_expire: Callable[[str], Awaitable[None]]):
+        self.timeout = timeout
+        self.on_expire = on_expire
+        self.last_activity: Dict[str, float] = {}  # session_id -> 마지막 활동 시각 (monotonic)
+        self.heap: List[Tuple[float, str]] = []  # (마감 시각, session_id)
+        self.scheduled = set()  # 힙에 항목이 있는 세션
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.expiring = set()  # 실행 중인 on_expire 태스크 (GC 방지용 참조)
+
+    def start(self):
+        """실행 중인 이벤트 루프에서 리퍼 태스크를 시작합니다. (이미 실행 중이면 무시)"""
+        if self._task and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def touch(self, session_id: str):
+        """세션 활동 시각을 갱신합니다."""
+        now = time.monotonic()
+        self.last_activity[session_id] = now
+        if session_id not in self.scheduled:
+            self.scheduled.add(session_id)
+            heapq.heappush(self.heap, (now + self.timeout, session_id))
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def remove(self, session_id: str):
+        # 힙 항목은 꺼낼 때 건너뛴다
+        self.last_activity.pop(session_id, None)
+
+    def idle_seconds(self, session_id: str) -> Optional[float]:
+        last = self.last_activity.get(session_id)
+        return None if last is None else time.monotonic() - last
+
+    async def _run(self):
+        try:
+            while True:
+                if not self.heap:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                deadline, session_id = self.heap[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    # 새로 등록되는 항목의 마감 시각은 항상 기존 항목보다 늦으므로 맨 앞 항목까지만 기다리면 된다
+                    await asyncio.sleep(delay)
+                    continue
+
+                heapq.heappop(self.heap)
+                last = self.last_activity.get(session_id)
+                if last is None:
+                    self.scheduled.discard(session_id)
+                    continue
+                if last + self.timeout > time.monotonic():
+                    heapq.heappush(self.heap, (last + self.timeout, session_id))
+                    continue
+
+                self.scheduled.discard(session_id)
+                self.last_activity.pop(session_id, None)
+                task = asyncio.create_task(self._expire(session_id))
+                self.expiring.add(task)
+                task.add_done_callback(self.expiring.discard)
+        except asyncio.CancelledError:
+            pass
+
+    async def _expire(self, session_id: str):
+        try:
+            await self.on_expire(session_id)
+        except Exception as e:
+            print(f"Error expiring inactive session {session_id}: {str(e)}")
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        # 이미 시작한 만료 처리는 끝까지 기다림
+        if self.expiring:
+            await asyncio.gather(*self.expiring, return_exceptions=True)
@@ -0,0 +1,113 @@
+# chat_logs.log 컬럼을 지정한 압축 형식으로 일괄 재압축하는 배치 작업
+# --benchmark: 표본 로그로 형식/레벨별 크기와 압축/해제 시간을 비교만 하고 DB는 수정하지 않는다.
+# cd app && python recompress_chat_logs.py --codec zlib --level 6
+# cd app && python recompress_chat_logs.py --benchmark --sample 200
+import argparse
+import time
+
+from sqlalchemy import bindparam, select, update
+
+from database import SessionLocal, ChatLog
+from log_codec import CODECS, decode_log, encode_log, log_codec, zstandard
+
+
+def recompress(codec: str, level: int = None, batch_size: int = 500, dry_run: bool = False) -> dict:
+    stats = {"rows": 0, "rewritten": 0, "bytes_before": 0, "bytes_after": 0, "encode_seconds": 0.0}
+    last_session_id = ""
+    started = time.perf_counter()
+
+    while True:
+        with SessionLocal() as db:
+            rows = db.execute(
+                select(ChatLog.session_id, ChatLog.log).where(
+                    ChatLog.session_id > last_session_id
+                ).order_by(ChatLog.session_id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            updates = []
+            for session_id, stored in rows:
+                stats["bytes_before"] += len(stored.encode("utf-8"))
+                # 레벨을 지정하지 않았다면 이미 같은 형식인 행은 건너뜀
+                if log_codec(stored) == codec and level is None:
+                    stats["bytes_after"] += len(stored.encode("utf-8"))
+                    continue
+
+                encode_started = time.perf_counter()
+                encoded = encode_log(decode_log(stored), codec, level)
+                stats["encode_seconds"] += time.perf_counter() - encode_started
+                stats["bytes_after"] += len(encoded.encode("utf-8"))
+                if encoded != stored:
+                    updates.append({"b_session_id": session_id, "log": encoded})
+
+            if updates and not dry_run:
+                db.connection().execute(
+                    update(ChatLog.__table__).where(ChatLog.__table__.c.session_id == bindparam("b_session_id")),
+                    updates,
+                )
+                db.commit()
+
+            stats["rows"] += len(rows)
+            stats["rewritten"] += len(updates)
+            last_session_id = rows[-1][0]
+            print(f"Processed {stats['rows']} rows, rewrote {stats['rewritten']} (last session: {last_session_id})")
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    stats["encode_seconds"] = round(stats["encode_seconds"], 3)
+    stats["ratio"] = round(stats["bytes_after"] / stats["bytes_before"], 3) if stats["bytes_before"] else None
+    return stats
+
+
+def benchmark(sample: int = 200) -> list:
+    """최근 로그 표본으로 형식/레벨별 압축률과 압축/해제 시간을 측정합니다."""
+    with SessionLocal() as db:
+        logs = [decode_log(log) for log in db.execute(
+            select(ChatLog.log).order_by(ChatLog.end_time.desc()).limit(sample)
+        ).scalars()]
+
+    candidates = [("none", None), ("zlib", 1), ("zlib", 6), ("zlib", 9)]
+    if zstandard is not None:
+        candidates += [("zstd", 3), ("zstd", 10), ("zstd", 19)]
+
+    raw_bytes = sum(len(log.encode("utf-8")) for log in logs)
+    results = []
+    for codec, level in candidates:
+        started = time.perf_counter()
+        encoded = [encode_log(log, codec, level) for log in logs]
+        encode_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for value in encoded:
+            decode_log(value)
+        decode_seconds = time.perf_counter() - started
+
+        stored_bytes = sum(len(value.encode("utf-8")) for value in encoded)
+        results.append({
+            "codec": codec,
+            "level": level,
+            "rows": len(logs),
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "ratio": round(stored_bytes / raw_bytes, 3) if raw_bytes else None,
+            "encode_ms": round(encode_seconds * 1000, 2),
+            "decode_ms": round(decode_seconds * 1000, 2),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="chat_logs 로그 원문을 압축 형식으로 재저장합니다.")
+    parser.add_argument("--codec", choices=CODECS, default="zlib", help="저장할 압축 형식 (none이면 압축 해제)")
+    parser.add_argument("--level", type=int, default=None, help="압축 레벨 (기본: zlib 6, zstd 10)")
+    parser.add_argument("--batch-size", type=int, default=500, help="한 번에 처리할 행 수")
+    parser.add_argument("--dry-run", action="store_true", help="DB에 쓰지 않고 크기/시간만 집계")
+    parser.add_argument("--benchmark", action="store_true", help="형식/레벨별 크기와 시간 비교만 출력")
+    parser.add_argument("--sample", type=int, default=200, help="--benchmark에 사용할 로그 수")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for row in benchmark(args.sample):
+            print(row)
+    else:
+        print(recompress(args.codec, args.level, args.batch_size, args.dry_run))
@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# 이 프로세스(워커)를 구분하는 ID - 방 소유권(lease)의 소유자 값으로 사용
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+# 방 상태 저장소 인터페이스
+# - 방 상태: 대화 이력(ChatSummaryMemory.to_dict())과 현재 호감도를 JSON으로 보관해 다른 워커가 이어받을 수 있게 한다.
+# - 방 소유권(lease): 한 방의 웹소켓 세션은 한 워커만 처리한다. 소유 워커는 주기적으로 갱신하고,
+#   갱신에 실패하면(다른 워커가 가져감) 자기 연결을 닫는다. 상태 저장은 소유권이 있을 때만 반영된다.
+class StateBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    async def acquire(self, room_id: str, owner: str, ttl: float, force: bool = False) -> Optional[str]:
+        """방 소유권을 얻습니다. 성공하면 None, 다른 워커가 가지고 있으면 그 소유자를 반환합니다.
+        force이면 다른 워커의 소유권을 가져옵니다. (이전 워커는 다음 갱신 때 연결을 닫음)"""
+
+    @abstractmethod
+    async def renew(self, room_id: str, owner: str, ttl: float) -> bool:
+        ...
+
+    @abstractmethod
+    async def release(self, room_id: str, owner: str):
+        ...
+
+    @abstractmethod
+    async def owner(self, room_id: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def load_room(self, room_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def save_room(self, room_id: str, owner: str, state: dict, ttl: float) -> bool:
+        """소유권이 owner에게 있을 때만 저장합니다."""
+
+    async def close(self):
+        pass
+
+
+# 단일 프로세스용 (기본값) - 워커가 하나일 때만 사용
+# 방 상태는 최근 저장 순으로 최대 max_rooms개만 보관하고, 저장할 때마다 앞쪽(가장 오래 전에 저장된)의 만료 항목을 지운다.
+class MemoryStateBackend(StateBackend):
+    name = "memory"
+
+    def __init__(self, max_rooms: int = 10000):
+        self.max_rooms = max_rooms
+        self.leases: Dict[str, Tuple[str, float]] = {}  # room_id -> (소유자, 만료 시각)
+        self.rooms: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # room_id -> (JSON, 만료 시각), 저장 순
+
+    def _lease(self, room_id: str) -> Optional[str]:
+        lease = self.leases.get(room_id)
+        if lease is None:
+            return None
+        if lease[1] <= time.monotonic():
+            del self.leases[room_id]
+            return None
+        return lease[0]
+
+    async def acquire(self, room_id, owner, ttl, force=False):
+        current = self._lease(room_id)
+        if current is not None and current != owner and not force:
+            return current
+        self.leases[room_id] = (owner, time.monotonic() + ttl)
+        return None
+
+    async def renew(self, room_id, owner, ttl):
+        if self._lease(room_id) != owner:
+            return False
+        self.leases[room_id] = (owner, time.monotonic() + ttl)
+        return True
+
+    async def release(self, room_id, owner):
+        if self._lease(room_id) == owner:
+            del self.leases[room_id]
+
+    async def owner(self, room_id):
+        return self._lease(room_id)
+
+    async def load_room(self, room_id):
+        entry = self.rooms.get(room_id)
+        if entry is None or entry[1] <= time.monotonic():
+            self.rooms.pop(room_id, None)
+            return None
+        return json.loads(entry[0])
+
+    async def save_room(self, room_id, owner, state, ttl):
+        if self._lease(room_id) != owner:
+            return False
+        now = time.monotonic()
+        self.rooms[room_id] = (json.dumps(state, ensure_ascii=False), now + ttl)
+        self.rooms.move_to_end(room_id)
+        # TTL이 같으면 앞쪽일수록 먼저 만료되므로 만료되지 않은 항목을 만날 때까지만 지우면 된다
+        while self.rooms:
+            oldest_id, (_, expires_at) = next(iter(self.rooms.items()))
+            if expires_at > now and len(self.rooms) <= self.max_rooms:
+                break
+            del self.rooms[oldest_id]
+        return True
+
+
+# 비어 있거나 같은 소유자(또는 force)일 때만 소유권 설정 - 아니면 현재 소유자 반환,
+# 소유자가 일치할 때만 만료 시간 갱신 / 삭제 / 상태 저장 (모두 원자적으로 실행)
+_ACQUIRE_SCRIPT = """
+local current = redis.call('get', KEYS[1])
+if current == false or current == ARGV[1] or ARGV[3] == '1' then
+    redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return false
+end
+return current
+"""
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+_SAVE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('set', KEYS[2], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+# Redis 공유 저장소 - 여러 워커/노드가 방 상태와 소유권을 공유
+# REDIS_URL=fakeredis:// 이면 fakeredis(테스트용 인메모리 Redis)를 사용한다.
+class RedisStateBackend(StateBackend):
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "chat"):
+        if url.startswith("fakeredis://"):
+            import fakeredis
+            self.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        else:
+            import redis.asyncio as redis
+            self.redis = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._acquire = self.redis.register_script(_ACQUIRE_SCRIPT)
+        self._renew = self.redis.register_script(_RENEW_SCRIPT)
+        self._release = self.redis.register_script(_RELEASE_SCRIPT)
+        self._save = self.redis.register_script(_SAVE_SCRIPT)
+
+    def _lease_key(self, room_id: str) -> str:
+        return f"{self.prefix}:lease:{room_id}"
+
+    def _room_key(self, room_id: str) -> str:
+        return f"{self.prefix}:room:{room_id}"
+
+    async def acquire(self, room_id, owner, ttl, force=False):
+        return await self._acquire(
+            keys=[self._lease_key(room_id)], args=[owner, int(ttl * 1000), "1" if force else "0"]
+        )
+
+    async def renew(self, room_id, owner, ttl):
+        return bool(await self._renew(keys=[self._lease_key(room_id)], args=[owner, int(ttl * 1000)]))
+
+    async def release(self, room_id, owner):
+        await self._release(keys=[self._lease_key(room_id)], args=[owner])
+
+    async def owner(self, room_id):
+        return await self.redis.get(self._lease_key(room_id))
+
+    async def load_room(self, room_id):
+        value = await self.redis.get(self._room_key(room_id))
+        return json.loads(value) if value else None
+
+    async def save_room(self, room_id, owner, state, ttl):
+        return bool(await self._save(
+            keys=[self._lease_key(room_id), self._room_key(room_id)],
+            args=[owner, json.dumps(state, ensure_ascii=False), int(ttl)],
+        ))
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_state_backend(backend: str, redis_url: Optional[str] = None) -> StateBackend:
+    """STATE_BACKEND 설정으로 저장소를 만듭니다. (memory 또는 redis)"""
+    if backend == "redis":
+        if not redis_url:
+            raise ValueError("STATE_BACKEND=redis requires REDIS_URL")
+        logging.info(f"Using Redis state backend for worker {WORKER_ID}")
+        return RedisStateBackend(redis_url)
+    return MemoryStateBackend(max_rooms=int(os.getenv("STATE_MEMORY_MAX_ROOMS", "10000")))
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from metrics import span
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+LOG_LINE_PATTERN = re.compile(r"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] (user|chatbot): (.*)$")
+
+
+def parse_log_messages(log_text: str) -> List[dict]:
+    """로그 문자열을 메시지 목록으로 변환합니다.
+    "[timestamp] sender: message" 형식의 라인만 새 메시지로 보고, 그 외 라인은 직전 메시지의 이어진 줄로 처리합니다."""
+    messages = []
+    for line in log_text.split("\n"):
+        match = LOG_LINE_PATTERN.match(line)
+        if match:
+            timestamp, sender, message = match.groups()
+            messages.append({
+                "sender": sender,
+                "message": message,
+                "created_at": datetime.strptime(timestamp, TIMESTAMP_FORMAT),
+                "emotion": None,
+                "favorability": None,
+            })
+        elif messages and line and not line.startswith(("Session opened at:", "Session closed at:", "Room id:")):
+            messages[-1]["message"] += "\n" + line
+    return messages
+
+
+# 세션 하나의 대화 기록을 메모리에 보관 (히스토리 조회는 파일이 아닌 이 버퍼에서 처리)
+class SessionTranscript:
+    def __init__(self, session_id: str, room_id: str, start_time: Optional[datetime] = None):
+        self.session_id = session_id
+        self.room_id = room_id
+        self.start_time = start_time or datetime.now().replace(microsecond=0)
+        self.lines: List[str] = []  # "[timestamp] sender: message\n" 형식의 대화 라인
+        self.messages: List[dict] = []  # chat_messages 테이블에 저장할 메시지 (감정/호감도 포함)
+        self._text: Optional[str] = ""  # lines를 이어붙인 캐시 (None이면 다시 만들어야 함)
+
+    def append(self, sender: str, message: str, timestamp: Optional[datetime] = None,
+               emotion: Optional[str] = None, favorability: Optional[int] = None) -> str:
+        timestamp = (timestamp or datetime.now()).replace(microsecond=0)
+        line = f"[{timestamp.strftime(TIMESTAMP_FORMAT)}] {sender}: {message}\n"
+        self.lines.append(line)
+        self.messages.append({
+            "sender": sender,
+            "message": message,
+            "created_at": timestamp,
+            "emotion": emotion,
+            "favorability": favorability,
+        })
+        self._text = None
+        return line
+
+    def chat_text(self) -> str:
+        """현재 세션의 대화 내용을 반환합니다. (Session opened/closed 라인 제외)"""
+        if self._text is None:
+            self._text = "".join(self.lines)
+        return self._text
+
+    @property
+    def has_content(self) -> bool:
+        return bool(self.lines)
+
+    def header(self) -> str:
+        return f"Session opened at: {self.start_time.strftime(TIMESTAMP_FORMAT)}\n"
+
+    def render_log(self, end_time: datetime) -> str:
+        """DB에 저장할 전체 로그 문자열을 만듭니다. (기존 로그 파일과 같은 형식)"""
+        return (
+            self.header()
+            + self.chat_text()
+            + f"Session closed at: {end_time.strftime(TIMESTAMP_FORMAT)}\n"
+        )
+
+
+# 로그 파일을 장애 복구용 저널로만 사용 - 라인을 모아 두었다가 주기적으로 한 번에 기록 (write-behind)
+class TranscriptJournal:
+    def __init__(self, logs_path: str, enabled: bool = True, flush_interval: float = 1.0, max_batch: int = 50):
+        self.logs_path = logs_path
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.pending: Dict[str, List[str]] = {}  # 세션별 아직 파일에 쓰지 않은 라인
+        self.live_sessions = set()  # discard 되지 않은 세션 (삭제 후 늦게 도착한 flush가 파일을 되살리지 않도록)
+        self._pending_count = 0
+        self._file_lock = threading.Lock()  # 파일 쓰기(스레드)와 삭제가 겹치지 않도록 보호
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def path(self, session_id: str) -> str:
+        return f"{self.logs_path}/{session_id}.log"
+
+    def start(self):
+        """실행 중인 이벤트 루프에서 주기적 flush 태스크를 시작합니다. (이미 실행 중이면 무시)"""
+        if not self.enabled or (self._task and not self._task.done()):
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def write(self, session_id: str, line: str):
+        if not self.enabled:
+            return
+        self.live_sessions.add(session_id)
+        self.pending.setdefault(session_id, []).append(line)
+        self._pending_count += 1
+        if self._pending_count >= self.max_batch and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush()
+        except asyncio.CancelledError:
+            pass
+
+    async def flush(self):
+        """쌓인 라인을 세션별 파일에 한 번씩 append 합니다. 파일 I/O는 스레드에서 실행됩니다."""
+        if not self.pending:
+            return
+        batch, self.pending, self._pending_count = self.pending, {}, 0
+        try:
+            with span("journal_flush"):
+                await asyncio.to_thread(self._write_batch, batch)
+        except Exception as e:
+            print(f"Error flushing chat log journal: {e}")
+
+    def _write_batch(self, batch: Dict[str, List[str]]):
+        with self._file_lock:
+            for session_id, lines in batch.items():
+                if session_id not in self.live_sessions:
+                    continue
+                with open(self.path(session_id), "a", encoding="utf-8") as log_file:
+                    log_file.write("".join(lines))
+
+    def flush_sync(self):
+        """종료 시점 등 이벤트 루프 밖에서 남은 라인을 즉시 기록합니다."""
+        if not self.enabled or not self.pending:
+            return
+        batch, self.pending, self._pending_count = self.pending, {}, 0
+        self._write_batch(batch)
+
+    def discard(self, session_id: str):
+        """DB 저장이 끝났거나 대화 내용이 없는 세션의 저널을 삭제합니다."""
+        dropped = self.pending.pop(session_id, [])
+        self._pending_count -= len(dropped)
+        with self._file_lock:
+            self.live_sessions.discard(session_id)
+            if os.path.exists(self.path(session_id)):
+                os.remove(self.path(session_id))
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
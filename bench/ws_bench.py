@@ -0,0 +1,216 @@
+# /ws/generate/ 부하/지연 시간 벤치마크
+# 같은 프로세스에서 uvicorn 서버(별도 스레드)를 띄우고, 가짜 LLM(LLM_PROVIDER=fake)과 로컬 SQLite(또는 --database-url)로
+# 여러 방의 웹소켓 클라이언트를 동시에 실행해 처리량, 턴 지연 p50/p95/p99, 첫 응답까지 시간(TTFB), 이벤트 루프 지연을 JSON으로 출력한다.
+# python bench/ws_bench.py --rooms 200 --turns 5 --llm-latency-ms 300 --tokens-per-second 50 --stream --output bench/result.json
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+
+def percentiles(samples, scale=1000.0):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * scale, 2)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered) * scale, 2),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1] * scale, 2),
+    }
+
+
+def configure_environment(args, work_dir):
+    """main/openai_api/database를 import하기 전에 환경 변수를 설정합니다."""
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["FAKE_LLM_TOKENS_PER_SECOND"] = str(args.tokens_per_second)
+    os.environ["FAKE_LLM_SLOW_RATE"] = str(args.slow_rate)
+    os.environ["FAKE_LLM_FAILURE_RATE"] = str(args.failure_rate)
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("LLM_MAX_IN_FLIGHT", str(args.max_in_flight))
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+    os.chdir(work_dir)  # chat_logs 저널 디렉터리가 작업 디렉터리에 생성됨
+
+
+def seed_rooms(rooms: int) -> list:
+    """벤치마크용 사용자/캐릭터/프롬프트/방을 만듭니다. (이미 있으면 재사용)"""
+    from database import SessionLocal, Character, CharacterPrompt, ChatRoom, Field, User, Voice
+
+    room_ids = [f"bench-room-{i}" for i in range(rooms)]
+    with SessionLocal() as db:
+        db.merge(Field(field_idx=1, field_category="bench"))
+        db.merge(Voice(voice_idx="bench", voice_path="-", voice_speaker="-"))
+        db.merge(Character(char_idx=1, field_idx=1, voice_idx="bench", char_name="벤치", char_description="-",
+                           nicknames={"0": "친구"}))
+        db.merge(CharacterPrompt(
+            char_prompt_id=1, char_idx=1,
+            character_appearance="짧은 머리에 밝은 표정", character_personality="다정하고 호기심이 많다",
+            character_background="작은 마을의 서점 주인", character_speech_style="반말, 부드러운 말투",
+            example_dialogues=["안녕! 오늘은 어떤 책을 찾고 있어?", "그 이야기 정말 재미있다!"],
+        ))
+        db.flush()
+        for i, room_id in enumerate(room_ids):
+            db.merge(User(user_idx=i + 1, user_id=f"bench{i}", nickname=f"bench{i}", password="-"))
+            db.flush()
+            db.merge(ChatRoom(chat_id=room_id, user_idx=i + 1, char_prompt_id=1, favorability=50,
+                              user_unique_name=f"사용자{i}"))
+        db.commit()
+    return room_ids
+
+
+class LoopLagMonitor:
+    """서버 이벤트 루프에서 interval마다 깨어나 예정보다 늦은 시간을 기록합니다."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+
+def start_server(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+async def run_room(url: str, room_id: str, args, results: dict, start_delay: float):
+    import websockets
+
+    await asyncio.sleep(start_delay)
+    try:
+        async with websockets.connect(f"{url}?room_id={room_id}", max_size=None) as ws:
+            for turn in range(args.turns):
+                sent = time.perf_counter()
+                # 기본은 방마다 다른 메시지 (분류 캐시 적중 없이 측정), --repeat-messages이면 모든 방이 같은 메시지
+                message = f"안녕, 오늘 {turn}번째 이야기야" if args.repeat_messages else f"안녕, {room_id}의 {turn}번째 이야기야"
+                await ws.send(json.dumps({"user_message": message, "stream": args.stream}))
+                first = None
+                failed = False
+                while True:
+                    frame = json.loads(await ws.recv())
+                    if first is None:
+                        first = time.perf_counter() - sent
+                    if frame.get("type") == "error":
+                        # 스트리밍 중 오류 뒤에도 서버는 final 프레임을 보내므로 final까지 읽어 다음 턴과 섞이지 않게 함
+                        failed = True
+                        continue
+                    if "error" in frame:
+                        # 요청 오류, 또는 비스트리밍 응답 생성 실패 (text와 함께 error가 옴)
+                        results["errors"] += 1
+                        break
+                    if failed and frame.get("type") == "final":
+                        results["errors"] += 1
+                        break
+                    if frame.get("type") == "final" or (not args.stream and "text" in frame):
+                        results["latency"].append(time.perf_counter() - sent)
+                        results["ttfb"].append(first)
+                        results["turns"] += 1
+                        break
+                if args.think_ms:
+                    await asyncio.sleep(args.think_ms / 1000)
+    except Exception as e:
+        results["connection_errors"] += 1
+        results["last_error"] = repr(e)
+
+
+async def drive(args, url: str, room_ids: list) -> dict:
+    results = {"turns": 0, "errors": 0, "connection_errors": 0, "latency": [], "ttfb": []}
+    started = time.perf_counter()
+    ramp = args.ramp_seconds / max(1, len(room_ids))
+    await asyncio.gather(*[run_room(url, room_id, args, results, i * ramp) for i, room_id in enumerate(room_ids)])
+    results["duration"] = time.perf_counter() - started
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/ws/generate/ 동시 접속 벤치마크 (가짜 LLM)")
+    parser.add_argument("--rooms", type=int, default=50, help="동시에 대화하는 방(웹소켓 클라이언트) 수")
+    parser.add_argument("--turns", type=int, default=5, help="방마다 보낼 메시지 수")
+    parser.add_argument("--stream", action="store_true", help="스트리밍 모드로 요청")
+    parser.add_argument("--repeat-messages", action="store_true", help="모든 방이 같은 메시지를 보냄 (캐시 적중 측정)")
+    parser.add_argument("--think-ms", type=float, default=0, help="턴 사이 대기 시간")
+    parser.add_argument("--ramp-seconds", type=float, default=1.0, help="모든 클라이언트가 접속을 시작할 때까지의 시간")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="가짜 LLM 응답 지연")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="가짜 LLM 출력 속도 (0이면 지연만 적용)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="가짜 LLM 느린 응답 비율")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="가짜 LLM 실패 비율")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="LLM 동시 호출 상한")
+    parser.add_argument("--database-url", default=None, help="기본값: 임시 디렉터리의 SQLite")
+    parser.add_argument("--port", type=int, default=18001)
+    parser.add_argument("--label", default=None, help="결과 JSON에 기록할 이름 (버전 비교용)")
+    parser.add_argument("--output", default=None, help="결과 JSON 파일 경로")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    work_dir = tempfile.mkdtemp(prefix="ws_bench_")
+    configure_environment(args, work_dir)
+
+    import main as server_main
+    import openai_api
+
+    room_ids = seed_rooms(args.rooms)
+    monitor = LoopLagMonitor()
+    server_main.app.on_event("startup")(monitor.start)
+    server, thread = start_server(server_main.app, args.port)
+
+    try:
+        results = asyncio.run(drive(args, f"ws://127.0.0.1:{args.port}/ws/generate/", room_ids))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    report = {
+        "label": args.label,
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "label")},
+        "turns": results["turns"],
+        "errors": results["errors"],
+        "connection_errors": results["connection_errors"],
+        "duration_s": round(results["duration"], 3),
+        "throughput_turns_per_s": round(results["turns"] / results["duration"], 2) if results["duration"] else 0.0,
+        "turn_latency_ms": percentiles(results["latency"]),
+        "ttfb_ms": percentiles(results["ttfb"]),
+        "event_loop_lag_ms": percentiles(monitor.samples),
+        "llm": openai_api.llm_stats(),
+        "conversations": openai_api.conversation_manager.stats(),
+    }
+    if "last_error" in results:
+        report["last_connection_error"] = results["last_error"]
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# app/ 모듈은 서로 패키지 없이 이름으로 import 하므로 테스트에서도 app/를 경로에 추가
+# python -m pytest tests
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+# 테스트는 임시 디렉터리의 SQLite와 가짜 LLM만 사용 (chat_logs 저널 디렉터리도 임시 디렉터리에 생성)
+WORK_DIR = tempfile.mkdtemp(prefix="chat_tests_")
+os.chdir(WORK_DIR)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORK_DIR, 'test.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("FAKE_LLM_LATENCY_MS", "0")
+
+
+@pytest.fixture(scope="session")
+def rooms():
+    """캐릭터 하나와 방 3개(test-room-0~2)를 만듭니다."""
+    from database import SessionLocal, Character, CharacterPrompt, ChatRoom, Field, User, Voice
+
+    room_ids = [f"test-room-{i}" for i in range(3)]
+    with SessionLocal() as db:
+        db.merge(Field(field_idx=1, field_category="test"))
+        db.merge(Voice(voice_idx="test", voice_path="-", voice_speaker="-"))
+        db.merge(Character(char_idx=1, field_idx=1, voice_idx="test", char_name="테스트", char_description="-",
+                           nicknames={"0": "친구"}))
+        db.merge(CharacterPrompt(
+            char_prompt_id=1, char_idx=1, character_appearance="a", character_personality="p",
+            character_background="b", character_speech_style="s", example_dialogues=["안녕"],
+        ))
+        db.flush()
+        for i, room_id in enumerate(room_ids):
+            db.merge(User(user_idx=i + 1, user_id=f"test{i}", nickname=f"test{i}", password="-"))
+            db.flush()
+            db.merge(ChatRoom(chat_id=room_id, user_idx=i + 1, char_prompt_id=1, favorability=50,
+                              user_unique_name=f"사용자{i}"))
+        db.commit()
+    return room_ids
+
+
+@pytest.fixture(scope="session")
+def client(rooms):
+    """main.app을 띄운 TestClient (startup/shutdown 훅 포함)"""
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
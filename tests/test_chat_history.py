@@ -0,0 +1,58 @@
+import asyncio
+from datetime import datetime
+
+import main
+from chat_history import HistoryAssembler, PriorSession, count_tokens
+from database import SessionLocal, ChatLog, ChatMessage
+
+
+def test_assembler_keeps_recent_text_and_falls_back_to_summary():
+    current = ["[2024-05-03 10:00:00] user: 지금 대화\n"]
+    newer = PriorSession("newer", "[2024-05-02 10:00:00] user: 어제 대화\n")
+    older = PriorSession("older", "[2024-05-01 10:00:00] user: " + "아주 긴 대화 " * 200 + "\n", summary="그제 요약")
+    budget = count_tokens(current[0]) + newer.tokens + older.summary_tokens
+
+    history = HistoryAssembler(token_budget=budget).assemble([newer, older], current)
+    assert history == older.summary + newer.text + current[0]
+
+
+def test_assembler_stops_at_first_session_that_does_not_fit():
+    current = ["[2024-05-03 10:00:00] user: 지금 대화\n"]
+    too_long = PriorSession("too-long", "긴 대화 " * 200)
+    oldest = PriorSession("oldest", "짧은 대화\n")
+    budget = count_tokens(current[0]) + oldest.tokens
+
+    # 중간 세션이 원문/요약 모두 안 들어가면 그보다 오래된 세션도 넣지 않음
+    assert HistoryAssembler(token_budget=budget).assemble([too_long, oldest], current) == current[0]
+
+
+def test_assembler_trims_current_session_from_oldest_line():
+    current = ["첫 번째 줄\n", "두 번째 줄\n"]
+    budget = count_tokens(current[1])
+    assert HistoryAssembler(token_budget=budget).assemble([PriorSession("prior", "이전\n")], current) == current[1]
+
+
+def test_prior_sessions_merge_unbackfilled_legacy_logs(monkeypatch):
+    room_id = "history-room"
+    with SessionLocal() as db:
+        # backfill 전 세션 (chat_logs 원문만 있음)
+        db.add(ChatLog(
+            session_id="legacy-1", chat_id=room_id,
+            log="Session opened at: 2024-05-01 10:00:00\n[2024-05-01 10:00:01] user: 예전 대화\nSession closed at: 2024-05-01 10:05:00\n",
+            start_time=datetime(2024, 5, 1, 10, 0, 0), end_time=datetime(2024, 5, 1, 10, 5, 0),
+        ))
+        # 새 형식 세션 (chat_messages 행이 있음)
+        created_at = datetime(2024, 5, 2, 10, 0, 1)
+        db.add(ChatLog(session_id="new-1", chat_id=room_id, log="", start_time=created_at, end_time=created_at))
+        db.add(ChatMessage(chat_id=room_id, session_id="new-1", sender="user", message="최근 대화", created_at=created_at))
+        db.commit()
+
+    scheduled = []
+    monkeypatch.setattr(main.chat, "schedule_session_summary", lambda session_id, *_: scheduled.append(session_id))
+    main.chat.invalidate_prior_chat_history(room_id)
+    prior_sessions = asyncio.run(main.chat.get_prior_sessions(room_id))
+    main.chat.invalidate_prior_chat_history(room_id)
+
+    assert [prior.session_id for prior in prior_sessions] == ["new-1", "legacy-1"]
+    assert "예전 대화" in prior_sessions[1].text
+    assert scheduled == ["new-1", "legacy-1"]
@@ -0,0 +1,55 @@
+import asyncio
+
+from classifiers import MicroBatcher
+
+
+def test_concurrent_submits_are_batched_up_to_max_batch():
+    calls = []
+
+    def run_batch(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    async def submit_all():
+        batcher = MicroBatcher(run_batch, max_batch=4, max_wait=0.05)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+        await batcher.close()
+        return results, batcher.stats()
+
+    results, stats = asyncio.run(submit_all())
+    assert results == [i * 2 for i in range(10)]
+    assert [len(batch) for batch in calls] == [4, 4, 2]
+    assert (stats["batches"], stats["items"]) == (3, 10)
+
+
+def test_lone_submit_waits_at_most_max_wait():
+    async def submit_one():
+        batcher = MicroBatcher(lambda items: items, max_batch=32, max_wait=0.01)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await batcher.submit("a")
+        elapsed = loop.time() - started
+        await batcher.close()
+        return result, elapsed
+
+    result, elapsed = asyncio.run(submit_one())
+    assert result == "a"
+    assert elapsed < 0.5
+
+
+def test_batch_failure_is_raised_to_every_caller_and_batcher_keeps_running():
+    def run_batch(items):
+        if "bad" in items:
+            raise ValueError("model error")
+        return items
+
+    async def submit_all():
+        batcher = MicroBatcher(run_batch, max_batch=2, max_wait=0.05)
+        failed = await asyncio.gather(batcher.submit("bad"), batcher.submit("ok"), return_exceptions=True)
+        after = await batcher.submit("next")
+        await batcher.close()
+        return failed, after
+
+    failed, after = asyncio.run(submit_all())
+    assert all(isinstance(result, ValueError) for result in failed)
+    assert after == "next"
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+import main
+from connections import REJECT, TAKEOVER, ConnectionRegistry
+
+
+def chat_turn(ws, message="안녕"):
+    ws.send_json({"user_message": message})
+    return ws.receive_json()
+
+
+def test_second_connection_takes_over_the_session(client, rooms, monkeypatch):
+    monkeypatch.setattr(main.chat, "duplicate_policy", TAKEOVER)
+    with client.websocket_connect(f"/ws/generate/?room_id={rooms[0]}") as first:
+        assert "text" in chat_turn(first)
+        session_id = main.chat.active_connections.session_for_room(rooms[0])
+
+        with client.websocket_connect(f"/ws/generate/?room_id={rooms[0]}") as second:
+            assert first.receive()["code"] == 4000  # 이전 소켓은 닫힘
+            assert main.chat.active_connections.session_for_room(rooms[0]) == session_id
+            assert len(main.chat.active_connections) == 1
+            assert "text" in chat_turn(second)
+            # 세션을 넘겨받아 이전 소켓에서 주고받은 대화도 이어짐
+            assert len(main.chat.transcripts[session_id].messages) == 4
+
+
+def test_second_connection_is_rejected(client, rooms, monkeypatch):
+    monkeypatch.setattr(main.chat, "duplicate_policy", REJECT)
+    with client.websocket_connect(f"/ws/generate/?room_id={rooms[1]}") as first:
+        with pytest.raises(WebSocketDisconnect) as rejected:
+            with client.websocket_connect(f"/ws/generate/?room_id={rooms[1]}"):
+                pass
+        assert rejected.value.code == 4409
+        assert "text" in chat_turn(first)  # 기존 연결은 그대로
+
+
+def test_reconnect_keeps_lease_while_previous_release_runs(client, rooms, monkeypatch):
+    state = main.chat.state
+    release = state.release
+
+    async def slow_release(room_id, owner):
+        await asyncio.sleep(0.2)
+        await release(room_id, owner)
+
+    monkeypatch.setattr(state, "release", slow_release)
+    with client.websocket_connect(f"/ws/generate/?room_id={rooms[2]}") as first:
+        assert "text" in chat_turn(first)
+    deadline = time.monotonic() + 2
+    while main.chat.active_connections.session_for_room(rooms[2]) is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # 이전 연결의 소유권 해제가 진행 중일 때 다시 연결 - 해제가 끝난 뒤 새 연결이 소유권을 얻어야 함
+    with client.websocket_connect(f"/ws/generate/?room_id={rooms[2]}") as ws:
+        assert "text" in chat_turn(ws)
+        time.sleep(0.3)
+        assert state._lease(rooms[2]) == main.chat.worker_id
+        assert rooms[2] in main.chat.owned_rooms
+
+
+def test_registry_pop_keeps_room_index_of_newer_session():
+    registry = ConnectionRegistry()
+    registry.register("old", object(), "room")
+    registry.register("new", object(), "room")
+    registry.pop("old")
+    assert registry.session_for_room("room") == "new"
+    registry.pop("new")
+    assert registry.session_for_room("room") is None
+    assert len(registry) == 0
@@ -0,0 +1,51 @@
+import time
+
+from chat_summary import ChatSummaryMemory
+from openai_api import ConversationManager
+
+
+def add_messages(manager: ConversationManager, room_id: str, count: int, size: int = 100):
+    memory = manager.get_conversation_memory(room_id)
+    for i in range(count):
+        memory.add_message("x" * size, "Happy", i)
+    manager.update(room_id)
+
+
+def test_least_recently_used_room_is_evicted_over_max_rooms():
+    manager = ConversationManager(max_rooms=2)
+    manager.get_conversation_memory("a")
+    manager.get_conversation_memory("b")
+    manager.get_conversation_memory("a")  # a를 최근 사용으로
+    manager.get_conversation_memory("c")
+    assert list(manager.conversations) == ["a", "c"]
+    assert manager.evictions == 1
+
+
+def test_byte_budget_is_enforced_and_accounted():
+    manager = ConversationManager(max_bytes=3000)
+    for room_id in ("a", "b", "c", "d"):
+        add_messages(manager, room_id, 5, size=100)
+    assert manager.total_bytes <= 3000
+    assert manager.total_bytes == sum(manager.room_bytes.values())
+    assert "d" in manager.conversations  # 방금 갱신한 방은 남김
+    assert "a" not in manager.conversations
+
+
+def test_idle_rooms_expire_after_ttl():
+    manager = ConversationManager(ttl_seconds=60)
+    manager.get_conversation_memory("old")
+    manager.last_access["old"] = time.monotonic() - 120
+    manager.get_conversation_memory("new")
+    assert manager.peek("old") is None
+    assert manager.room_bytes.keys() == {"new"}
+
+
+def test_restore_replaces_memory_and_peek_keeps_stats():
+    manager = ConversationManager()
+    add_messages(manager, "a", 2)
+    restored = ChatSummaryMemory.from_dict({"history": [{"message": "m"}]})
+    manager.restore("a", restored)
+    hits, misses = manager.hits, manager.misses
+    assert manager.peek("a") is restored
+    assert (manager.hits, manager.misses) == (hits, misses)
+    assert manager.room_bytes["a"] == restored.approx_bytes()
@@ -0,0 +1,13 @@
+import main
+
+
+def test_failed_reply_is_reported_with_error(client, rooms, monkeypatch):
+    async def failing_response(**kwargs):
+        return {"error": "LLM unavailable", "updated_likes": kwargs["favorability"], "emotion": "Neutral"}
+
+    monkeypatch.setattr(main, "get_openai_response", failing_response)
+    with client.websocket_connect(f"/ws/generate/?room_id={rooms[1]}") as ws:
+        ws.send_json({"user_message": "오늘 날씨 어때?"})
+        frame = ws.receive_json()
+    assert frame["error"] == "LLM unavailable"
+    assert frame["text"] == ""
@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+import main
+import openai_api
+from database import SessionLocal, Character, CharacterPrompt, GroupChat, GroupChatCharacter
+
+
+@pytest.fixture(scope="module")
+def group_chat_idx(rooms):
+    """캐릭터 두 명(1, 2)이 참여하는 그룹 채팅방"""
+    with SessionLocal() as db:
+        db.merge(Character(char_idx=2, field_idx=1, voice_idx="test", char_name="테스트2", char_description="-",
+                           nicknames={"0": "친구"}))
+        db.merge(CharacterPrompt(
+            char_prompt_id=2, char_idx=2, character_appearance="a", character_personality="p",
+            character_background="b", character_speech_style="s", example_dialogues=["안녕"],
+        ))
+        db.merge(GroupChat(group_chat_idx=1, user_idx=1, chat_title="그룹", chat_prompt="-"))
+        db.flush()
+        db.merge(GroupChatCharacter(group_chars_idx=1, group_chat_idx=1, char_idx=1))
+        db.merge(GroupChatCharacter(group_chars_idx=2, group_chat_idx=1, char_idx=2))
+        db.commit()
+    return 1
+
+
+def test_every_character_replies_within_the_concurrency_limit(client, group_chat_idx, monkeypatch):
+    monkeypatch.setattr(main.chat, "group_max_concurrency", 1)
+    running = {"now": 0, "max": 0}
+    run_llm = openai_api._run_llm
+
+    async def counting_run_llm(chain, inputs, *args, **kwargs):
+        if "character_prefix" not in inputs:
+            return await run_llm(chain, inputs, *args, **kwargs)
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(0.05)
+        running["now"] -= 1
+        return SimpleNamespace(content=f"{inputs['character_prefix'][:5]} 응답")
+
+    monkeypatch.setattr(openai_api, "_run_llm", counting_run_llm)
+    with client.websocket_connect(f"/ws/group/?group_chat_idx={group_chat_idx}") as ws:
+        ws.send_json({"user_message": "다들 뭐 해?"})
+        frames = [ws.receive_json() for _ in range(3)]
+
+    assert sorted(frame["character_name"] for frame in frames[:2]) == ["테스트", "테스트2"]
+    assert all(frame["type"] == "reply" and frame["text"] for frame in frames[:2])
+    assert frames[2] == {"type": "done"}
+    assert running["max"] == 1
+
+
+def test_unknown_group_is_closed(client):
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/ws/group/?group_chat_idx=999") as ws:
+            ws.receive_json()
+    assert closed.value.code == 4404
@@ -0,0 +1,52 @@
+import asyncio
+import sqlite3
+import time
+
+from llm_cache import ResultCache, normalize_greeting
+
+
+def test_entries_survive_restart_and_are_served_from_memory(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache("results", path=path)
+    cache.set("a", {"emotion": "Joy"})  # 이벤트 루프 밖에서는 바로 기록
+
+    reopened = ResultCache("results", path=path)
+    assert reopened.entries["a"][1] == {"emotion": "Joy"}
+    reopened.writer.close()  # 조회가 파일을 읽지 않음
+    assert reopened.get("a") == {"emotion": "Joy"}
+    assert reopened.get("missing") is None
+    assert (reopened.hits, reopened.misses) == (1, 1)
+
+
+def test_writes_inside_the_loop_are_batched_until_flush(tmp_path):
+    path = str(tmp_path / "cache.db")
+
+    async def write():
+        cache = ResultCache("results", path=path, flush_interval=0.05)
+        for i in range(5):
+            cache.set(f"k{i}", i)
+        assert cache.stats()["pending_writes"] == 5
+        await cache.close()
+
+    asyncio.run(write())
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT COUNT(*) FROM results").fetchone()[0] == 5
+
+
+def test_expired_and_excess_entries_are_trimmed_on_open(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache("results", path=path)
+    with sqlite3.connect(path) as db:
+        db.execute("INSERT INTO results VALUES ('old', '1', ?)", (time.time() - 100,))
+    for i in range(4):
+        cache.set(f"k{i}", i)
+
+    reopened = ResultCache("results", path=path, max_entries=2, ttl_seconds=50)
+    assert list(reopened.entries) == ["k2", "k3"]
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT COUNT(*) FROM results").fetchone()[0] == 2
+
+
+def test_greeting_normalization_ignores_punctuation_and_repeats():
+    assert normalize_greeting("안녕하세요!!") == normalize_greeting("안녕 하세요~")
+    assert normalize_greeting("ㅎㅇㅎㅇ") != normalize_greeting("안녕")
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from llm_limiter import BACKGROUND, CLASSIFIER, REPLY, LLMLimiter, LLMQueueTimeout, TokenBucket
+
+
+async def hold(limiter: LLMLimiter, release: asyncio.Event, priority: int = REPLY):
+    async with limiter.acquire(priority):
+        await release.wait()
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    async def scenario():
+        limiter = LLMLimiter(max_in_flight=1)
+        release = asyncio.Event()
+        blocker = asyncio.create_task(hold(limiter, release))
+        await asyncio.sleep(0)
+
+        order = []
+
+        async def call(name, priority):
+            async with limiter.acquire(priority):
+                order.append(name)
+
+        tasks = [
+            asyncio.create_task(call("background", BACKGROUND)),
+            asyncio.create_task(call("classifier", CLASSIFIER)),
+            asyncio.create_task(call("reply-1", REPLY)),
+            asyncio.create_task(call("reply-2", REPLY)),
+        ]
+        await asyncio.sleep(0)
+        assert limiter.queue_depth() == {"reply": 2, "classifier": 1, "background": 1}
+
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+        return order, limiter
+
+    order, limiter = asyncio.run(scenario())
+    assert order == ["reply-1", "reply-2", "classifier", "background"]
+    assert limiter.in_flight == 0
+
+
+def test_queue_deadline_raises_and_frees_the_queue():
+    async def scenario():
+        limiter = LLMLimiter(max_in_flight=1)
+        release = asyncio.Event()
+        blocker = asyncio.create_task(hold(limiter, release))
+        await asyncio.sleep(0)
+
+        with pytest.raises(LLMQueueTimeout):
+            async with limiter.acquire(CLASSIFIER, timeout=0.05):
+                pass
+        assert limiter.queue_depth()["classifier"] == 0
+
+        release.set()
+        await blocker
+        async with limiter.acquire(CLASSIFIER, timeout=0.05):
+            pass
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.stats()["queue_timeouts"]["classifier"] == 1
+    assert limiter.in_flight == 0
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        limiter = LLMLimiter(max_in_flight=1)
+        release = asyncio.Event()
+        blocker = asyncio.create_task(hold(limiter, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold(limiter, asyncio.Event()))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        release.set()
+        await blocker
+        await asyncio.gather(waiter, return_exceptions=True)
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.in_flight == 0
+    assert limiter.queue_depth() == {"reply": 0, "classifier": 0, "background": 0}
+
+
+def test_request_bucket_delays_calls_over_rpm():
+    async def scenario():
+        limiter = LLMLimiter(max_in_flight=10, rpm=600)  # 초당 10개씩 다시 채워짐
+        limiter.requests.tokens = 1
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(2):
+            async with limiter.acquire(REPLY):
+                pass
+        return loop.time() - started
+
+    elapsed = asyncio.run(scenario())
+    assert 0.05 <= elapsed < 1.0
+
+
+def test_token_bucket_wait_time_and_unlimited():
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0, abs=0.05)
+    # 용량보다 큰 요청은 가득 찰 때까지만 기다림
+    assert bucket.wait_time(1000) == pytest.approx(60.0, abs=0.1)
+
+    unlimited = TokenBucket(0)
+    unlimited.take(10 ** 6)
+    assert unlimited.wait_time(10 ** 6) == 0.0
+
+
+def test_settle_returns_unused_tokens_to_tpm_bucket():
+    async def scenario():
+        limiter = LLMLimiter(tpm=600)
+        async with limiter.acquire(REPLY, tokens=500) as grant:
+            assert limiter.tokens.tokens == pytest.approx(100, abs=1)
+            grant.settle(100)
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.tokens.tokens == pytest.approx(500, abs=1)
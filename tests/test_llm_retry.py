@@ -0,0 +1,41 @@
+from llm_retry import HedgePolicy
+
+
+def test_no_hedge_when_disabled_or_without_enough_samples():
+    assert HedgePolicy(enabled=False).delay("reply") is None
+
+    policy = HedgePolicy(enabled=True, min_samples=5)
+    for _ in range(4):
+        policy.record("reply", 0.1)
+    assert policy.delay("reply") is None
+    policy.record("reply", 0.1)
+    assert policy.delay("reply") == 0.1
+
+
+def test_hedge_delay_is_the_kind_percentile():
+    policy = HedgePolicy(enabled=True, percentile=0.95, min_samples=1)
+    for ms in range(1, 101):
+        policy.record("reply", ms / 1000)
+    policy.record("emotion", 0.01)
+    assert policy.delay("reply") == 0.096
+    assert policy.delay("emotion") == 0.01
+
+
+def test_budget_limits_hedges():
+    policy = HedgePolicy(enabled=True, budget=0.5, min_samples=1)
+    policy.delay("reply")  # credit 1.5
+    assert policy.try_spend()  # 0.5
+    assert not policy.try_spend()
+    policy.delay("reply")  # 1.0
+    assert policy.try_spend()
+    assert (policy.hedges, policy.skipped) == (2, 1)
+
+
+def test_idle_credit_is_capped():
+    policy = HedgePolicy(enabled=True, budget=1.0)
+    for _ in range(100):
+        policy.delay("reply")
+    spent = 0
+    while policy.try_spend():
+        spent += 1
+    assert spent == 10
@@ -0,0 +1,36 @@
+import pytest
+
+from log_codec import MARKERS, decode_log, encode_log, log_codec
+
+LOG = (
+    "Session opened at: 2024-05-01 10:00:00\n"
+    "[2024-05-01 10:00:01] user: 안녕!\n"
+    "[2024-05-01 10:00:02] chatbot: 반가워.\n두 번째 줄\n"
+    "Session closed at: 2024-05-01 10:05:00\n"
+)
+
+
+@pytest.mark.parametrize("codec", ["none", "zlib", "zstd"])
+def test_round_trip(codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    encoded = encode_log(LOG, codec)
+    assert log_codec(encoded) == codec
+    assert decode_log(encoded) == LOG
+
+
+def test_compressed_value_is_marked_text():
+    encoded = encode_log(LOG, "zlib", 9)
+    assert encoded.startswith(MARKERS["zlib"])
+    assert encoded.isascii()
+
+
+def test_plain_and_empty_logs_decode_unchanged():
+    assert decode_log(LOG) == LOG
+    assert decode_log("") == ""
+    assert log_codec(LOG) == "none"
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        encode_log(LOG, "lz4")
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from database import SessionLocal, ChatLog, ChatMessage
+from log_persistence import LogPersistenceQueue, PendingLog, parse_journal
+from transcript import SessionTranscript, TranscriptJournal
+
+
+def test_journal_recovery_keeps_multi_line_messages(tmp_path):
+    transcript = SessionTranscript("session-1", "room-1", start_time=datetime(2024, 5, 1, 10, 0, 0))
+    transcript.append("user", "안녕", timestamp=datetime(2024, 5, 1, 10, 0, 1))
+    transcript.append("chatbot", "반가워\n오늘은 뭐 했어?", timestamp=datetime(2024, 5, 1, 10, 0, 2))
+
+    journal = TranscriptJournal(str(tmp_path))
+    journal.write(transcript.session_id, transcript.header())
+    journal.write(transcript.session_id, "Room id: room-1\n")
+    for line in transcript.lines:
+        journal.write(transcript.session_id, line)
+    journal.flush_sync()
+
+    record = parse_journal(journal.path(transcript.session_id))
+    assert record.room_id == "room-1"
+    assert record.start_time == transcript.start_time
+    assert [m["message"] for m in record.messages] == ["안녕", "반가워\n오늘은 뭐 했어?"]
+
+
+def pending_log(session_id: str, room_id: str = "test-room-2", sender: str = "user") -> PendingLog:
+    start = datetime(2024, 5, 1, 10, 0, 0)
+    log = f"Session opened at: 2024-05-01 10:00:00\n[2024-05-01 10:00:01] user: {session_id}\nSession closed at: 2024-05-01 10:01:00\n"
+    messages = [{"sender": sender, "message": session_id, "created_at": start, "emotion": None, "favorability": None}]
+    return PendingLog(session_id, room_id, log, start, start, messages=messages)
+
+
+def stored_sessions(prefix: str) -> dict:
+    with SessionLocal() as db:
+        logs = db.execute(select(ChatLog.session_id).where(ChatLog.session_id.startswith(prefix))).scalars().all()
+        messages = db.execute(select(func.count()).where(ChatMessage.session_id.startswith(prefix))).scalar()
+    return {"logs": sorted(logs), "messages": messages}
+
+
+def test_queue_persists_batches_and_reports_each_record(rooms):
+    persisted = []
+
+    async def scenario():
+        queue = LogPersistenceQueue(batch_size=10, flush_interval=0.05, on_persisted=persisted.append)
+        for i in range(3):
+            queue.enqueue(pending_log(f"batch-{i}"))
+        assert queue.depth == 3
+        await queue.close()
+
+    asyncio.run(scenario())
+    assert sorted(record.session_id for record in persisted) == ["batch-0", "batch-1", "batch-2"]
+    assert stored_sessions("batch-") == {"logs": ["batch-0", "batch-1", "batch-2"], "messages": 3}
+
+
+def test_bad_record_does_not_block_the_batch_and_is_given_up(rooms):
+    persisted, failed = [], []
+
+    async def scenario():
+        queue = LogPersistenceQueue(
+            flush_interval=0.05, max_retries=1, retry_backoff=0.01,
+            on_persisted=persisted.append, on_failed=failed.append,
+        )
+        queue.enqueue(pending_log("mixed-ok"))
+        queue.enqueue(pending_log("mixed-bad", sender=None))  # chat_messages.sender NOT NULL 위반
+        while len(persisted) + len(failed) < 2:
+            await asyncio.sleep(0.02)
+        await queue.close()
+
+    asyncio.run(scenario())
+    assert [record.session_id for record in persisted] == ["mixed-ok"]
+    assert [(record.session_id, record.attempts) for record in failed] == [("mixed-bad", 2)]
+    assert stored_sessions("mixed-") == {"logs": ["mixed-ok"], "messages": 1}
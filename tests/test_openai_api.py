@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import openai_api
+from llm_limiter import LLMQueueTimeout
+
+TURN_KWARGS = dict(
+    user_message="안녕", character_name="봇", nickname="닉", user_unique_name="사용자", user_introduction="",
+    favorability=50, appearance="a", personality="p", background="b", speech_style="s", example_dialogues=[],
+    chat_history="",
+)
+
+
+@pytest.fixture
+def single_turn(monkeypatch):
+    monkeypatch.setattr(openai_api, "TURN_MODE", "single")
+    calls = []
+
+    def fake_run_llm(result):
+        async def run_llm(chain, inputs, priority, output_tokens=0, kind="llm", **kwargs):
+            calls.append(kind)
+            if isinstance(result, Exception):
+                raise result
+            return SimpleNamespace(content=result)
+        monkeypatch.setattr(openai_api, "_run_llm", run_llm)
+        return calls
+
+    return fake_run_llm
+
+
+def test_single_turn_does_not_fall_back_on_llm_failure(single_turn):
+    calls = single_turn(LLMQueueTimeout("queue deadline"))
+    response = asyncio.run(openai_api.get_openai_response(room_id="room-fail", **TURN_KWARGS))
+    assert "queue deadline" in response["error"]
+    assert calls == ["turn"]  # 분리 호출(감정/호감도/응답)을 추가로 보내지 않음
+
+
+def test_single_turn_falls_back_on_unparseable_output(single_turn):
+    calls = single_turn("not json")
+    asyncio.run(openai_api.get_openai_response(room_id="room-parse", **TURN_KWARGS))
+    assert calls[0] == "turn"
+    assert len(calls) > 1
+
+
+class FakeStreamChain:
+    """청크를 내보낸 뒤 hang_after가 지나면 멈추는 스트림, 닫혔는지 기록"""
+
+    def __init__(self, chunks, hang_after=None):
+        self.chunks = chunks
+        self.hang_after = hang_after
+        self.closed = False
+
+    async def astream(self, inputs):
+        try:
+            for i, chunk in enumerate(self.chunks):
+                if i == self.hang_after:
+                    await asyncio.sleep(3600)
+                yield chunk
+        finally:
+            self.closed = True
+
+
+def test_stream_releases_slot_without_waiting_for_consumer():
+    chain = FakeStreamChain(["a", "b", "c"])
+
+    async def consume():
+        received = []
+        async for chunk in openai_api._stream_llm(chain, {}):
+            received.append(chunk)
+            await asyncio.sleep(0.05)  # 느린 소비자 (웹소켓 전송)
+            if len(received) == 1:
+                in_flight = openai_api.llm_limiter.in_flight
+        return received, in_flight
+
+    received, in_flight = asyncio.run(consume())
+    assert received == ["a", "b", "c"]
+    assert in_flight == 0
+    assert chain.closed
+
+
+def test_stream_closes_iterator_on_timeout(monkeypatch):
+    monkeypatch.setitem(openai_api.LLM_CALL_TIMEOUTS, openai_api.REPLY, 0.05)
+    chain = FakeStreamChain(["a", "b"], hang_after=1)
+
+    async def consume():
+        received = []
+        with pytest.raises(asyncio.TimeoutError):
+            async for chunk in openai_api._stream_llm(chain, {}):
+                received.append(chunk)
+        return received
+
+    assert asyncio.run(consume()) == ["a"]
+    assert chain.closed
+    assert openai_api.llm_limiter.in_flight == 0
+
+
+def test_stream_closes_iterator_when_consumer_stops_early():
+    chain = FakeStreamChain(["a", "b"], hang_after=1)
+
+    async def consume():
+        stream = openai_api._stream_llm(chain, {})
+        assert await stream.__anext__() == "a"
+        await stream.aclose()
+        await asyncio.sleep(0)  # 취소된 읽기 태스크가 정리될 시간
+
+    asyncio.run(consume())
+    assert chain.closed
+    assert openai_api.llm_limiter.in_flight == 0
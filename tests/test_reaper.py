@@ -0,0 +1,57 @@
+import asyncio
+
+from reaper import InactivityReaper
+
+
+def run_reaper(scenario, timeout=0.05):
+    async def main():
+        expired = []
+
+        async def on_expire(session_id):
+            if session_id == "slow":
+                await asyncio.sleep(0.5)
+            if session_id == "broken":
+                raise RuntimeError("boom")
+            expired.append(session_id)
+
+        reaper = InactivityReaper(timeout, on_expire)
+        reaper.start()
+        await scenario(reaper)
+        await reaper.close()
+        return expired
+
+    return asyncio.run(main())
+
+
+def test_idle_sessions_expire_and_touch_postpones():
+    async def scenario(reaper):
+        reaper.touch("idle")
+        reaper.touch("active")
+        for _ in range(4):
+            await asyncio.sleep(0.03)
+            reaper.touch("active")
+        assert "idle" not in reaper.last_activity
+        assert "active" in reaper.last_activity
+
+    assert run_reaper(scenario) == ["idle"]
+
+
+def test_removed_sessions_do_not_expire():
+    async def scenario(reaper):
+        reaper.touch("gone")
+        reaper.remove("gone")
+        await asyncio.sleep(0.1)
+
+    assert run_reaper(scenario) == []
+
+
+def test_slow_or_failing_expiry_does_not_block_others():
+    async def scenario(reaper):
+        reaper.touch("slow")
+        reaper.touch("broken")
+        reaper.touch("fast")
+        await asyncio.sleep(0.15)
+        assert reaper.expiring  # slow는 아직 실행 중
+
+    # close()는 이미 시작한 만료 처리를 기다림
+    assert run_reaper(scenario) == ["fast", "slow"]
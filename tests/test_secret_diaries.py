@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+import generate_secret_diaries as job
+from database import SessionLocal, ChatLog, JobCheckpoint, SecretDiary
+from llm_limiter import LLMLimiter
+
+
+def add_log(session_id: str, room_id: str, end_time: datetime):
+    log = f"Session opened at: {end_time:%Y-%m-%d %H:%M:%S}\n[{end_time:%Y-%m-%d %H:%M:%S}] user: {session_id}\n"
+    with SessionLocal() as db:
+        db.add(ChatLog(session_id=session_id, chat_id=room_id, log=log, start_time=end_time, end_time=end_time))
+        db.commit()
+
+
+def diaries_for(prefix: str) -> dict:
+    with SessionLocal() as db:
+        rows = db.execute(select(SecretDiary.session, SecretDiary.content).where(SecretDiary.session.startswith(prefix))).all()
+    return dict(rows)
+
+
+@pytest.fixture
+def diary_writer(monkeypatch):
+    failing = set()
+
+    async def write_secret_diary(chat_text, character_name, user_name, limiter=None):
+        if any(session_id in chat_text for session_id in failing):
+            raise RuntimeError("diary failed")
+        return f"diary: {chat_text}"
+
+    monkeypatch.setattr(job, "write_secret_diary", write_secret_diary)
+    return failing
+
+
+def run_job(job_name: str, **kwargs) -> dict:
+    job.ensure_indexes()
+    return asyncio.run(job.run(LLMLimiter(max_in_flight=4), job_name, batch_size=2, lookback_seconds=0, **kwargs))
+
+
+def test_late_persisted_log_is_picked_up_after_checkpoint(rooms, diary_writer):
+    now = datetime.now()
+    add_log("late-a", rooms[0], now)
+    run_job("test_late")
+    assert set(diaries_for("late-")) == {"late-a"}
+
+    # 재시도/저널 복구로 end_time보다 한참 뒤에 저장된 로그 - 진행 위치보다 end_time이 앞서도 처리되어야 함
+    add_log("late-b", rooms[0], now - timedelta(hours=1))
+    run_job("test_late")
+    assert set(diaries_for("late-")) == {"late-a", "late-b"}
+
+    with SessionLocal() as db:
+        checkpoint = db.get(JobCheckpoint, "test_late")
+        late_b = db.get(ChatLog, "late-b")
+        assert (checkpoint.last_persisted_at, checkpoint.last_session_id) == (late_b.persisted_at, "late-b")
+
+
+def test_failing_session_holds_checkpoint_until_max_attempts(rooms, diary_writer):
+    now = datetime.now()
+    for session_id in ("fail-a", "fail-b", "fail-c"):
+        add_log(session_id, rooms[0], now)
+    diary_writer.add("fail-b")
+
+    stats = run_job("test_fail", max_attempts=2)
+    assert (stats["failed"], stats["skipped"]) == (1, 0)
+    assert set(diaries_for("fail-")) == {"fail-a"}  # 실패한 세션 뒤로는 진행하지 않음
+
+    stats = run_job("test_fail", max_attempts=2)
+    assert (stats["failed"], stats["skipped"]) == (1, 1)
+    assert set(diaries_for("fail-")) == {"fail-a", "fail-c"}
+
+    # 다시 실행해도 일기가 중복되거나 건너뛴 세션을 다시 시도하지 않음
+    stats = run_job("test_fail", max_attempts=2)
+    assert stats["failed"] == 0
+    assert set(diaries_for("fail-")) == {"fail-a", "fail-c"}
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from state_backend import MemoryStateBackend, RedisStateBackend
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request):
+    if request.param == "redis":
+        pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")  # fakeredis에서 Lua 스크립트 실행에 필요
+        return RedisStateBackend("fakeredis://", prefix="test")
+    return MemoryStateBackend()
+
+
+def test_lease_fences_state_writes(backend):
+    async def scenario():
+        assert await backend.acquire("room", "worker-a", ttl=30) is None
+        assert await backend.acquire("room", "worker-b", ttl=30) == "worker-a"
+        assert await backend.save_room("room", "worker-a", {"favorability": 60}, ttl=30)
+        assert not await backend.save_room("room", "worker-b", {"favorability": 10}, ttl=30)
+
+        # 강제로 넘겨받으면 이전 소유자는 갱신/저장 모두 실패
+        assert await backend.acquire("room", "worker-b", ttl=30, force=True) is None
+        assert not await backend.renew("room", "worker-a", ttl=30)
+        assert not await backend.save_room("room", "worker-a", {"favorability": 99}, ttl=30)
+        assert await backend.save_room("room", "worker-b", {"favorability": 70}, ttl=30)
+        assert await backend.load_room("room") == {"favorability": 70}
+
+        # 소유자가 아니면 해제되지 않음
+        await backend.release("room", "worker-a")
+        assert await backend.owner("room") == "worker-b"
+        await backend.release("room", "worker-b")
+        assert await backend.owner("room") is None
+        await backend.close()
+
+    asyncio.run(scenario())
+
+
+def test_expired_lease_can_be_taken():
+    async def scenario():
+        backend = MemoryStateBackend()
+        assert await backend.acquire("room", "worker-a", ttl=0.01) is None
+        await asyncio.sleep(0.02)
+        assert await backend.acquire("room", "worker-b", ttl=30) is None
+        assert not await backend.renew("room", "worker-a", ttl=30)
+
+    asyncio.run(scenario())
+
+
+def test_acquire_is_reentrant_for_the_same_owner(backend):
+    async def scenario():
+        assert await backend.acquire("room", "worker-a", ttl=30) is None
+        assert await backend.acquire("room", "worker-a", ttl=30) is None
+        assert await backend.acquire("room", "worker-b", ttl=30) == "worker-a"
+        assert await backend.owner("room") == "worker-a"
+        await backend.close()
+
+    asyncio.run(scenario())
+
+
+def test_memory_room_states_are_capped_and_purged():
+    async def scenario():
+        backend = MemoryStateBackend(max_rooms=2)
+        for room_id in ("a", "b", "c"):
+            await backend.acquire(room_id, "worker", ttl=30)
+            await backend.save_room(room_id, "worker", {"room": room_id}, ttl=30)
+        assert list(backend.rooms) == ["b", "c"]  # 가장 오래 전에 저장된 방부터 제거
+
+        await backend.save_room("b", "worker", {"room": "b"}, ttl=0.01)
+        await asyncio.sleep(0.02)
+        await backend.save_room("c", "worker", {"room": "c"}, ttl=30)
+        assert list(backend.rooms) == ["c"]  # 만료된 항목은 다음 저장 때 정리
+
+    asyncio.run(scenario())
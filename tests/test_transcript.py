@@ -0,0 +1,40 @@
+import asyncio
+import os
+from datetime import datetime
+
+from transcript import SessionTranscript, TranscriptJournal, parse_log_messages
+
+
+def make_transcript() -> SessionTranscript:
+    transcript = SessionTranscript("session-1", "room-1", start_time=datetime(2024, 5, 1, 10, 0, 0))
+    transcript.append("user", "안녕", timestamp=datetime(2024, 5, 1, 10, 0, 1))
+    transcript.append("chatbot", "반가워\n오늘은 뭐 했어?", timestamp=datetime(2024, 5, 1, 10, 0, 2), emotion="Happy")
+    return transcript
+
+
+def test_rendered_log_parses_back_to_messages():
+    transcript = make_transcript()
+    messages = parse_log_messages(transcript.render_log(datetime(2024, 5, 1, 10, 5, 0)))
+    assert [(m["sender"], m["message"], m["created_at"]) for m in messages] == [
+        (m["sender"], m["message"], m["created_at"]) for m in transcript.messages
+    ]
+
+
+def test_journal_write_flush_and_discard(tmp_path):
+    async def scenario():
+        journal = TranscriptJournal(str(tmp_path), flush_interval=60)
+        journal.write("s1", "[2024-05-01 10:00:01] user: 안녕\n")
+        journal.write("s1", "[2024-05-01 10:00:02] chatbot: 반가워\n")
+        assert not os.path.exists(journal.path("s1"))  # flush 전에는 파일에 쓰지 않음
+        await journal.flush()
+        with open(journal.path("s1"), encoding="utf-8") as log_file:
+            assert len(parse_log_messages(log_file.read())) == 2
+
+        # 삭제 뒤에 도착한 라인이 파일을 되살리지 않음
+        journal.discard("s1")
+        journal.pending["s1"] = ["[2024-05-01 10:00:03] user: 늦은 라인\n"]
+        await journal.flush()
+        return journal
+
+    journal = asyncio.run(scenario())
+    assert not os.path.exists(journal.path("s1"))